@@ -0,0 +1,32 @@
+"""add downloadtask.dispatch_id column
+
+Revision ID: f73f93ca25c4
+Revises: ce76dc5dff3e
+Create Date: 2026-10-18 09:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+import sqlmodel
+
+
+# revision identifiers, used by Alembic.
+revision: str = "f73f93ca25c4"
+down_revision: Union[str, None] = "ce76dc5dff3e"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.add_column(
+        "downloadtask",
+        sa.Column(
+            "dispatch_id", sqlmodel.sql.sqltypes.AutoString(), nullable=True
+        ),
+    )
+
+
+def downgrade() -> None:
+    op.drop_column("downloadtask", "dispatch_id")
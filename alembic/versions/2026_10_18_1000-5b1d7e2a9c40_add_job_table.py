@@ -0,0 +1,68 @@
+"""add job table
+
+Revision ID: 5b1d7e2a9c40
+Revises: f73f93ca25c4
+Create Date: 2026-10-18 10:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+import sqlmodel
+
+
+# revision identifiers, used by Alembic.
+revision: str = "5b1d7e2a9c40"
+down_revision: Union[str, None] = "f73f93ca25c4"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        "job",
+        sa.Column("id", sqlmodel.sql.sqltypes.GUID(), nullable=False),
+        sa.Column("task_id", sqlmodel.sql.sqltypes.GUID(), nullable=False),
+        sa.Column("item_id", sqlmodel.sql.sqltypes.GUID(), nullable=False),
+        sa.Column(
+            "video_id", sqlmodel.sql.sqltypes.AutoString(), nullable=False
+        ),
+        sa.Column("state", sqlmodel.sql.sqltypes.AutoString(), nullable=False),
+        sa.Column("attempts", sa.Integer(), nullable=False),
+        sa.Column("max_attempts", sa.Integer(), nullable=False),
+        sa.Column("available_at", sa.DateTime(), nullable=False),
+        sa.Column(
+            "leased_by", sqlmodel.sql.sqltypes.AutoString(), nullable=True
+        ),
+        sa.Column("lease_expires_at", sa.DateTime(), nullable=True),
+        sa.Column(
+            "last_error", sqlmodel.sql.sqltypes.AutoString(), nullable=True
+        ),
+        sa.Column("created_at", sa.DateTime(), nullable=False),
+        sa.Column("updated_at", sa.DateTime(), nullable=False),
+        sa.ForeignKeyConstraint(
+            ["task_id"],
+            ["downloadtask.id"],
+        ),
+        sa.ForeignKeyConstraint(
+            ["item_id"],
+            ["item.id"],
+        ),
+        sa.PrimaryKeyConstraint("id"),
+    )
+    op.create_index(op.f("ix_job_id"), "job", ["id"], unique=False)
+    op.create_index(op.f("ix_job_task_id"), "job", ["task_id"], unique=False)
+    op.create_index(
+        "ix_job_state_available_at",
+        "job",
+        ["state", "available_at"],
+        unique=False,
+    )
+
+
+def downgrade() -> None:
+    op.drop_index("ix_job_state_available_at", table_name="job")
+    op.drop_index(op.f("ix_job_task_id"), table_name="job")
+    op.drop_index(op.f("ix_job_id"), table_name="job")
+    op.drop_table("job")
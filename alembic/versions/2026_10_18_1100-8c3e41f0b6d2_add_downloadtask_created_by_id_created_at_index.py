@@ -0,0 +1,32 @@
+"""add downloadtask (created_by_id, created_at) index
+
+Revision ID: 8c3e41f0b6d2
+Revises: 5b1d7e2a9c40
+Create Date: 2026-10-18 11:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision: str = "8c3e41f0b6d2"
+down_revision: Union[str, None] = "5b1d7e2a9c40"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_index(
+        "ix_downloadtask_created_by_id_created_at",
+        "downloadtask",
+        ["created_by_id", "created_at"],
+        unique=False,
+    )
+
+
+def downgrade() -> None:
+    op.drop_index(
+        "ix_downloadtask_created_by_id_created_at", table_name="downloadtask"
+    )
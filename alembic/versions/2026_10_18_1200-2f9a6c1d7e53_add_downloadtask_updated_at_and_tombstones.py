@@ -0,0 +1,68 @@
+"""add downloadtask.updated_at and tasktombstone table
+
+Revision ID: 2f9a6c1d7e53
+Revises: 8c3e41f0b6d2
+Create Date: 2026-10-18 12:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+import sqlmodel
+
+
+# revision identifiers, used by Alembic.
+revision: str = "2f9a6c1d7e53"
+down_revision: Union[str, None] = "8c3e41f0b6d2"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.add_column(
+        "downloadtask", sa.Column("updated_at", sa.DateTime(), nullable=True)
+    )
+    # existing tasks count as last changed when they were created
+    op.execute("UPDATE downloadtask SET updated_at = created_at")
+    with op.batch_alter_table("downloadtask") as batch_op:
+        batch_op.alter_column(
+            "updated_at", existing_type=sa.DateTime(), nullable=False
+        )
+    op.create_index(
+        "ix_downloadtask_created_by_id_updated_at",
+        "downloadtask",
+        ["created_by_id", "updated_at"],
+        unique=False,
+    )
+    op.create_table(
+        "tasktombstone",
+        sa.Column("id", sqlmodel.sql.sqltypes.GUID(), nullable=False),
+        sa.Column(
+            "created_by_id", sqlmodel.sql.sqltypes.GUID(), nullable=False
+        ),
+        sa.Column("deleted_at", sa.DateTime(), nullable=False),
+        sa.ForeignKeyConstraint(
+            ["created_by_id"],
+            ["user.id"],
+        ),
+        sa.PrimaryKeyConstraint("id"),
+    )
+    op.create_index(
+        "ix_tasktombstone_created_by_id_deleted_at",
+        "tasktombstone",
+        ["created_by_id", "deleted_at"],
+        unique=False,
+    )
+
+
+def downgrade() -> None:
+    op.drop_index(
+        "ix_tasktombstone_created_by_id_deleted_at", table_name="tasktombstone"
+    )
+    op.drop_table("tasktombstone")
+    op.drop_index(
+        "ix_downloadtask_created_by_id_updated_at", table_name="downloadtask"
+    )
+    with op.batch_alter_table("downloadtask") as batch_op:
+        batch_op.drop_column("updated_at")
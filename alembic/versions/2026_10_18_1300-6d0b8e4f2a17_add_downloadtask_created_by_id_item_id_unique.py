@@ -0,0 +1,49 @@
+"""add unique constraint on downloadtask created_by_id, item_id
+
+Revision ID: 6d0b8e4f2a17
+Revises: 2f9a6c1d7e53
+Create Date: 2026-10-18 13:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision: str = "6d0b8e4f2a17"
+down_revision: Union[str, None] = "2f9a6c1d7e53"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+# tasks that repeat an older task of the same user for the same item
+DUPLICATES = """
+    SELECT d.id FROM downloadtask d
+    WHERE d.item_id IS NOT NULL AND EXISTS (
+        SELECT 1 FROM downloadtask o
+        WHERE o.created_by_id = d.created_by_id
+        AND o.item_id = d.item_id
+        AND (
+            o.created_at < d.created_at
+            OR (o.created_at = d.created_at AND o.id < d.id)
+        )
+    )
+"""
+
+
+def upgrade() -> None:
+    # racing requests could create duplicates, keep the oldest task
+    op.execute(f"DELETE FROM job WHERE task_id IN ({DUPLICATES})")
+    op.execute(f"DELETE FROM downloadtask WHERE id IN ({DUPLICATES})")
+    with op.batch_alter_table("downloadtask") as batch_op:
+        batch_op.create_unique_constraint(
+            "uq_downloadtask_created_by_id_item_id",
+            ["created_by_id", "item_id"],
+        )
+
+
+def downgrade() -> None:
+    with op.batch_alter_table("downloadtask") as batch_op:
+        batch_op.drop_constraint(
+            "uq_downloadtask_created_by_id_item_id", type_="unique"
+        )
@@ -0,0 +1,56 @@
+"""add userusage table
+
+Revision ID: a41c9e07d3b5
+Revises: 6d0b8e4f2a17
+Create Date: 2026-10-18 14:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+import sqlmodel
+
+
+# revision identifiers, used by Alembic.
+revision: str = "a41c9e07d3b5"
+down_revision: Union[str, None] = "6d0b8e4f2a17"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+# counters of every existing user, see executor.usage.recount
+BACKFILL = """
+INSERT INTO userusage (user_id, task_count, active_count, bytes_stored)
+SELECT u.id,
+       COUNT(t.id),
+       COALESCE(SUM(CASE WHEN t.state IN ('0', '1') THEN 1 ELSE 0 END), 0),
+       COALESCE(
+           SUM(CASE WHEN t.state = '2' THEN COALESCE(i.total_bytes, 0)
+               ELSE 0 END),
+           0
+       )
+FROM "user" u
+LEFT JOIN downloadtask t ON t.created_by_id = u.id
+LEFT JOIN item i ON i.id = t.item_id
+GROUP BY u.id
+"""
+
+
+def upgrade() -> None:
+    op.create_table(
+        "userusage",
+        sa.Column("user_id", sqlmodel.sql.sqltypes.GUID(), nullable=False),
+        sa.Column("task_count", sa.Integer(), nullable=False),
+        sa.Column("active_count", sa.Integer(), nullable=False),
+        sa.Column("bytes_stored", sa.BigInteger(), nullable=False),
+        sa.ForeignKeyConstraint(
+            ["user_id"],
+            ["user.id"],
+        ),
+        sa.PrimaryKeyConstraint("user_id"),
+    )
+    op.execute(BACKFILL)
+
+
+def downgrade() -> None:
+    op.drop_table("userusage")
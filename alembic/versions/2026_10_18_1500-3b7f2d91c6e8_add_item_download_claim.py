@@ -0,0 +1,37 @@
+"""add item download claim columns
+
+Revision ID: 3b7f2d91c6e8
+Revises: a41c9e07d3b5
+Create Date: 2026-10-18 15:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+import sqlmodel
+
+
+# revision identifiers, used by Alembic.
+revision: str = "3b7f2d91c6e8"
+down_revision: Union[str, None] = "a41c9e07d3b5"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.add_column(
+        "item",
+        sa.Column(
+            "download_task_id", sqlmodel.sql.sqltypes.GUID(), nullable=True
+        ),
+    )
+    op.add_column(
+        "item", sa.Column("download_claimed_at", sa.DateTime(), nullable=True)
+    )
+
+
+def downgrade() -> None:
+    with op.batch_alter_table("item") as batch_op:
+        batch_op.drop_column("download_claimed_at")
+        batch_op.drop_column("download_task_id")
@@ -0,0 +1,31 @@
+"""add item stored_bytes and crc32
+
+Revision ID: c5e1a8d4f902
+Revises: 3b7f2d91c6e8
+Create Date: 2026-10-18 16:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = "c5e1a8d4f902"
+down_revision: Union[str, None] = "3b7f2d91c6e8"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.add_column(
+        "item", sa.Column("stored_bytes", sa.BigInteger(), nullable=True)
+    )
+    op.add_column("item", sa.Column("crc32", sa.BigInteger(), nullable=True))
+
+
+def downgrade() -> None:
+    with op.batch_alter_table("item") as batch_op:
+        batch_op.drop_column("crc32")
+        batch_op.drop_column("stored_bytes")
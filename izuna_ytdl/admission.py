@@ -0,0 +1,83 @@
+import time
+import threading
+from dataclasses import dataclass
+from typing import Callable, Optional
+
+import sqlalchemy as sa
+from sqlmodel import Session
+
+from izuna_ytdl import config
+from izuna_ytdl.models import UserUsage
+
+
+@dataclass
+class Rejection:
+    detail: str
+    # seconds to wait before trying again, None when waiting won't help
+    retry_after: Optional[int] = None
+
+
+class Admission:
+    """Decides whether a request may start another download.
+
+    Limits the downloads a user has queued or running, the bytes their done
+    tasks keep in storage and the downloads queued or running overall. A
+    limit of 0 is no limit. The overall depth is the sum of every user's
+    active counter, read at most once per ``depth_ttl_ms`` per process.
+    """
+
+    def __init__(
+        self,
+        *,
+        max_user_inflight: int = config.MAX_USER_INFLIGHT,
+        max_user_bytes: int = config.MAX_USER_BYTES,
+        max_inflight: int = config.MAX_INFLIGHT_JOBS,
+        retry_after: int = config.ADMISSION_RETRY_AFTER_SECONDS,
+        depth_ttl_ms: int = config.ADMISSION_DEPTH_TTL_MS,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        self.max_user_inflight = max_user_inflight
+        self.max_user_bytes = max_user_bytes
+        self.max_inflight = max_inflight
+        self.retry_after = retry_after
+        self.depth_ttl = depth_ttl_ms / 1000
+        self.clock = clock
+        self._depth: Optional[int] = None
+        self._depth_at = 0.0
+        self._lock = threading.Lock()
+
+    def depth(self, session: Session) -> int:
+        """Downloads queued or running across all users"""
+        with self._lock:
+            if (
+                self._depth is not None
+                and self.clock() - self._depth_at < self.depth_ttl
+            ):
+                return self._depth
+        depth = session.scalar(
+            sa.select(sa.func.coalesce(sa.func.sum(UserUsage.active_count), 0))
+        )
+        with self._lock:
+            self._depth, self._depth_at = depth, self.clock()
+        return depth
+
+    def check_storage(self, usage: UserUsage) -> Optional[Rejection]:
+        """Rejects any new task of a user over their byte quota"""
+        if self.max_user_bytes and usage.bytes_stored >= self.max_user_bytes:
+            return Rejection(f"Storage exceeded limit of {self.max_user_bytes} bytes")
+        return None
+
+    def check_download(self, session: Session, usage: UserUsage) -> Optional[Rejection]:
+        """Rejects a new download while the user's or the overall queue is
+        full"""
+        if self.max_user_inflight and usage.active_count >= self.max_user_inflight:
+            return Rejection(
+                f"Downloads in progress exceeded limit of {self.max_user_inflight}",
+                self.retry_after,
+            )
+        if self.max_inflight and self.depth(session) >= self.max_inflight:
+            return Rejection("Too many downloads in progress", self.retry_after)
+        return None
+
+
+admission = Admission()
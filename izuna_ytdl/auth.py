@@ -1,41 +1,122 @@
 import logging
 import os
 import base64
+import asyncio
 import hashlib
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta
 from fastapi import Depends, HTTPException, status, Cookie
 from fastapi.security import OAuth2PasswordBearer
-from typing import Annotated
+from typing import Annotated, Callable, TypeVar
 from argon2 import PasswordHasher
+from argon2.exceptions import InvalidHashError, VerificationError
+from sqlalchemy.orm import make_transient_to_detached
 from sqlmodel import Session
 from jose import JWTError, jwt
 
+from izuna_ytdl.caches import users
 from izuna_ytdl.database import get_session
 from izuna_ytdl import config
 
 ALGORITHM = "HS256"
 
-ph = PasswordHasher()
+T = TypeVar("T")
+
+ph = PasswordHasher(
+    time_cost=config.ARGON2_TIME_COST,
+    memory_cost=config.ARGON2_MEMORY_COST,
+    parallelism=config.ARGON2_PARALLELISM,
+)
 
 
 def hash_password(password: str):
     return ph.hash(password)
 
 
-def verify_password(password_hash, password):
-    return ph.verify(password_hash, password)
+def verify_password(password_hash, password) -> bool:
+    try:
+        return ph.verify(password_hash, password)
+    except (VerificationError, InvalidHashError):
+        return False
+
+
+def needs_rehash(password_hash: str) -> bool:
+    """Whether the hash was made with other parameters than ``ph``'s"""
+    return ph.check_needs_rehash(password_hash)
+
+
+class HashingBusy(Exception):
+    pass
+
+
+class HashingPool:
+    """Runs password hashing off the request threadpool.
+
+    Argon2 releases the GIL, so up to ``workers`` hashes run in parallel.
+    Each one spreads over as many threads as the hasher's parallelism, so a
+    login spike can take up to ``workers`` times that many cores. At most
+    ``queue`` more calls wait for a worker, later ones raise HashingBusy.
+    """
+
+    def __init__(self, workers: int, queue: int):
+        self.executor = ThreadPoolExecutor(workers, thread_name_prefix="hashing")
+        self._slots = threading.BoundedSemaphore(workers + queue)
+
+    async def run(self, fn: Callable[..., T], *args) -> T:
+        if not self._slots.acquire(blocking=False):
+            raise HashingBusy()
+        try:
+            future = self.executor.submit(fn, *args)
+        except BaseException:
+            self._slots.release()
+            raise
+        future.add_done_callback(lambda _: self._slots.release())
+        return await asyncio.wrap_future(future)
+
+
+hashing = HashingPool(config.HASH_WORKERS, config.HASH_QUEUE_SIZE)
 
 
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="/api/user/token")
 
+# kept in the users cache, so authenticated requests skip the user query.
+# Writes to the user table forget the entries when they commit. The password
+# hash stays out of it, and out of Redis, a cached user loads it on access
+USER_COLUMNS = ("id", "username", "created_at")
+
+
+def forget_user(username: str):
+    users.forget(username)
+
+
+def get_user(session: Session, username: str):
+    """The user named ``username`` attached to ``session``, from the cache
+    when possible"""
+    from izuna_ytdl.models import User
+
+    loaded = None
+
+    def fetch():
+        nonlocal loaded
+        loaded = User.get_by_username(session, username=username)
+        if loaded is not None:
+            return {c: getattr(loaded, c) for c in USER_COLUMNS}
+
+    values = users.get(username, fetch)
+    if values is None or loaded is not None:
+        return loaded
+    user = User(**values)
+    make_transient_to_detached(user)
+    # attached as if it was loaded, without a query
+    return session.merge(user, load=False)
+
 
 def get_login_user(
     session: Annotated[Session, Depends(get_session)],
     token: Annotated[str, Depends(oauth2_scheme)],
     fingerprint: Annotated[str, Cookie(alias=("__Secure-Fgp"))],
 ):
-    from izuna_ytdl.models import User
-
     credentials_exception = HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
         detail="Could not validate credentials",
@@ -61,7 +142,7 @@ def get_login_user(
         print("jwterr", err)
         raise credentials_exception
 
-    user = User.get_by_username(session, username=username)
+    user = get_user(session, username)
     if user is None:
         print("none user")
         raise credentials_exception
@@ -0,0 +1,176 @@
+import json
+import time
+import logging
+import threading
+import multiprocessing
+from concurrent.futures import Future, ProcessPoolExecutor
+from typing import List, Optional
+from uuid import UUID
+
+import boto3
+import sqlalchemy as sa
+from botocore.exceptions import ClientError
+from sqlmodel import Session
+
+from izuna_ytdl import config
+from izuna_ytdl.database import engine
+from izuna_ytdl.dispatch import BatchDispatcher
+from izuna_ytdl.executor.download import abandon_task
+from izuna_ytdl.executor.local import run_payload
+from izuna_ytdl.models import DownloadTask
+
+lambda_client = boto3.client("lambda")
+
+THROTTLE_ERRORS = ("TooManyRequestsException", "ThrottlingException")
+
+
+def invoke_executor(payloads: List[dict]):
+    # a single job keeps the plain payload, several go out as one batch event
+    event = payloads[0] if len(payloads) == 1 else {"jobs": payloads}
+    ids = [p["id"] for p in payloads]
+    for attempt in range(config.EXECUTOR_INVOKE_RETRIES + 1):
+        try:
+            # asynchronous invoke, returns as soon as lambda queued the event
+            res = lambda_client.invoke(
+                FunctionName="ytdl_executor",
+                InvocationType="Event",
+                Payload=json.dumps(event),
+            )
+            break
+        except ClientError as err:
+            code = err.response.get("Error", {}).get("Code")
+            if code not in THROTTLE_ERRORS or attempt == config.EXECUTOR_INVOKE_RETRIES:
+                logging.exception(
+                    f"AWS Lambda function failed to be invoked for ids {ids}"
+                )
+                # nothing will run them, so they must not stay queued
+                with Session(engine) as session:
+                    for p in payloads:
+                        abandon_task(session, UUID(p["task"]["id"]))
+                return
+            delay = config.EXECUTOR_INVOKE_BACKOFF_MS / 1000 * 2**attempt
+            logging.warning(f"AWS Lambda invoke throttled, retrying in {delay}s")
+            time.sleep(delay)
+
+    dispatch_id = res["ResponseMetadata"]["RequestId"]
+    logging.info(f"AWS Lambda function invoked for ids {ids} as {dispatch_id}")
+    task_ids = [UUID(p["task"]["id"]) for p in payloads]
+    with Session(engine) as session:
+        session.execute(
+            sa.update(DownloadTask)
+            .where(DownloadTask.id.in_(task_ids))
+            .values(dispatch_id=dispatch_id)
+        )
+        session.commit()
+
+
+def log_result(future: Future):
+    try:
+        result = future.result()
+    except Exception:
+        logging.exception("Executor job crashed")
+        return
+    logging.info(
+        f"Executor job {result['id']} finished as {result['status']}"
+        f" {result.get('metrics')}"
+    )
+
+
+class ExecutorBackend:
+    """Where the API sends download payloads to be run.
+
+    Local backends return a future resolving to the job result, the same
+    dict (status, state and stage timings) the Lambda executor logs.
+    """
+
+    name: str
+
+    def submit(self, payload: dict) -> Optional[Future]:
+        raise NotImplementedError
+
+    def shutdown(self):
+        pass
+
+
+class LambdaBackend(ExecutorBackend):
+    name = "lambda"
+
+    def __init__(
+        self,
+        *,
+        max_batch: int = config.EXECUTOR_BATCH_SIZE,
+        max_wait_ms: int = config.EXECUTOR_BATCH_WAIT_MS,
+    ):
+        self.dispatcher = BatchDispatcher(
+            invoke_executor, max_batch=max_batch, max_wait_ms=max_wait_ms
+        )
+
+    def submit(self, payload: dict) -> Optional[Future]:
+        self.dispatcher.submit(payload)
+        return None
+
+    def shutdown(self):
+        self.dispatcher.flush()
+
+
+class ProcessPoolBackend(ExecutorBackend):
+    """Runs jobs in a pool of worker processes on this host.
+
+    yt-dlp and ffmpeg are CPU bound, so processes rather than threads let a
+    self-hosted node use every core. Workers are spawned instead of forked
+    to keep the API's engine pool and threads out of them.
+    """
+
+    name = "process"
+
+    def __init__(self, max_workers: int = config.EXECUTOR_PROCESSES):
+        self.max_workers = max_workers
+        self._pool: Optional[ProcessPoolExecutor] = None
+        self._lock = threading.Lock()
+
+    @property
+    def pool(self) -> ProcessPoolExecutor:
+        with self._lock:
+            if self._pool is None:
+                self._pool = ProcessPoolExecutor(
+                    self.max_workers,
+                    mp_context=multiprocessing.get_context("spawn"),
+                )
+            return self._pool
+
+    def submit(self, payload: dict) -> Optional[Future]:
+        future = self.pool.submit(run_payload, payload)
+        future.add_done_callback(log_result)
+        return future
+
+    def shutdown(self):
+        with self._lock:
+            if self._pool is not None:
+                self._pool.shutdown()
+                self._pool = None
+
+
+class InProcessBackend(ExecutorBackend):
+    """Runs the job in the calling thread, for tests and debugging"""
+
+    name = "inprocess"
+
+    def submit(self, payload: dict) -> Optional[Future]:
+        future = Future()
+        try:
+            future.set_result(run_payload(payload))
+        except Exception as err:
+            future.set_exception(err)
+        log_result(future)
+        return future
+
+
+BACKENDS = {b.name: b for b in (LambdaBackend, ProcessPoolBackend, InProcessBackend)}
+
+
+def get_backend(name: str) -> ExecutorBackend:
+    if name not in BACKENDS:
+        raise ValueError(
+            f"Unknown executor backend {name!r}, expected one of {list(BACKENDS)}"
+        )
+    return BACKENDS[name]()
@@ -0,0 +1,267 @@
+import json
+import time
+import logging
+import threading
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Hashable, Optional
+
+_MISSING = object()
+
+
+class TTLCache:
+    """Bounded map whose entries expire ``ttl`` seconds after they are set.
+
+    Once ``size`` entries are held the least recently used one is evicted.
+    Safe to share between threads. Hits, misses, expirations and evictions
+    are counted, see stats().
+    """
+
+    def __init__(
+        self,
+        size: int,
+        ttl: float,
+        *,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        self.size = size
+        self.ttl = ttl
+        self.clock = clock
+        self._entries: OrderedDict[Hashable, tuple] = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = self.misses = self.expired = self.evicted = 0
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        with self._lock:
+            entry = self._entries.get(key, _MISSING)
+            if entry is _MISSING:
+                self.misses += 1
+                return default
+            expires_at, value = entry
+            if expires_at <= self.clock():
+                del self._entries[key]
+                self.expired += 1
+                self.misses += 1
+                return default
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def set(self, key: Hashable, value: Any, *, ttl: Optional[float] = None):
+        ttl = self.ttl if ttl is None else ttl
+        if ttl <= 0 or self.size <= 0:
+            return
+        with self._lock:
+            self._entries[key] = (self.clock() + ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.size:
+                self._entries.popitem(last=False)
+                self.evicted += 1
+
+    def pop(self, key: Hashable):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "size": len(self._entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "expired": self.expired,
+            "evicted": self.evicted,
+            "hit_ratio": self.hits / lookups if lookups else 0.0,
+        }
+
+
+INVALIDATION_CHANNEL = "izuna_ytdl.cache.invalidate"
+
+# tiered caches by name, for the invalidation listener
+tiered: Dict[str, "TieredCache"] = {}
+
+
+class TieredCache:
+    """Read-through cache with a per-process TTLCache in front of Redis.
+
+    Several API processes share the Redis tier, so a value loaded by one is
+    a shared hit for the others. forget() drops a key from both tiers and
+    publishes it, every process running an InvalidationListener then drops
+    its local copy. Values go to Redis through ``dump``/``load``. Without
+    ``redis`` only the local tier is used.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        local: TTLCache,
+        *,
+        redis=None,
+        ttl: int,
+        dump: Callable[[Any], str] = json.dumps,
+        load: Callable[[str], Any] = json.loads,
+    ):
+        self.name = name
+        self.local = local
+        self.redis = redis
+        self.ttl = ttl
+        self.dump = dump
+        self.load = load
+        self.shared_hits = self.shared_misses = self.shared_errors = 0
+        tiered[name] = self
+
+    def _key(self, key: str) -> str:
+        return f"izuna_ytdl.cache.{self.name}:{key}"
+
+    def get(self, key: str, fetch: Callable[[], Any]) -> Any:
+        """Cached value of ``key``, or what ``fetch`` returns. None is not
+        cached."""
+        value = self.local.get(key, _MISSING)
+        if value is not _MISSING:
+            return value
+        if self.redis is not None and self.ttl > 0:
+            raw = self._shared(self.redis.get, self._key(key))
+            if raw is not None:
+                self.shared_hits += 1
+                value = self.load(raw)
+                self.local.set(key, value)
+                return value
+            self.shared_misses += 1
+        value = fetch()
+        if value is not None:
+            self.local.set(key, value)
+            if self.redis is not None and self.ttl > 0:
+                self._shared(
+                    self.redis.set, self._key(key), self.dump(value), ex=self.ttl
+                )
+        return value
+
+    def forget(self, key: str):
+        self.local.pop(key)
+        if self.redis is not None:
+            self._shared(self.redis.delete, self._key(key))
+            self._publish(key)
+
+    def clear(self):
+        self.local.clear()
+        if self.redis is not None:
+            self._shared(self._delete_all)
+            self._publish(None)
+
+    def _delete_all(self):
+        keys = list(self.redis.scan_iter(match=self._key("*"), count=1000))
+        if keys:
+            self.redis.delete(*keys)
+
+    def _publish(self, key: Optional[str]):
+        message = json.dumps({"cache": self.name, "key": key})
+        self._shared(self.redis.publish, INVALIDATION_CHANNEL, message)
+
+    def _shared(self, fn: Callable, *args, **kwargs):
+        # the shared tier is an optimisation, reads fall back to the database
+        try:
+            return fn(*args, **kwargs)
+        except Exception:
+            self.shared_errors += 1
+            logging.exception(f"Cache {self.name} could not reach Redis")
+            return None
+
+    def stats(self) -> dict:
+        shared = self.shared_hits + self.shared_misses
+        return {
+            "local": self.local.stats(),
+            "shared": {
+                "hits": self.shared_hits,
+                "misses": self.shared_misses,
+                "errors": self.shared_errors,
+                "hit_ratio": self.shared_hits / shared if shared else 0.0,
+            },
+        }
+
+
+def invalidate_local(message: dict):
+    cache = tiered.get(message["cache"])
+    if cache is None:
+        return
+    if message["key"] is None:
+        cache.local.clear()
+    else:
+        cache.local.pop(message["key"])
+
+
+class InvalidationListener:
+    """Drops the local copies of keys forgotten by any process"""
+
+    def __init__(self, redis, channel: str = INVALIDATION_CHANNEL):
+        self.redis = redis
+        self.channel = channel
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def listen(self):
+        pubsub = self.redis.pubsub(ignore_subscribe_messages=True)
+        pubsub.subscribe(self.channel)
+        try:
+            while not self._stop.is_set():
+                message = pubsub.get_message(timeout=1.0)
+                if message is not None:
+                    invalidate_local(json.loads(message["data"]))
+        finally:
+            pubsub.close()
+
+    def run(self):
+        while not self._stop.is_set():
+            try:
+                self.listen()
+            except Exception:
+                logging.exception("Cache invalidation listener failed, reconnecting")
+                # messages missed meanwhile, local entries may be stale
+                for cache in tiered.values():
+                    cache.local.clear()
+                self._stop.wait(1)
+
+    def start(self):
+        self._thread = threading.Thread(
+            target=self.run, name="cache-invalidation", daemon=True
+        )
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(5)
+
+
+class PresignCache:
+    """Presigned download URLs, reused per (key, user) until they are within
+    ``margin`` seconds of expiring.
+
+    A reused URL is valid for at least ``margin`` more seconds. Keyed by user
+    so a link handed to one user is never given to another.
+    """
+
+    def __init__(
+        self,
+        storage,
+        *,
+        expires_in: int = 600,
+        margin: int = 60,
+        size: int = 10000,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        self.storage = storage
+        self.expires_in = expires_in
+        self.margin = margin
+        self.cache = TTLCache(size, expires_in - margin, clock=clock)
+
+    def presign(self, key: str, user: Hashable) -> str:
+        url = self.cache.get((key, user))
+        if url is None:
+            url = self.storage.presign(key, expires_in=self.expires_in)
+            self.cache.set((key, user), url)
+        return url
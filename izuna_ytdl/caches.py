@@ -0,0 +1,103 @@
+"""Caches of hot API reads.
+
+With CACHE_REDIS_URL set each one is a per-process LRU in front of a Redis
+tier shared by all API processes, which drop local copies of forgotten keys
+through an InvalidationListener. Writers forget keys once their transaction
+commits, see forget_on_commit.
+"""
+import json
+import datetime
+from typing import Optional
+from uuid import UUID
+
+import sqlalchemy as sa
+from sqlmodel import Session
+
+from izuna_ytdl import config
+from izuna_ytdl.cache import InvalidationListener, TieredCache, TTLCache, tiered
+
+FORGET = "izuna_ytdl.caches.forget"
+
+
+def redis_from_config():
+    if not config.CACHE_REDIS_URL:
+        return None
+    import redis
+
+    return redis.Redis.from_url(config.CACHE_REDIS_URL)
+
+
+def dump_user(values: dict) -> str:
+    return json.dumps(
+        {
+            **values,
+            "id": str(values["id"]),
+            "created_at": values["created_at"].isoformat(),
+        }
+    )
+
+
+def load_user(raw: str) -> dict:
+    values = json.loads(raw)
+    values["id"] = UUID(values["id"])
+    values["created_at"] = datetime.datetime.fromisoformat(values["created_at"])
+    return values
+
+
+redis_client = redis_from_config()
+
+# column values of users by username, see auth.get_user
+users = TieredCache(
+    "user",
+    TTLCache(config.USER_CACHE_SIZE, config.USER_CACHE_TTL_SECONDS),
+    redis=redis_client,
+    ttl=config.USER_CACHE_TTL_SECONDS,
+    dump=dump_user,
+    load=load_user,
+)
+# task counts by state per user id, see DownloadTask.summary
+task_summaries = TieredCache(
+    "task_summary",
+    TTLCache(config.TASK_SUMMARY_CACHE_SIZE, config.TASK_SUMMARY_CACHE_TTL_SECONDS),
+    redis=redis_client,
+    ttl=config.TASK_SUMMARY_CACHE_TTL_SECONDS,
+)
+
+
+def forget_on_commit(session: Session, cache: TieredCache, key: Optional[str]):
+    """Forget ``key``, or everything when None, once ``session`` commits.
+
+    Forgetting earlier would let another request load the old row again
+    before the write is visible.
+    """
+    session.info.setdefault(FORGET, set()).add((cache.name, key))
+
+
+@sa.event.listens_for(sa.orm.Session, "after_commit")
+def _forget_committed(session: Session):
+    for name, key in session.info.pop(FORGET, ()):
+        if key is None:
+            tiered[name].clear()
+        else:
+            tiered[name].forget(key)
+
+
+def stats() -> dict:
+    return {name: cache.stats() for name, cache in tiered.items()}
+
+
+listener: Optional[InvalidationListener] = None
+
+
+def start_listener():
+    global listener
+    if redis_client is not None and listener is None:
+        listener = InvalidationListener(redis_client)
+        listener.start()
+
+
+def stop_listener():
+    global listener
+    if listener is not None:
+        listener.stop()
+        listener = None
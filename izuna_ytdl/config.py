@@ -9,3 +9,101 @@ MASTER_SIGNUP_CODE = os.environ["MASTER_SIGNUP_CODE"]
 MASTER_TOKEN = os.environ["MASTER_TOKEN"]
 
 DB_CONNECTION_URL = os.environ["DB_CONNECTION_URL"]
+
+# jobs dispatched within the wait window are sent to the executor together
+EXECUTOR_BATCH_SIZE = int(os.environ.get("EXECUTOR_BATCH_SIZE", 10))
+EXECUTOR_BATCH_WAIT_MS = int(os.environ.get("EXECUTOR_BATCH_WAIT_MS", 200))
+# retries of a throttled executor invoke, with exponential backoff
+EXECUTOR_INVOKE_RETRIES = int(os.environ.get("EXECUTOR_INVOKE_RETRIES", 3))
+EXECUTOR_INVOKE_BACKOFF_MS = int(os.environ.get("EXECUTOR_INVOKE_BACKOFF_MS", 200))
+
+# a download claimed by a task is taken over by the next request after this
+# long, see Item.claim. Read by the executor as well
+DOWNLOAD_CLAIM_SECONDS = int(os.environ.get("YTDL_DOWNLOAD_CLAIM_SECONDS", 3600))
+
+# presigned download links live this long and are handed out again, per user,
+# until they are within the margin of expiring. 0 cache size disables reuse
+PRESIGN_EXPIRES_SECONDS = int(os.environ.get("PRESIGN_EXPIRES_SECONDS", 600))
+PRESIGN_CACHE_MARGIN_SECONDS = int(os.environ.get("PRESIGN_CACHE_MARGIN_SECONDS", 60))
+PRESIGN_CACHE_SIZE = int(os.environ.get("PRESIGN_CACHE_SIZE", 10000))
+# Argon2 parameters of new password hashes, older hashes are redone on the
+# next login. Logins hash on their own pool of HASH_WORKERS threads, at most
+# HASH_QUEUE_SIZE more wait and the rest are answered 503. Every hash runs
+# ARGON2_PARALLELISM lanes on threads of its own, so logins can take up to
+# HASH_WORKERS * ARGON2_PARALLELISM cores, half of them by default
+ARGON2_TIME_COST = int(os.environ.get("ARGON2_TIME_COST", 3))
+ARGON2_MEMORY_COST = int(os.environ.get("ARGON2_MEMORY_COST", 65536))
+ARGON2_PARALLELISM = int(os.environ.get("ARGON2_PARALLELISM", 4))
+HASH_WORKERS = int(
+    os.environ.get(
+        "HASH_WORKERS", max((os.cpu_count() or 2) // (2 * ARGON2_PARALLELISM), 1)
+    )
+)
+HASH_QUEUE_SIZE = int(os.environ.get("HASH_QUEUE_SIZE", 32))
+
+# users looked up by authenticated requests are kept this long, 0 disables
+USER_CACHE_SIZE = int(os.environ.get("USER_CACHE_SIZE", 10000))
+USER_CACHE_TTL_SECONDS = int(os.environ.get("USER_CACHE_TTL_SECONDS", 60))
+# per-user task counts of /tasks/summary. Task state changes made by
+# executors are seen after at most the TTL
+TASK_SUMMARY_CACHE_SIZE = int(os.environ.get("TASK_SUMMARY_CACHE_SIZE", 10000))
+TASK_SUMMARY_CACHE_TTL_SECONDS = int(
+    os.environ.get("TASK_SUMMARY_CACHE_TTL_SECONDS", 30)
+)
+# Redis shared by the API processes as the second tier of the caches above,
+# empty keeps them per process
+CACHE_REDIS_URL = os.environ.get("CACHE_REDIS_URL", "")
+# task ids one /retrieve/batch request may ask links for
+RETRIEVE_BATCH_MAX = int(os.environ.get("RETRIEVE_BATCH_MAX", 100))
+
+# when enabled downloads go through the job table and are run by
+# `python -m izuna_ytdl.worker` instead of the lambda executor
+JOB_QUEUE_ENABLED = os.environ.get("JOB_QUEUE_ENABLED", "0") == "1"
+JOB_MAX_ATTEMPTS = int(os.environ.get("JOB_MAX_ATTEMPTS", 3))
+JOB_LEASE_SECONDS = int(os.environ.get("JOB_LEASE_SECONDS", 60))
+JOB_RETRY_BACKOFF_SECONDS = int(os.environ.get("JOB_RETRY_BACKOFF_SECONDS", 30))
+WORKER_CONCURRENCY = int(os.environ.get("WORKER_CONCURRENCY", 2))
+WORKER_POLL_INTERVAL_MS = int(os.environ.get("WORKER_POLL_INTERVAL_MS", 1000))
+
+# where download jobs run: "lambda", "process" (local process pool) or
+# "inprocess" (the request's background thread, for tests)
+EXECUTOR_BACKEND = os.environ.get("EXECUTOR_BACKEND", "lambda")
+EXECUTOR_PROCESSES = int(os.environ.get("EXECUTOR_PROCESSES", os.cpu_count() or 1))
+
+# "s3" keeps downloads in YTDL_BUCKET_NAME, "local" under YTDL_STORAGE_ROOT,
+# served by the API at YTDL_STORAGE_BASE_URL with signed links. Workers and
+# the Flask app sign links too, so local storage has no defaults to diverge
+STORAGE_BACKEND = os.environ.get("YTDL_STORAGE", "s3")
+STORAGE_ROOT = os.environ.get("YTDL_STORAGE_ROOT", "")
+if STORAGE_BACKEND == "local":
+    STORAGE_BASE_URL = os.environ["YTDL_STORAGE_BASE_URL"]
+    STORAGE_SECRET = os.environ["YTDL_STORAGE_SECRET"]
+else:
+    STORAGE_BASE_URL = STORAGE_SECRET = ""
+
+# how far /tasks watermarks trail the clock, covering late commits and
+# clock differences between the API and the executor
+TASKS_SYNC_OVERLAP_MS = int(os.environ.get("TASKS_SYNC_OVERLAP_MS", 5000))
+
+# /events streams: how often the shared poller looks for changed tasks, the
+# idle heartbeat, the reconnect delay sent to clients and the events
+# buffered per stream before the oldest is dropped
+EVENTS_POLL_INTERVAL_MS = int(os.environ.get("EVENTS_POLL_INTERVAL_MS", 1000))
+EVENTS_HEARTBEAT_SECONDS = int(os.environ.get("EVENTS_HEARTBEAT_SECONDS", 15))
+EVENTS_RETRY_MS = int(os.environ.get("EVENTS_RETRY_MS", 3000))
+EVENTS_QUEUE_SIZE = int(os.environ.get("EVENTS_QUEUE_SIZE", 32))
+
+# running downloads whose latest progress the API keeps from the progress
+# bus (YTDL_PROGRESS_BUS), the task rows only get the final counts
+PROGRESS_CACHE_SIZE = int(os.environ.get("PROGRESS_CACHE_SIZE", 10000))
+
+# admission control of post_download, 0 disables a limit: downloads a user may
+# have queued or running, bytes their done tasks may keep in storage and
+# downloads queued or running overall. Requests over an in-flight limit are
+# told to retry after ADMISSION_RETRY_AFTER_SECONDS, the overall count is
+# read at most every ADMISSION_DEPTH_TTL_MS
+MAX_USER_INFLIGHT = int(os.environ.get("MAX_USER_INFLIGHT", 0))
+MAX_USER_BYTES = int(os.environ.get("MAX_USER_BYTES", 0))
+MAX_INFLIGHT_JOBS = int(os.environ.get("MAX_INFLIGHT_JOBS", 0))
+ADMISSION_RETRY_AFTER_SECONDS = int(os.environ.get("ADMISSION_RETRY_AFTER_SECONDS", 30))
+ADMISSION_DEPTH_TTL_MS = int(os.environ.get("ADMISSION_DEPTH_TTL_MS", 1000))
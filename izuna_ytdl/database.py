@@ -3,8 +3,14 @@ from sqlmodel import Session, create_engine
 from izuna_ytdl.config import DB_CONNECTION_URL
 
 
+# FastAPI may open and close a request's session on different threads
+connect_args = (
+    {"check_same_thread": False} if DB_CONNECTION_URL.startswith("sqlite") else {}
+)
+
 engine = create_engine(
     DB_CONNECTION_URL,
+    connect_args=connect_args,
     # echo=True,
 )
 
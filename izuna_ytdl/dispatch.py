@@ -0,0 +1,60 @@
+import logging
+import threading
+from typing import Callable, List, Optional
+
+
+class BatchDispatcher:
+    """Groups executor payloads submitted close together into one send.
+
+    A batch goes out when ``max_batch`` payloads are waiting or ``max_wait_ms``
+    after the first one arrived, whichever is first. ``max_wait_ms=0`` sends
+    every payload on its own right away.
+    """
+
+    def __init__(
+        self,
+        send: Callable[[List[dict]], None],
+        *,
+        max_batch: int = 10,
+        max_wait_ms: int = 200,
+    ):
+        self.send = send
+        self.max_batch = max_batch
+        self.max_wait = max_wait_ms / 1000
+        self._lock = threading.Lock()
+        self._pending: List[dict] = []
+        self._timer: Optional[threading.Timer] = None
+
+    def submit(self, payload: dict):
+        with self._lock:
+            self._pending.append(payload)
+            if self.max_wait <= 0 or len(self._pending) >= self.max_batch:
+                batch = self._take()
+            else:
+                batch = None
+                if self._timer is None:
+                    self._timer = threading.Timer(self.max_wait, self.flush)
+                    self._timer.daemon = True
+                    self._timer.start()
+        if batch:
+            self._send(batch)
+
+    def _take(self) -> List[dict]:
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        batch, self._pending = self._pending, []
+        return batch
+
+    def flush(self):
+        with self._lock:
+            batch = self._take()
+        if batch:
+            self._send(batch)
+
+    def _send(self, batch: List[dict]):
+        try:
+            self.send(batch)
+        except Exception:
+            ids = [p.get("id") for p in batch]
+            logging.exception(f"Failed to dispatch executor batch {ids}")
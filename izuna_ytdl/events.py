@@ -0,0 +1,258 @@
+import json
+import asyncio
+import logging
+import datetime
+import threading
+from collections import OrderedDict
+from typing import AsyncIterator, Dict, List, Optional, Set
+from uuid import UUID
+
+from sqlmodel import Session
+from starlette.concurrency import run_in_threadpool
+
+from izuna_ytdl import config
+from izuna_ytdl.database import engine
+from izuna_ytdl.executor.bus import ProgressBus, bus_from_env
+from izuna_ytdl.models import DownloadTask
+from izuna_ytdl.models.download_task import DownloadStatusEnum
+
+
+class ProgressCache:
+    """Latest byte counts of running downloads, fed by the progress bus.
+
+    Executors with a bus only write the final counts, so readers of a
+    processing task take its counts from here. Bounded, the least recently
+    updated tasks are forgotten first.
+    """
+
+    def __init__(self, size: int = config.PROGRESS_CACHE_SIZE):
+        self.size = size
+        self._entries: OrderedDict[str, dict] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def update(self, event: dict):
+        with self._lock:
+            self._entries[event["task_id"]] = event
+            self._entries.move_to_end(event["task_id"])
+            while len(self._entries) > self.size:
+                self._entries.popitem(last=False)
+
+    def get(self, task_id: str) -> Optional[dict]:
+        with self._lock:
+            return self._entries.get(task_id)
+
+    def apply(self, out: dict) -> dict:
+        """Overlay cached counts on a listed task that is still processing"""
+        if out["state"] != DownloadStatusEnum.PROCESSING:
+            return out
+        event = self.get(out["id"])
+        if event is not None:
+            out["downloaded_bytes"] = event["downloaded_bytes"]
+            out["total_bytes"] = event["total_bytes"]
+        return out
+
+
+def task_event(row) -> dict:
+    return progress.apply(
+        {
+            "id": str(row.id),
+            "state": row.state,
+            "downloaded_bytes": row.downloaded_bytes,
+            "total_bytes": row.total_bytes,
+            "title": row.title,
+            "updated_at": row.updated_at.isoformat(),
+        }
+    )
+
+
+def progress_event(event: dict) -> dict:
+    return {
+        "id": event["task_id"],
+        "state": event["state"],
+        "downloaded_bytes": event["downloaded_bytes"],
+        "total_bytes": event["total_bytes"],
+        "updated_at": event["at"],
+    }
+
+
+def format_event(event: dict, *, name: str = "task") -> str:
+    # the event id is the change time, sent back as Last-Event-ID on reconnect
+    return f"id: {event['updated_at']}\nevent: {name}\ndata: {json.dumps(event)}\n\n"
+
+
+class TaskEventHub:
+    """Fans task changes out to the open /events streams of their owners.
+
+    A single poller per process reads the rows changed since its previous pass
+    for every connected user in one indexed query, so an open stream costs a
+    queue rather than a query. The poller stops when the last stream closes.
+    """
+
+    def __init__(
+        self,
+        *,
+        interval_ms: int = config.EVENTS_POLL_INTERVAL_MS,
+        queue_size: int = config.EVENTS_QUEUE_SIZE,
+        batch: int = 1000,
+    ):
+        self.interval = interval_ms / 1000
+        self.queue_size = queue_size
+        self.batch = batch
+        self.subscribers: Dict[UUID, Set[asyncio.Queue]] = {}
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._task: Optional[asyncio.Task] = None
+        self._since: Optional[datetime.datetime] = None
+        # updated_at last sent per task, so overlapping polls send a change once
+        self._sent: Dict[UUID, datetime.datetime] = {}
+
+    def subscribe(self, user_id: UUID) -> asyncio.Queue:
+        queue = asyncio.Queue(self.queue_size)
+        self.subscribers.setdefault(user_id, set()).add(queue)
+        loop = self._loop = asyncio.get_running_loop()
+        if self._task is None or self._task.done() or self._task.get_loop() != loop:
+            self._task = loop.create_task(self.run())
+        return queue
+
+    def unsubscribe(self, user_id: UUID, queue: asyncio.Queue):
+        queues = self.subscribers.get(user_id)
+        if queues is None:
+            return
+        queues.discard(queue)
+        if not queues:
+            del self.subscribers[user_id]
+
+    def publish(self, user_id: UUID, event: dict):
+        for queue in self.subscribers.get(user_id, ()):
+            if queue.full():
+                # a slow reader loses the oldest update, the newer one wins
+                queue.get_nowait()
+            queue.put_nowait(event)
+
+    def forward(self, event: dict):
+        """Hand a progress bus event to its owner's streams, from any thread"""
+        loop = self._loop
+        if loop is None or loop.is_closed():
+            return
+        user_id = UUID(event["user_id"])
+        if user_id in self.subscribers:
+            loop.call_soon_threadsafe(self.publish, user_id, progress_event(event))
+
+    def poll(self) -> List:
+        """Rows of subscribed users changed since the previous poll"""
+        now = datetime.datetime.now()
+        if self._since is None:
+            self._since = now
+        overlap = datetime.timedelta(milliseconds=config.TASKS_SYNC_OVERLAP_MS)
+        with Session(engine) as session:
+            rows = DownloadTask.changed_for(
+                session,
+                list(self.subscribers),
+                self._since - overlap,
+                limit=self.batch,
+            )
+        if len(rows) == self.batch:
+            # a full batch resumes from its last row instead of skipping the
+            # rest, rows sharing that timestamp are sent again and deduplicated
+            resume = rows[-1].updated_at - datetime.timedelta(microseconds=1)
+            self._since = resume + overlap
+        else:
+            self._since = now
+
+        fresh = []
+        for row in rows:
+            if self._sent.get(row.id, datetime.datetime.min) < row.updated_at:
+                self._sent[row.id] = row.updated_at
+                fresh.append(row)
+        horizon = self._since - 2 * overlap
+        self._sent = {k: v for k, v in self._sent.items() if v >= horizon}
+        return fresh
+
+    async def run(self):
+        while self.subscribers:
+            try:
+                rows = await run_in_threadpool(self.poll)
+            except Exception:
+                logging.exception("Task event poll failed")
+                rows = []
+            for row in rows:
+                self.publish(row.created_by_id, task_event(row))
+            await asyncio.sleep(self.interval)
+        self._since = None
+        self._sent.clear()
+
+
+async def event_stream(
+    hub: TaskEventHub,
+    user_id: UUID,
+    queue: asyncio.Queue,
+    backlog: List[dict],
+    *,
+    heartbeat: float = config.EVENTS_HEARTBEAT_SECONDS,
+) -> AsyncIterator[str]:
+    """SSE body: the resume backlog, then live changes and idle heartbeats"""
+    try:
+        yield f"retry: {config.EVENTS_RETRY_MS}\n\n"
+        for event in backlog:
+            yield format_event(event, name="reset" if "reset" in event else "task")
+        while True:
+            try:
+                event = await asyncio.wait_for(queue.get(), heartbeat)
+            except asyncio.TimeoutError:
+                # keeps proxies from closing an idle connection
+                yield ": ping\n\n"
+                continue
+            yield format_event(event)
+    finally:
+        hub.unsubscribe(user_id, queue)
+
+
+class ProgressListener:
+    """Feeds bus events into the progress cache and the open streams"""
+
+    def __init__(self, bus: ProgressBus):
+        self.bus = bus
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def on_event(self, event: dict):
+        progress.update(event)
+        hub.forward(event)
+
+    def run(self):
+        while not self._stop.is_set():
+            try:
+                self.bus.listen(self.on_event, self._stop)
+            except Exception:
+                logging.exception("Progress bus listener failed, reconnecting")
+                self._stop.wait(1)
+
+    def start(self):
+        self._thread = threading.Thread(
+            target=self.run, name="progress-listener", daemon=True
+        )
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(5)
+
+
+progress = ProgressCache()
+hub = TaskEventHub()
+listener: Optional[ProgressListener] = None
+
+
+def start_listener():
+    global listener
+    bus = bus_from_env(engine)
+    if bus is not None and listener is None:
+        listener = ProgressListener(bus)
+        listener.start()
+
+
+def stop_listener():
+    global listener
+    if listener is not None:
+        listener.stop()
+        listener = None
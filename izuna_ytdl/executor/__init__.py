@@ -0,0 +1,3 @@
+# executor-side helpers shared by the Lambda handler and the API.
+# keep this package free of fastapi/config imports, it is shipped
+# inside the Lambda bundle next to handler.py
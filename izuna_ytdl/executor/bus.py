@@ -0,0 +1,134 @@
+import os
+import json
+import select
+import logging
+import threading
+from typing import Callable, List, Optional
+
+import sqlalchemy as sa
+from sqlalchemy.engine import Engine
+
+DEFAULT_CHANNEL = "ytdl_progress"
+
+
+class ProgressBus:
+    """Carries progress events from executors to API processes.
+
+    Events are small dicts (task_id, user_id, byte counts) that only matter
+    while a download runs, so delivery is best effort and nothing is kept
+    for listeners that are not connected.
+    """
+
+    def publish(self, event: dict):
+        raise NotImplementedError
+
+    def listen(self, callback: Callable[[dict], None], stop: threading.Event):
+        """Call ``callback`` with every event until ``stop`` is set"""
+        raise NotImplementedError
+
+
+class MemoryBus(ProgressBus):
+    """Delivers to listeners in the same process, for tests and in-process
+    executors"""
+
+    def __init__(self):
+        self._callbacks: List[Callable[[dict], None]] = []
+        self._lock = threading.Lock()
+
+    def publish(self, event: dict):
+        with self._lock:
+            callbacks = list(self._callbacks)
+        for callback in callbacks:
+            callback(event)
+
+    def listen(self, callback: Callable[[dict], None], stop: threading.Event):
+        with self._lock:
+            self._callbacks.append(callback)
+        try:
+            stop.wait()
+        finally:
+            with self._lock:
+                self._callbacks.remove(callback)
+
+
+class RedisBus(ProgressBus):
+    def __init__(self, client, channel: str = DEFAULT_CHANNEL):
+        self.client = client
+        self.channel = channel
+
+    def publish(self, event: dict):
+        self.client.publish(self.channel, json.dumps(event))
+
+    def listen(self, callback: Callable[[dict], None], stop: threading.Event):
+        pubsub = self.client.pubsub(ignore_subscribe_messages=True)
+        pubsub.subscribe(self.channel)
+        try:
+            while not stop.is_set():
+                message = pubsub.get_message(timeout=1.0)
+                if message is not None:
+                    callback(json.loads(message["data"]))
+        finally:
+            pubsub.close()
+
+
+class PostgresBus(ProgressBus):
+    """LISTEN/NOTIFY on the application database, no extra service needed.
+
+    A listener holds one connection of ``engine`` for as long as it runs.
+    """
+
+    def __init__(self, engine: Engine, channel: str = DEFAULT_CHANNEL):
+        self.engine = engine
+        self.channel = channel
+
+    def publish(self, event: dict):
+        with self.engine.begin() as conn:
+            conn.execute(sa.select(sa.func.pg_notify(self.channel, json.dumps(event))))
+
+    def listen(self, callback: Callable[[dict], None], stop: threading.Event):
+        raw = self.engine.raw_connection()
+        # a connection left listening must not go back to the pool
+        raw.detach()
+        try:
+            conn = raw.connection
+            conn.autocommit = True
+            with conn.cursor() as cursor:
+                cursor.execute(f'LISTEN "{self.channel}"')
+            while not stop.is_set():
+                if select.select([conn], [], [], 1.0) == ([], [], []):
+                    continue
+                conn.poll()
+                while conn.notifies:
+                    callback(json.loads(conn.notifies.pop(0).payload))
+        finally:
+            raw.close()
+
+
+memory_bus = MemoryBus()
+
+
+def bus_from_env(engine: Optional[Engine] = None) -> Optional[ProgressBus]:
+    """Bus picked by YTDL_PROGRESS_BUS, None to keep writing progress rows"""
+    kind = os.environ.get("YTDL_PROGRESS_BUS", "")
+    if not kind:
+        return None
+    if kind == "memory":
+        # shared by the API and executors running in the same process
+        return memory_bus
+    if kind == "redis":
+        import redis
+
+        return RedisBus(redis.Redis.from_url(os.environ["YTDL_PROGRESS_BUS_URL"]))
+    if kind == "postgres":
+        url = os.environ.get("YTDL_PROGRESS_BUS_URL")
+        if url or engine is None:
+            engine = sa.create_engine(url or os.environ["DB_CONNECTION_URL"])
+        return PostgresBus(engine)
+    raise ValueError(f"Unknown progress bus {kind!r}")
+
+
+def publish(bus: ProgressBus, event: dict):
+    try:
+        bus.publish(event)
+    except Exception:
+        logging.exception(f"Progress event for task {event.get('task_id')} lost")
@@ -0,0 +1,92 @@
+import datetime
+from uuid import UUID
+
+import sqlalchemy as sa
+from sqlmodel import Session
+
+from .tables import DownloadStatusEnum, downloadtask, item
+from .usage import ACTIVE_STATES, add_usage, state_change
+
+# how long a download claim holds without the claiming task finishing
+DEFAULT_CLAIM_SECONDS = 3600
+
+
+def claim_item(
+    session: Session,
+    item_id: UUID,
+    task_id: UUID,
+    *,
+    ttl: int = DEFAULT_CLAIM_SECONDS,
+    reentrant: bool = True,
+) -> bool:
+    """Claim the download of a not yet downloaded item for ``task_id``.
+
+    A single conditional UPDATE, so of concurrent claimers exactly one wins.
+    A claim older than ``ttl`` is taken over, its download is presumed
+    dead. With ``reentrant`` the task holding the claim gets it again.
+    """
+    now = datetime.datetime.now()
+    free = item.c.download_task_id.is_(None) | (
+        item.c.download_claimed_at < now - datetime.timedelta(seconds=ttl)
+    )
+    if reentrant:
+        free = free | (item.c.download_task_id == task_id)
+    res = session.execute(
+        sa.update(item)
+        .where(item.c.id == item_id)
+        .where(item.c.remote_key == "")
+        .where(free)
+        .values(download_task_id=task_id, download_claimed_at=now)
+    )
+    session.commit()
+    return res.rowcount == 1
+
+
+def settle_item(
+    session: Session,
+    item_id: UUID,
+    state: DownloadStatusEnum,
+    **values,
+):
+    """End the item's download: every task waiting on it moves to ``state``
+    with the downloading task, and the claim is released.
+
+    Done settles all unfinished tasks of the item, including ones that
+    failed an earlier attempt. An error settles the queued and processing
+    ones.
+    """
+    if state == DownloadStatusEnum.DONE:
+        moving = downloadtask.c.state != DownloadStatusEnum.DONE
+    else:
+        moving = downloadtask.c.state.in_(ACTIVE_STATES)
+    # locked, so a state change racing with this one is counted once
+    rows = session.execute(
+        sa.select(
+            downloadtask.c.id,
+            downloadtask.c.state,
+            downloadtask.c.created_by_id,
+            item.c.total_bytes,
+        )
+        .select_from(downloadtask.join(item, downloadtask.c.item_id == item.c.id))
+        .where(downloadtask.c.item_id == item_id)
+        .where(moving)
+        .with_for_update(of=downloadtask)
+    ).all()
+    if rows:
+        session.execute(
+            sa.update(downloadtask)
+            .where(downloadtask.c.id.in_([row.id for row in rows]))
+            .values(state=state, updated_at=datetime.datetime.now(), **values)
+        )
+    for row in rows:
+        add_usage(
+            session,
+            row.created_by_id,
+            **state_change(row.state, state, row.total_bytes),
+        )
+    session.execute(
+        sa.update(item)
+        .where(item.c.id == item_id)
+        .values(download_task_id=None, download_claimed_at=None)
+    )
+    session.commit()
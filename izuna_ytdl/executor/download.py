@@ -0,0 +1,355 @@
+import os
+import time
+import logging
+import datetime
+from dataclasses import dataclass
+from typing import Optional
+from uuid import UUID
+
+import sqlalchemy as sa
+import yt_dlp
+from sqlmodel import Session
+
+from .bus import ProgressBus
+from .claim import DEFAULT_CLAIM_SECONDS, claim_item, settle_item
+from .metrics import JobTimer
+from .progress import ProgressWriter, DEFAULT_FLUSH_INTERVAL_MS, DEFAULT_FLUSH_PERCENT
+from .storage import Storage
+from .streaming import (
+    ffmpeg_command,
+    is_streamable,
+    iter_source,
+    stream_transcode,
+)
+from .tables import DownloadStatusEnum, downloadtask, item
+from .usage import add_usage, state_change
+from .warm import WarmContainer
+
+# failures that a retry cannot fix
+PERMANENT_ERRORS = (
+    DownloadStatusEnum.ERROR_TOO_LONG,
+    DownloadStatusEnum.ERROR_NOT_FOUND,
+)
+
+
+@dataclass
+class DownloadJob:
+    video_id: str
+    task_id: UUID
+    item_id: UUID
+    # epoch seconds the API handed the job to a backend
+    dispatched_at: Optional[float] = None
+    # owner of the task, looked up by execute() for progress events
+    user_id: Optional[UUID] = None
+
+    @classmethod
+    def from_payload(cls, payload: dict) -> "DownloadJob":
+        task = payload["task"]
+        return cls(
+            video_id=payload["id"],
+            task_id=UUID(task["id"]),
+            item_id=UUID(task["item_id"]),
+            dispatched_at=payload.get("dispatched_at"),
+        )
+
+
+@dataclass
+class ExecutorSettings:
+    ffmpeg_location: Optional[str] = None
+    outdir: str = "/tmp/ytdlp"
+    max_duration: int = 600
+    streaming: bool = False
+    progress_interval_ms: int = DEFAULT_FLUSH_INTERVAL_MS
+    progress_percent: float = DEFAULT_FLUSH_PERCENT
+    claim_seconds: int = DEFAULT_CLAIM_SECONDS
+
+    @classmethod
+    def from_env(cls, **overrides) -> "ExecutorSettings":
+        settings = cls(
+            ffmpeg_location=os.environ.get("YTDL_FFMPEG_LOCATION"),
+            streaming=os.environ.get("YTDL_STREAMING", "0") == "1",
+            progress_interval_ms=int(
+                os.environ.get(
+                    "YTDL_PROGRESS_FLUSH_INTERVAL_MS", DEFAULT_FLUSH_INTERVAL_MS
+                )
+            ),
+            progress_percent=float(
+                os.environ.get("YTDL_PROGRESS_FLUSH_PERCENT", DEFAULT_FLUSH_PERCENT)
+            ),
+            claim_seconds=int(
+                os.environ.get("YTDL_DOWNLOAD_CLAIM_SECONDS", DEFAULT_CLAIM_SECONDS)
+            ),
+        )
+        for k, v in overrides.items():
+            setattr(settings, k, v)
+        return settings
+
+    def ydl_opts(self) -> dict:
+        opts = {
+            "extract_flat": "discard_in_playlist",
+            "final_ext": "mp3",
+            "format": "ba",
+            "fragment_retries": 10,
+            "ignoreerrors": "only_download",
+            "outtmpl": {"default": f"{self.outdir}/%(title)s.%(ext)s"},
+            "postprocessors": [
+                {
+                    "key": "FFmpegExtractAudio",
+                    "nopostoverwrites": False,
+                    "preferredcodec": "mp3",
+                    "preferredquality": "5",
+                },
+                {"key": "FFmpegConcat", "only_multi_video": True, "when": "playlist"},
+            ],
+            "retries": 10,
+        }
+        if self.ffmpeg_location is not None:
+            opts["ffmpeg_location"] = self.ffmpeg_location
+        return opts
+
+
+def set_task(session: Session, task_id: UUID, **values):
+    # the table clause has no onupdate, keep delta sync in step by hand
+    values.setdefault("updated_at", datetime.datetime.now())
+    old = None
+    if "state" in values:
+        # locked, so concurrent state changes are counted one after another
+        old = session.execute(
+            sa.select(
+                downloadtask.c.state, downloadtask.c.created_by_id, item.c.total_bytes
+            )
+            .select_from(
+                downloadtask.outerjoin(item, downloadtask.c.item_id == item.c.id)
+            )
+            .where(downloadtask.c.id == task_id)
+            .with_for_update(of=downloadtask)
+        ).first()
+    session.execute(
+        sa.update(downloadtask).where(downloadtask.c.id == task_id).values(**values)
+    )
+    if old is not None:
+        add_usage(
+            session,
+            old.created_by_id,
+            **state_change(old.state, values["state"], old.total_bytes),
+        )
+    session.commit()
+
+
+def set_item(session: Session, item_id: UUID, **values):
+    session.execute(sa.update(item).where(item.c.id == item_id).values(**values))
+    session.commit()
+
+
+def abandon_task(
+    session: Session,
+    task_id: UUID,
+    state: DownloadStatusEnum = DownloadStatusEnum.ERROR_UNKNOWN,
+):
+    """End a task that will not run again.
+
+    Unless another task is downloading its item, the item is settled, so the
+    claim is released and the tasks waiting on it end with this one.
+    """
+    row = session.execute(
+        sa.select(downloadtask.c.item_id, item.c.download_task_id)
+        .select_from(downloadtask.outerjoin(item, downloadtask.c.item_id == item.c.id))
+        .where(downloadtask.c.id == task_id)
+    ).first()
+    if row is None:
+        return
+    if row.item_id is None or row.download_task_id not in (None, task_id):
+        set_task(session, task_id, state=state)
+        return
+    settle_item(session, row.item_id, state, downloaded_bytes=0)
+
+
+def stream_download(
+    ydl: yt_dlp.YoutubeDL,
+    job: DownloadJob,
+    info: dict,
+    progress: ProgressWriter,
+    settings: ExecutorSettings,
+    storage: Storage,
+):
+    name = f"{yt_dlp.utils.sanitize_filename(info.get('title'))}.mp3"
+    remote_key = f"public/{job.video_id}/{name}"
+    source = iter_source(ydl, info, on_progress=progress.update)
+    with storage.put_stream(remote_key) as sink:
+        stream_transcode(
+            source, sink, ffmpeg_command(settings.ffmpeg_location or "ffmpeg")
+        )
+    return name, remote_key
+
+
+def run_download(
+    session: Session,
+    job: DownloadJob,
+    settings: ExecutorSettings,
+    *,
+    warm: WarmContainer,
+    storage: Storage,
+    timer: Optional[JobTimer] = None,
+    bus: Optional[ProgressBus] = None,
+) -> DownloadStatusEnum:
+    """Download, transcode and upload one video, returning the final state.
+
+    All task and item writes are plain UPDATEs by id, so this runs against
+    either copy of the models. With a ``bus`` progress ticks are published
+    there and only state changes and the final byte counts are written.
+    """
+    timer = timer or JobTimer()
+    final_filename = None
+    final_filepath = ""
+
+    def yt_dlp_monitor(d):
+        nonlocal final_filename
+        nonlocal final_filepath
+        if d.get("status") == "finished":
+            final_filename = d.get("info_dict").get("filepath")
+            final_filepath = (
+                d.get("info_dict").get("__files_to_move").get(final_filename)
+            )
+
+    progress = ProgressWriter(
+        session,
+        job.task_id,
+        job.item_id,
+        interval_ms=settings.progress_interval_ms,
+        percent=settings.progress_percent,
+        bus=bus,
+        user_id=job.user_id,
+    )
+
+    def progress_hook(d: dict):
+        progress.update(
+            d.get("downloaded_bytes"),
+            d.get("total_bytes") or d.get("total_bytes_estimate"),
+        )
+        if d.get("status") == "finished":
+            progress.flush()
+
+    try:
+        set_task(session, job.task_id, state=DownloadStatusEnum.PROCESSING)
+        with warm.hooks.bind(progress_hook, yt_dlp_monitor):
+            ydl = warm.ydl()
+            # extract once without processing, the same info dict is fed
+            # back to process_ie_result instead of letting download()
+            # run the extractor a second time
+            with timer.stage("extract"):
+                info = ydl.extract_info(
+                    f"https://www.youtube.com/watch?v={job.video_id}",
+                    download=False,
+                    process=False,
+                )
+            timer.record("extract_saved", timer.timings["extract"])
+            if (info.get("duration") or 0) > settings.max_duration:
+                settle_item(session, job.item_id, DownloadStatusEnum.ERROR_TOO_LONG)
+                return DownloadStatusEnum.ERROR_TOO_LONG
+
+            set_task(session, job.task_id, title=info.get("title"))
+            if settings.streaming:
+                with timer.stage("format_selection"):
+                    info = ydl.process_ie_result(info, download=False)
+            if settings.streaming and is_streamable(info):
+                try:
+                    with timer.stage("download"):
+                        final_filename, remote_key = stream_download(
+                            ydl, job, info, progress, settings, storage
+                        )
+                finally:
+                    progress.close()
+            else:
+                try:
+                    with timer.stage("download"):
+                        ydl.process_ie_result(info, download=True)
+                finally:
+                    progress.close()
+
+                logging.debug("Download complete")
+                logging.debug(f"End filename: ${final_filename}")
+                logging.debug(f"End filepath: ${final_filepath}")
+                remote_key = f"public/{job.video_id}/{final_filename}"
+                with timer.stage("upload"):
+                    storage.put_file(final_filepath, remote_key)
+
+            set_item(session, job.item_id, name=final_filename, remote_key=remote_key)
+            # the tasks that waited on this download are done with it
+            settle_item(
+                session, job.item_id, DownloadStatusEnum.DONE, title=final_filename
+            )
+            return DownloadStatusEnum.DONE
+
+    except yt_dlp.utils.DownloadError as err:
+        logging.error("Download error")
+        logging.error(err)
+        session.rollback()
+        if err.msg.rfind("Video unavailable") != -1:
+            state = DownloadStatusEnum.ERROR_NOT_FOUND
+        else:
+            state = DownloadStatusEnum.ERROR_DOWNLOAD
+        settle_item(session, job.item_id, state)
+        return state
+    except Exception as err:
+        errm = f"Other errors: {err.__class__.__name__} {err}"
+        logging.error(errm)
+        session.rollback()
+        settle_item(
+            session,
+            job.item_id,
+            DownloadStatusEnum.ERROR_UNKNOWN,
+            downloaded_bytes=0,
+        )
+        return DownloadStatusEnum.ERROR_UNKNOWN
+
+
+def execute(
+    session: Session,
+    job: DownloadJob,
+    settings: ExecutorSettings,
+    *,
+    warm: WarmContainer,
+    storage: Storage,
+    bus: Optional[ProgressBus] = None,
+) -> dict:
+    """Run one job the same way on every backend and report its timings.
+
+    The returned status is ``ok``, ``skipped`` when the task was already done
+    (a redelivered job) or another task is downloading the video, ``failed``
+    for errors a retry won't fix, and ``retry`` for everything else.
+    """
+    row = session.execute(
+        sa.select(downloadtask.c.state, downloadtask.c.created_by_id).where(
+            downloadtask.c.id == job.task_id
+        )
+    ).first()
+    state = row.state if row is not None else None
+    if row is not None and job.user_id is None:
+        job.user_id = row.created_by_id
+    if state == DownloadStatusEnum.DONE:
+        logging.info(f"Task for {job.video_id} already done, skipping")
+        return {"id": job.video_id, "status": "skipped"}
+    if not claim_item(session, job.item_id, job.task_id, ttl=settings.claim_seconds):
+        # settled together with the task that is downloading the video
+        logging.info(f"{job.video_id} is downloaded by another task, skipping")
+        return {"id": job.video_id, "status": "skipped"}
+
+    timer = JobTimer()
+    if job.dispatched_at is not None:
+        timer.record("queue_wait", max(time.time() - job.dispatched_at, 0.0))
+    state = run_download(
+        session, job, settings, warm=warm, storage=storage, timer=timer, bus=bus
+    )
+    timer.log(job.video_id)
+    if state == DownloadStatusEnum.DONE:
+        status = "ok"
+    elif state in PERMANENT_ERRORS:
+        status = "failed"
+    else:
+        status = "retry"
+    return {
+        "id": job.video_id,
+        "status": status,
+        "state": state,
+        "metrics": timer.as_dict(),
+    }
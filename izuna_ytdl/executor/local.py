@@ -0,0 +1,63 @@
+import os
+import threading
+from dataclasses import dataclass
+from typing import Optional
+
+from sqlalchemy.engine import Engine
+from sqlmodel import Session, create_engine
+
+from .bus import ProgressBus, bus_from_env
+from .download import DownloadJob, ExecutorSettings, execute
+from .storage import Storage, storage_from_env
+from .warm import WarmContainer, DEFAULT_CACHE_DIR
+
+
+@dataclass
+class Runtime:
+    engine: Engine
+    settings: ExecutorSettings
+    warm: WarmContainer
+    storage: Storage
+    bus: Optional[ProgressBus] = None
+
+
+_runtime: Optional[Runtime] = None
+_lock = threading.Lock()
+
+
+def runtime() -> Runtime:
+    """Executor state of the current process, built on first use.
+
+    Pool workers are spawned processes, so each one opens its own engine and
+    keeps its YoutubeDL instances warm between jobs.
+    """
+    global _runtime
+    with _lock:
+        if _runtime is None:
+            settings = ExecutorSettings.from_env()
+            engine = create_engine(os.environ["DB_CONNECTION_URL"], pool_pre_ping=True)
+            _runtime = Runtime(
+                engine=engine,
+                settings=settings,
+                warm=WarmContainer(
+                    settings.ydl_opts(),
+                    cache_dir=os.environ.get("YTDL_CACHE_DIR", DEFAULT_CACHE_DIR),
+                ),
+                storage=storage_from_env(),
+                bus=bus_from_env(engine),
+            )
+    return _runtime
+
+
+def run_payload(payload: dict) -> dict:
+    """Run an API job payload in this process"""
+    rt = runtime()
+    with Session(rt.engine) as session:
+        return execute(
+            session,
+            DownloadJob.from_payload(payload),
+            rt.settings,
+            warm=rt.warm,
+            storage=rt.storage,
+            bus=rt.bus,
+        )
@@ -0,0 +1,32 @@
+import time
+import logging
+from contextlib import contextmanager
+from typing import Callable, Dict
+
+
+class JobTimer:
+    """Wall-clock timings of the stages of a single download job, in seconds"""
+
+    def __init__(self, clock: Callable[[], float] = time.perf_counter):
+        self.clock = clock
+        self.timings: Dict[str, float] = {}
+        self._started = clock()
+
+    @contextmanager
+    def stage(self, name: str):
+        start = self.clock()
+        try:
+            yield
+        finally:
+            self.record(name, self.clock() - start)
+
+    def record(self, name: str, seconds: float):
+        self.timings[name] = self.timings.get(name, 0.0) + seconds
+
+    def as_dict(self) -> Dict[str, float]:
+        out = {k: round(v, 3) for k, v in self.timings.items()}
+        out["total"] = round(self.clock() - self._started, 3)
+        return out
+
+    def log(self, id: str):
+        logging.info(f"Job metrics for {id}: {self.as_dict()}")
@@ -0,0 +1,137 @@
+import time
+import logging
+import datetime
+from typing import Callable, Optional
+from uuid import UUID
+
+import sqlalchemy as sa
+from sqlmodel import Session
+
+from .bus import ProgressBus, publish
+from .tables import DownloadStatusEnum, downloadtask, item
+
+DEFAULT_FLUSH_INTERVAL_MS = 1000
+DEFAULT_FLUSH_PERCENT = 5.0
+
+
+class ProgressWriter:
+    """Buffers yt-dlp progress ticks and writes them at a bounded rate.
+
+    A flush happens when ``interval_ms`` elapsed since the previous one or when
+    the downloaded bytes moved by ``percent`` of the total, whichever comes
+    first. ``close()`` always writes the last seen value.
+
+    With a ``bus`` the flushes publish an event instead of updating the task
+    and item rows, and only ``close()`` writes the final counts.
+    """
+
+    def __init__(
+        self,
+        session: Session,
+        task_id: UUID,
+        item_id: Optional[UUID],
+        *,
+        interval_ms: int = DEFAULT_FLUSH_INTERVAL_MS,
+        percent: float = DEFAULT_FLUSH_PERCENT,
+        clock: Callable[[], float] = time.monotonic,
+        bus: Optional[ProgressBus] = None,
+        user_id: Optional[UUID] = None,
+    ):
+        self.session = session
+        self.task_id = task_id
+        self.item_id = item_id
+        self.bus = bus
+        self.user_id = user_id
+        self.interval = interval_ms / 1000
+        self.percent = percent
+        self.clock = clock
+
+        self.downloaded_bytes: Optional[int] = None
+        self.total_bytes: Optional[int] = None
+        self.flushes = 0
+        self._dirty = False
+        self._flushed_bytes = 0
+        self._flushed_at: Optional[float] = None
+
+    def update(self, downloaded_bytes: Optional[int], total_bytes: Optional[int]):
+        if downloaded_bytes is not None:
+            self.downloaded_bytes = downloaded_bytes
+        if total_bytes is not None:
+            self.total_bytes = total_bytes
+        self._dirty = True
+        if self._should_flush():
+            self.flush()
+
+    def _should_flush(self) -> bool:
+        if self._flushed_at is None:
+            return True
+        if self.clock() - self._flushed_at >= self.interval:
+            return True
+        if self.total_bytes and self.downloaded_bytes is not None:
+            moved = abs(self.downloaded_bytes - self._flushed_bytes)
+            return moved * 100 / self.total_bytes >= self.percent
+        return False
+
+    def statement(self, dialect_name: str):
+        """Build the write for the buffered values.
+
+        On PostgreSQL both columns are written by one statement through a
+        data-modifying CTE, other dialects get the two UPDATEs back to back.
+        """
+        task_stmt = (
+            sa.update(downloadtask)
+            .where(downloadtask.c.id == self.task_id)
+            .values(
+                downloaded_bytes=self.downloaded_bytes,
+                updated_at=datetime.datetime.now(),
+            )
+        )
+        if self.item_id is None or self.total_bytes is None:
+            return [task_stmt]
+        item_stmt = (
+            sa.update(item)
+            .where(item.c.id == self.item_id)
+            .values(total_bytes=self.total_bytes)
+        )
+        if dialect_name == "postgresql":
+            task_cte = task_stmt.returning(downloadtask.c.id).cte("task_progress")
+            return [item_stmt.add_cte(task_cte)]
+        return [task_stmt, item_stmt]
+
+    def event(self) -> dict:
+        return {
+            "task_id": str(self.task_id),
+            "user_id": str(self.user_id),
+            "state": DownloadStatusEnum.PROCESSING,
+            "downloaded_bytes": self.downloaded_bytes,
+            "total_bytes": self.total_bytes,
+            "at": datetime.datetime.now().isoformat(),
+        }
+
+    def write(self):
+        dialect_name = self.session.get_bind().dialect.name
+        for stmt in self.statement(dialect_name):
+            self.session.execute(stmt)
+        self.session.commit()
+
+    def flush(self):
+        if not self._dirty:
+            return
+        if self.bus is None:
+            self.write()
+        else:
+            publish(self.bus, self.event())
+
+        self.flushes += 1
+        self._dirty = False
+        self._flushed_bytes = self.downloaded_bytes or 0
+        self._flushed_at = self.clock()
+
+    def close(self):
+        try:
+            self.flush()
+            if self.bus is not None and self.flushes:
+                self.write()
+        except Exception:
+            logging.exception(f"Final progress flush failed for task {self.task_id}")
+            self.session.rollback()
@@ -0,0 +1,49 @@
+import logging
+from typing import Callable, List
+from uuid import UUID
+
+from sqlmodel import Session
+
+from .download import abandon_task
+
+# runs of a job, the first one included, before its task is abandoned
+DEFAULT_MAX_ATTEMPTS = 3
+
+
+def retry_jobs(
+    session: Session,
+    jobs: List[dict],
+    results: List[dict],
+    *,
+    invoke: Callable[[List[dict]], None],
+    max_attempts: int = DEFAULT_MAX_ATTEMPTS,
+) -> List[dict]:
+    """Send the jobs whose result is ``retry`` to ``invoke`` once more.
+
+    Lambda only retries an async invoke when the handler raises, and never
+    one job of a batch, so jobs not delivered by SQS are retried here. The
+    run count travels in the payload's ``attempt``. A job out of attempts,
+    or that could not be sent, has its task abandoned. Returns the jobs sent.
+    """
+    again, spent = [], []
+    for job, result in zip(jobs, results):
+        if result["status"] != "retry":
+            continue
+        attempt = job.get("attempt", 1)
+        if attempt < max_attempts:
+            again.append({**job, "attempt": attempt + 1})
+        else:
+            logging.warning(f"Job for {job['id']} failed after {attempt} attempts")
+            spent.append(job)
+    if again:
+        try:
+            invoke(again)
+        except Exception:
+            logging.exception(f"Retry of {[job['id'] for job in again]} not sent")
+            spent += again
+            again = []
+    for job in spent:
+        task_id = job["task"].get("id")
+        if task_id is not None:
+            abandon_task(session, UUID(task_id))
+    return again
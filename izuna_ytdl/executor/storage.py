@@ -0,0 +1,249 @@
+import os
+import hmac
+import time
+import shutil
+import hashlib
+import datetime
+import mimetypes
+from dataclasses import dataclass
+from typing import Iterator, Optional
+from urllib.parse import quote, urlencode
+
+import boto3
+from botocore.exceptions import ClientError
+
+from .streaming import S3MultipartWriter, DEFAULT_PART_SIZE
+
+READ_CHUNK_SIZE = 64 * 1024
+
+
+class StorageError(Exception):
+    pass
+
+
+@dataclass
+class ObjectStat:
+    size: int
+    last_modified: datetime.datetime
+    content_type: Optional[str] = None
+
+
+class Storage:
+    """Where finished downloads are kept, addressed by remote_key"""
+
+    def put_file(self, path: str, key: str):
+        """Store the local file at ``path``, which is consumed"""
+        raise NotImplementedError
+
+    def put_stream(self, key: str, *, content_type: str = "audio/mpeg"):
+        """Writer with ``write``/``close``/``abort``, aborting on exception"""
+        raise NotImplementedError
+
+    def presign(self, key: str, expires_in: int = 600) -> str:
+        """Time-limited URL the object can be downloaded from"""
+        raise NotImplementedError
+
+    def stat(self, key: str) -> Optional[ObjectStat]:
+        raise NotImplementedError
+
+    def read(
+        self, key: str, start: int, end: int, *, chunk_size: int = READ_CHUNK_SIZE
+    ) -> Iterator[bytes]:
+        """Bytes ``start`` to ``end`` inclusive, ``chunk_size`` at a time"""
+        raise NotImplementedError
+
+    def exists(self, key: str) -> bool:
+        return self.stat(key) is not None
+
+    def delete(self, key: str):
+        raise NotImplementedError
+
+
+class S3Storage(Storage):
+    def __init__(self, s3, bucket: str, *, part_size: int = DEFAULT_PART_SIZE):
+        self.s3 = s3
+        self.bucket = bucket
+        self.part_size = part_size
+
+    def put_file(self, path: str, key: str):
+        self.s3.upload_file(path, self.bucket, key)
+        os.remove(path)
+
+    def put_stream(self, key: str, *, content_type: str = "audio/mpeg"):
+        return S3MultipartWriter(
+            self.s3,
+            self.bucket,
+            key,
+            part_size=self.part_size,
+            content_type=content_type,
+        )
+
+    def presign(self, key: str, expires_in: int = 600) -> str:
+        try:
+            return self.s3.generate_presigned_url(
+                "get_object",
+                Params={"Bucket": self.bucket, "Key": key},
+                ExpiresIn=expires_in,
+            )
+        except ClientError as err:
+            raise StorageError(f"could not presign {key}") from err
+
+    def stat(self, key: str) -> Optional[ObjectStat]:
+        try:
+            res = self.s3.head_object(Bucket=self.bucket, Key=key)
+        except ClientError as err:
+            if err.response.get("Error", {}).get("Code") in ("404", "NoSuchKey"):
+                return None
+            raise StorageError(f"could not stat {key}") from err
+        return ObjectStat(
+            size=res["ContentLength"],
+            last_modified=res["LastModified"],
+            content_type=res.get("ContentType"),
+        )
+
+    def read(
+        self, key: str, start: int, end: int, *, chunk_size: int = READ_CHUNK_SIZE
+    ) -> Iterator[bytes]:
+        try:
+            res = self.s3.get_object(
+                Bucket=self.bucket, Key=key, Range=f"bytes={start}-{end}"
+            )
+        except ClientError as err:
+            raise StorageError(f"could not read {key}") from err
+        body = res["Body"]
+        try:
+            yield from body.iter_chunks(chunk_size)
+        finally:
+            body.close()
+
+    def delete(self, key: str):
+        self.s3.delete_object(Bucket=self.bucket, Key=key)
+
+
+class LocalFileWriter:
+    """Writes to a temporary file next to ``path`` and renames it on close,
+    so readers never see a partial object."""
+
+    def __init__(self, path: str):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.path = path
+        self.tmp_path = f"{path}.part"
+        self.bytes_written = 0
+        self._file = open(self.tmp_path, "wb")
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.close()
+        else:
+            self.abort()
+
+    def write(self, data: bytes):
+        self._file.write(data)
+        self.bytes_written += len(data)
+
+    def close(self):
+        self._file.close()
+        os.replace(self.tmp_path, self.path)
+
+    def abort(self):
+        self._file.close()
+        if os.path.exists(self.tmp_path):
+            os.remove(self.tmp_path)
+
+
+class LocalStorage(Storage):
+    """Objects kept as files under ``root``, for self-hosted nodes.
+
+    Presigned URLs point at ``base_url`` and carry an HMAC of the key and
+    expiry, which the API checks with ``verify`` before serving the file.
+    """
+
+    def __init__(self, root: str, *, base_url: str, secret: str):
+        if not secret:
+            raise ValueError("local storage needs a secret to sign links with")
+        self.root = os.path.realpath(root)
+        self.base_url = base_url.rstrip("/")
+        self.secret = secret.encode()
+
+    def path(self, key: str) -> str:
+        path = os.path.realpath(os.path.join(self.root, key))
+        if os.path.commonpath([self.root, path]) != self.root:
+            raise StorageError(f"key {key!r} is outside the storage root")
+        return path
+
+    def put_file(self, path: str, key: str):
+        dest = self.path(key)
+        os.makedirs(os.path.dirname(dest), exist_ok=True)
+        shutil.move(path, dest)
+
+    def put_stream(self, key: str, *, content_type: str = "audio/mpeg"):
+        return LocalFileWriter(self.path(key))
+
+    def signature(self, key: str, expires: int) -> str:
+        msg = f"{key}\n{expires}".encode()
+        return hmac.new(self.secret, msg, hashlib.sha256).hexdigest()
+
+    def presign(self, key: str, expires_in: int = 600) -> str:
+        expires = int(time.time()) + expires_in
+        query = urlencode({"expires": expires, "sig": self.signature(key, expires)})
+        return f"{self.base_url}/{quote(key)}?{query}"
+
+    def verify(self, key: str, expires: int, sig: str) -> bool:
+        if expires < time.time():
+            return False
+        return hmac.compare_digest(self.signature(key, expires), sig)
+
+    def stat(self, key: str) -> Optional[ObjectStat]:
+        try:
+            st = os.stat(self.path(key))
+        except FileNotFoundError:
+            return None
+        return ObjectStat(
+            size=st.st_size,
+            last_modified=datetime.datetime.fromtimestamp(
+                st.st_mtime, datetime.timezone.utc
+            ),
+            content_type=mimetypes.guess_type(key)[0],
+        )
+
+    def read(
+        self, key: str, start: int, end: int, *, chunk_size: int = READ_CHUNK_SIZE
+    ) -> Iterator[bytes]:
+        try:
+            f = open(self.path(key), "rb")
+        except OSError as err:
+            raise StorageError(f"could not read {key}") from err
+        with f:
+            f.seek(start)
+            remaining = end - start + 1
+            while remaining > 0:
+                data = f.read(min(chunk_size, remaining))
+                if not data:
+                    break
+                remaining -= len(data)
+                yield data
+
+    def delete(self, key: str):
+        try:
+            os.remove(self.path(key))
+        except FileNotFoundError:
+            pass
+
+
+def storage_from_env(s3=None) -> Storage:
+    """Storage configured by the YTDL_STORAGE* variables, S3 by default"""
+    if os.environ.get("YTDL_STORAGE", "s3") == "local":
+        return LocalStorage(
+            os.environ["YTDL_STORAGE_ROOT"],
+            # required, links must verify on the API serving the files
+            base_url=os.environ["YTDL_STORAGE_BASE_URL"],
+            secret=os.environ["YTDL_STORAGE_SECRET"],
+        )
+    return S3Storage(
+        s3 or boto3.client("s3"),
+        os.environ["YTDL_BUCKET_NAME"],
+        part_size=int(os.environ.get("YTDL_MULTIPART_PART_SIZE", DEFAULT_PART_SIZE)),
+    )
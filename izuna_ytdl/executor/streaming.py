@@ -0,0 +1,241 @@
+import logging
+import subprocess
+import threading
+from typing import Callable, Iterable, Iterator, List, Optional
+
+from yt_dlp.utils import sanitized_Request
+
+MIN_PART_SIZE = 5 * 1024 * 1024
+DEFAULT_PART_SIZE = 8 * 1024 * 1024
+DEFAULT_CHUNK_SIZE = 64 * 1024
+DEFAULT_HTTP_CHUNK_SIZE = 10 * 1024 * 1024
+
+
+class StreamingUnsupported(Exception):
+    pass
+
+
+class TranscodeError(Exception):
+    pass
+
+
+class S3MultipartWriter:
+    """File-like sink that uploads to S3 in fixed-size multipart parts.
+
+    Only one part is buffered in memory at a time. Leaving the context with an
+    exception aborts the upload so no orphaned parts are left in the bucket.
+    """
+
+    def __init__(
+        self,
+        s3,
+        bucket: str,
+        key: str,
+        *,
+        part_size: int = DEFAULT_PART_SIZE,
+        content_type: str = "audio/mpeg",
+    ):
+        if part_size < MIN_PART_SIZE:
+            raise ValueError(f"part_size must be at least {MIN_PART_SIZE} bytes")
+        self.s3 = s3
+        self.bucket = bucket
+        self.key = key
+        self.part_size = part_size
+        self.content_type = content_type
+
+        self.bytes_written = 0
+        self.parts: List[dict] = []
+        self.upload_id: Optional[str] = None
+        self._buffer = bytearray()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.close()
+        else:
+            self.abort()
+
+    def _start(self):
+        res = self.s3.create_multipart_upload(
+            Bucket=self.bucket, Key=self.key, ContentType=self.content_type
+        )
+        self.upload_id = res["UploadId"]
+
+    def _upload_part(self, body: bytes):
+        if self.upload_id is None:
+            self._start()
+        number = len(self.parts) + 1
+        res = self.s3.upload_part(
+            Bucket=self.bucket,
+            Key=self.key,
+            UploadId=self.upload_id,
+            PartNumber=number,
+            Body=body,
+        )
+        self.parts.append({"ETag": res["ETag"], "PartNumber": number})
+
+    def write(self, data: bytes):
+        self._buffer += data
+        self.bytes_written += len(data)
+        while len(self._buffer) >= self.part_size:
+            self._upload_part(bytes(self._buffer[: self.part_size]))
+            del self._buffer[: self.part_size]
+        return len(data)
+
+    def close(self):
+        if self.upload_id is None:
+            # smaller than one part, a plain PUT is enough
+            self.s3.put_object(
+                Bucket=self.bucket,
+                Key=self.key,
+                Body=bytes(self._buffer),
+                ContentType=self.content_type,
+            )
+            self._buffer.clear()
+            return
+        if self._buffer:
+            self._upload_part(bytes(self._buffer))
+            self._buffer.clear()
+        self.s3.complete_multipart_upload(
+            Bucket=self.bucket,
+            Key=self.key,
+            UploadId=self.upload_id,
+            MultipartUpload={"Parts": self.parts},
+        )
+
+    def abort(self):
+        self._buffer.clear()
+        if self.upload_id is None:
+            return
+        try:
+            self.s3.abort_multipart_upload(
+                Bucket=self.bucket, Key=self.key, UploadId=self.upload_id
+            )
+        except Exception:
+            logging.exception(f"Failed to abort multipart upload for {self.key}")
+
+
+def ffmpeg_command(ffmpeg_location: str = "ffmpeg", quality: str = "5") -> List[str]:
+    """ffmpeg invocation reading the source on stdin and writing mp3 to stdout"""
+    return [
+        ffmpeg_location,
+        "-hide_banner",
+        "-loglevel",
+        "error",
+        "-i",
+        "pipe:0",
+        "-vn",
+        "-c:a",
+        "libmp3lame",
+        "-q:a",
+        quality,
+        "-f",
+        "mp3",
+        "pipe:1",
+    ]
+
+
+def is_streamable(info: dict) -> bool:
+    """Only single-file http(s) formats can be piped, fragmented ones can't"""
+    return info.get("protocol") in ("http", "https") and bool(info.get("url"))
+
+
+def iter_source(
+    ydl,
+    info: dict,
+    *,
+    chunk_size: int = DEFAULT_CHUNK_SIZE,
+    http_chunk_size: int = DEFAULT_HTTP_CHUNK_SIZE,
+    on_progress: Optional[Callable[[int, Optional[int]], None]] = None,
+) -> Iterator[bytes]:
+    """Yield the selected format of ``info`` straight from the network.
+
+    Requests are issued as ranged windows of ``http_chunk_size`` bytes, the
+    same way yt-dlp's own http downloader avoids YouTube throttling.
+    """
+    if not is_streamable(info):
+        raise StreamingUnsupported(f"protocol {info.get('protocol')} not streamable")
+
+    total = info.get("filesize") or info.get("filesize_approx")
+    headers = info.get("http_headers") or {}
+    downloaded = 0
+    while True:
+        end = downloaded + http_chunk_size - 1
+        req = sanitized_Request(
+            info["url"], headers={**headers, "Range": f"bytes={downloaded}-{end}"}
+        )
+        received = 0
+        with ydl.urlopen(req) as res:
+            while chunk := res.read(chunk_size):
+                received += len(chunk)
+                downloaded += len(chunk)
+                if on_progress is not None:
+                    on_progress(downloaded, total)
+                yield chunk
+        if received < http_chunk_size or (total and downloaded >= total):
+            return
+
+
+def stream_transcode(
+    source: Iterable[bytes],
+    sink,
+    cmd: List[str],
+    *,
+    chunk_size: int = DEFAULT_CHUNK_SIZE,
+) -> int:
+    """Pipe ``source`` through ``cmd`` and write its stdout into ``sink``.
+
+    The source is fed from a separate thread so download, transcode and upload
+    overlap. Returns the number of bytes written to the sink.
+    """
+    proc = subprocess.Popen(
+        cmd, stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.PIPE
+    )
+    feed_error: List[BaseException] = []
+
+    def feed():
+        try:
+            for chunk in source:
+                proc.stdin.write(chunk)
+        except BrokenPipeError:
+            pass
+        except BaseException as err:
+            feed_error.append(err)
+        finally:
+            try:
+                proc.stdin.close()
+            except BrokenPipeError:
+                pass
+
+    stderr = bytearray()
+
+    def drain_stderr():
+        stderr.extend(proc.stderr.read())
+
+    feeder = threading.Thread(target=feed, daemon=True)
+    err_reader = threading.Thread(target=drain_stderr, daemon=True)
+    feeder.start()
+    err_reader.start()
+
+    written = 0
+    try:
+        while chunk := proc.stdout.read(chunk_size):
+            sink.write(chunk)
+            written += len(chunk)
+    except BaseException:
+        proc.kill()
+        raise
+    finally:
+        feeder.join()
+        returncode = proc.wait()
+        err_reader.join()
+
+    if feed_error:
+        raise feed_error[0]
+    if returncode != 0:
+        raise TranscodeError(
+            f"{cmd[0]} exited with {returncode}: {stderr.decode(errors='replace')}"
+        )
+    return written
@@ -0,0 +1,47 @@
+from enum import StrEnum
+
+import sqlalchemy as sa
+from sqlmodel.sql.sqltypes import GUID
+
+
+class DownloadStatusEnum(StrEnum):
+    QUEUED = "0"
+    PROCESSING = "1"
+    DONE = "2"
+    ERROR_UNKNOWN = "3"
+    ERROR_TOO_LONG = "4"
+    ERROR_DOWNLOAD = "5"
+    ERROR_NOT_FOUND = "6"
+
+
+# Lightweight table clauses for the executor. The Lambda handler declares its
+# own copy of the models, so statements here must not depend on either set.
+
+downloadtask = sa.table(
+    "downloadtask",
+    sa.column("id", GUID()),
+    sa.column("state", sa.String()),
+    sa.column("title", sa.String()),
+    sa.column("downloaded_bytes", sa.Integer()),
+    sa.column("item_id", GUID()),
+    sa.column("created_by_id", GUID()),
+    sa.column("updated_at", sa.DateTime()),
+)
+
+item = sa.table(
+    "item",
+    sa.column("id", GUID()),
+    sa.column("name", sa.String()),
+    sa.column("remote_key", sa.String()),
+    sa.column("total_bytes", sa.Integer()),
+    sa.column("download_task_id", GUID()),
+    sa.column("download_claimed_at", sa.DateTime()),
+)
+
+userusage = sa.table(
+    "userusage",
+    sa.column("user_id", GUID()),
+    sa.column("task_count", sa.Integer()),
+    sa.column("active_count", sa.Integer()),
+    sa.column("bytes_stored", sa.BigInteger()),
+)
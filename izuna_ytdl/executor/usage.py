@@ -0,0 +1,104 @@
+from typing import Iterable, Optional
+from uuid import UUID
+
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+from sqlmodel import Session
+
+from .tables import DownloadStatusEnum, downloadtask, item, userusage
+
+# tasks counted as in flight by UserUsage.active_count
+ACTIVE_STATES = (DownloadStatusEnum.QUEUED, DownloadStatusEnum.PROCESSING)
+COLUMNS = ["user_id", "task_count", "active_count", "bytes_stored"]
+
+
+def task_usage(state: Optional[str], total_bytes: Optional[int]) -> tuple:
+    """What one task in ``state`` adds to (active_count, bytes_stored)"""
+    active = 1 if state in ACTIVE_STATES else 0
+    stored = total_bytes or 0 if state == DownloadStatusEnum.DONE else 0
+    return active, stored
+
+
+def state_change(
+    old_state: Optional[str], new_state: Optional[str], total_bytes: Optional[int]
+) -> dict:
+    """Counter deltas of a task moving between states, None when absent"""
+    old_active, old_stored = task_usage(old_state, total_bytes)
+    new_active, new_stored = task_usage(new_state, total_bytes)
+    return {
+        "tasks": (new_state is not None) - (old_state is not None),
+        "active": new_active - old_active,
+        "bytes_stored": new_stored - old_stored,
+    }
+
+
+def recount(user_ids: Optional[Iterable[UUID]] = None) -> sa.sql.Select:
+    """Counters computed from the task rows, per user"""
+    active = sa.case((downloadtask.c.state.in_(ACTIVE_STATES), 1), else_=0)
+    stored = sa.case(
+        (
+            downloadtask.c.state == DownloadStatusEnum.DONE,
+            sa.func.coalesce(item.c.total_bytes, 0),
+        ),
+        else_=0,
+    )
+    stmt = (
+        sa.select(
+            downloadtask.c.created_by_id.label("user_id"),
+            sa.func.count().label("task_count"),
+            sa.func.coalesce(sa.func.sum(active), 0).label("active_count"),
+            sa.func.coalesce(sa.func.sum(stored), 0).label("bytes_stored"),
+        )
+        .select_from(downloadtask.outerjoin(item, downloadtask.c.item_id == item.c.id))
+        .group_by(downloadtask.c.created_by_id)
+    )
+    if user_ids is not None:
+        stmt = stmt.where(downloadtask.c.created_by_id.in_(list(user_ids)))
+    return stmt
+
+
+def add_usage(
+    session: Session,
+    user_id: UUID,
+    *,
+    tasks: int = 0,
+    active: int = 0,
+    bytes_stored: int = 0,
+):
+    """Apply counter deltas in the caller's transaction.
+
+    Called after the task write, so a user without a counter row gets one
+    counted from tasks that already include the change.
+    """
+    if not (tasks or active or bytes_stored):
+        return
+    res = session.execute(
+        sa.update(userusage)
+        .where(userusage.c.user_id == user_id)
+        .values(
+            task_count=userusage.c.task_count + tasks,
+            active_count=userusage.c.active_count + active,
+            bytes_stored=userusage.c.bytes_stored + bytes_stored,
+        )
+    )
+    if res.rowcount == 0:
+        session.execute(insert_missing(session.get_bind().dialect.name, [user_id]))
+
+
+def insert_missing(
+    dialect_name: str, user_ids: Optional[Iterable[UUID]] = None
+) -> sa.sql.Insert:
+    """Counter rows of users that have none, counted from their tasks"""
+    counts = recount(user_ids).subquery()
+    stmt = sa.select(counts).where(
+        ~sa.exists().where(userusage.c.user_id == counts.c.user_id)
+    )
+    # a concurrent writer may add the row first, its count covers ours
+    return insert_ignore(dialect_name).from_select(COLUMNS, stmt)
+
+
+def insert_ignore(dialect_name: str) -> sa.sql.Insert:
+    """Insert into userusage that skips users already having a row"""
+    if dialect_name == "postgresql":
+        return postgresql.insert(userusage).on_conflict_do_nothing()
+    return sa.insert(userusage).prefix_with("OR IGNORE")
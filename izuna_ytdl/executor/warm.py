@@ -0,0 +1,159 @@
+import io
+import os
+import time
+import logging
+import tarfile
+import threading
+from contextlib import contextmanager
+from typing import Callable, Optional
+
+import yt_dlp
+
+DEFAULT_CACHE_DIR = "/tmp/yt-dlp-cache"
+
+
+class HookDispatcher:
+    """Stable hook callables for a YoutubeDL that outlives one invocation.
+
+    yt-dlp copies its hooks at construction time, so the cached instance gets
+    these bound methods once and each job swaps in its own callbacks.
+    """
+
+    def __init__(self):
+        self.progress: Optional[Callable[[dict], None]] = None
+        self.postprocessor: Optional[Callable[[dict], None]] = None
+
+    def on_progress(self, d: dict):
+        if self.progress is not None:
+            self.progress(d)
+
+    def on_postprocessor(self, d: dict):
+        if self.postprocessor is not None:
+            self.postprocessor(d)
+
+    @contextmanager
+    def bind(self, progress, postprocessor):
+        self.progress = progress
+        self.postprocessor = postprocessor
+        try:
+            yield
+        finally:
+            self.progress = None
+            self.postprocessor = None
+
+
+class WarmContainer:
+    """State kept across invocations served by the same Lambda container.
+
+    Holds a configured YoutubeDL per worker thread, since YoutubeDL is not
+    thread-safe, and the cache directory they share. When ``cache_key`` is
+    set the cache directory is seeded from S3 on a cold start and written
+    back whenever an invocation changed it.
+    """
+
+    def __init__(
+        self,
+        ydl_opts: dict,
+        *,
+        cache_dir: str = DEFAULT_CACHE_DIR,
+        s3=None,
+        cache_bucket: Optional[str] = None,
+        cache_key: Optional[str] = None,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        self.ydl_opts = ydl_opts
+        self.cache_dir = cache_dir
+        self.s3 = s3
+        self.cache_bucket = cache_bucket
+        self.cache_key = cache_key
+        self.clock = clock
+
+        self.invocations = 0
+        self.created_at = clock()
+        self._local = threading.local()
+        self._cache_fingerprint: Optional[tuple] = None
+
+    @property
+    def cache_enabled(self) -> bool:
+        return bool(self.s3 is not None and self.cache_bucket and self.cache_key)
+
+    def begin_invocation(self) -> dict:
+        """Count the invocation and seed the cache on a cold start"""
+        cold = self.invocations == 0
+        self.invocations += 1
+        metrics = {
+            "cold_start": cold,
+            "invocation": self.invocations,
+            "container_age_s": round(self.clock() - self.created_at, 3),
+        }
+        if cold and self.cache_enabled:
+            start = self.clock()
+            metrics["cache_seeded"] = self.seed_cache()
+            metrics["cache_seed_s"] = round(self.clock() - start, 3)
+        return metrics
+
+    def end_invocation(self) -> dict:
+        if not self.cache_enabled:
+            return {}
+        start = self.clock()
+        persisted = self.persist_cache()
+        return {
+            "cache_persisted": persisted,
+            "cache_persist_s": round(self.clock() - start, 3),
+        }
+
+    @property
+    def hooks(self) -> HookDispatcher:
+        if not hasattr(self._local, "hooks"):
+            self._local.hooks = HookDispatcher()
+        return self._local.hooks
+
+    def ydl(self) -> yt_dlp.YoutubeDL:
+        if not hasattr(self._local, "ydl"):
+            opts = {
+                **self.ydl_opts,
+                "cachedir": self.cache_dir,
+                "progress_hooks": [self.hooks.on_progress],
+                "postprocessor_hooks": [self.hooks.on_postprocessor],
+            }
+            self._local.ydl = yt_dlp.YoutubeDL(opts)
+        return self._local.ydl
+
+    def _fingerprint(self) -> tuple:
+        entries = []
+        for root, _, files in os.walk(self.cache_dir):
+            for name in files:
+                stat = os.stat(os.path.join(root, name))
+                entries.append((root, name, stat.st_size, stat.st_mtime_ns))
+        return tuple(sorted(entries))
+
+    def seed_cache(self) -> bool:
+        os.makedirs(self.cache_dir, exist_ok=True)
+        buf = io.BytesIO()
+        try:
+            self.s3.download_fileobj(self.cache_bucket, self.cache_key, buf)
+            buf.seek(0)
+            with tarfile.open(fileobj=buf, mode="r:gz") as tar:
+                tar.extractall(self.cache_dir, filter="data")
+            return True
+        except Exception:
+            logging.warning(f"Could not seed yt-dlp cache from {self.cache_key}")
+            return False
+        finally:
+            self._cache_fingerprint = self._fingerprint()
+
+    def persist_cache(self) -> bool:
+        fingerprint = self._fingerprint()
+        if not fingerprint or fingerprint == self._cache_fingerprint:
+            return False
+        buf = io.BytesIO()
+        with tarfile.open(fileobj=buf, mode="w:gz") as tar:
+            tar.add(self.cache_dir, arcname=".")
+        buf.seek(0)
+        try:
+            self.s3.upload_fileobj(buf, self.cache_bucket, self.cache_key)
+        except Exception:
+            logging.exception(f"Could not persist yt-dlp cache to {self.cache_key}")
+            return False
+        self._cache_fingerprint = fingerprint
+        return True
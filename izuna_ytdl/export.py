@@ -0,0 +1,83 @@
+"""ZIP of a user's downloaded library, streamed from storage"""
+import os
+import re
+import logging
+from typing import List, Set
+from uuid import UUID
+
+import sqlalchemy as sa
+from sqlmodel import Session
+
+from izuna_ytdl.database import engine
+from izuna_ytdl.executor.storage import Storage
+from izuna_ytdl.models import DownloadTask, Item
+from izuna_ytdl.zipstream import ZipEntry, ZipStream
+
+UNSAFE_RE = re.compile(r"[\x00-\x1f/\\]+")
+
+
+def entry_name(title: str, remote_key: str, taken: Set[str]) -> str:
+    """File name of a task in the archive, unique within ``taken``"""
+    base, ext = os.path.splitext(os.path.basename(remote_key))
+    stem = UNSAFE_RE.sub("_", title).strip() or base
+    name, n = f"{stem}{ext}", 1
+    while name.lower() in taken:
+        n += 1
+        name = f"{stem} ({n}){ext}"
+    taken.add(name.lower())
+    return name
+
+
+def library_entries(
+    session: Session, storage: Storage, user_id: UUID
+) -> List[ZipEntry]:
+    """Archive entries of the user's done tasks.
+
+    Object sizes are looked up once and kept on the item. Tasks whose object
+    is gone are left out.
+    """
+    entries, taken, sizes = [], set(), {}
+    for row in DownloadTask.exports(session, user_id):
+        size = row.stored_bytes
+        if size is None:
+            stat = storage.stat(row.remote_key)
+            if stat is None:
+                logging.warning(f"Export skips missing object {row.remote_key}")
+                continue
+            size = sizes[row.item_id] = stat.size
+        entries.append(
+            ZipEntry(
+                name=entry_name(row.title, row.remote_key, taken),
+                key=row.remote_key,
+                size=size,
+                modified=row.created_at,
+                crc32=row.crc32,
+                ref=row.item_id,
+            )
+        )
+    for item_id, size in sizes.items():
+        session.execute(
+            sa.update(Item).where(Item.id == item_id).values(stored_bytes=size)
+        )
+    session.commit()
+    return entries
+
+
+def save_crc(entry: ZipEntry):
+    # called while the response streams, after the request session is gone
+    with Session(engine) as session:
+        session.execute(
+            sa.update(Item)
+            .where(Item.id == entry.ref)
+            .where(Item.crc32.is_(None))
+            .values(crc32=entry.crc32)
+        )
+        session.commit()
+
+
+def library_archive(session: Session, storage: Storage, user_id: UUID) -> ZipStream:
+    return ZipStream(
+        library_entries(session, storage, user_id),
+        lambda entry, start, end: storage.read(entry.key, start, end),
+        on_crc=save_crc,
+    )
@@ -1,19 +1,56 @@
 import boto3
-import yt_dlp
 import os
+import json
 import datetime
 import logging
+from concurrent.futures import ThreadPoolExecutor
 from typing import Optional, TYPE_CHECKING, List
 import uuid as uuid_pkg
 from uuid import UUID
 from sqlmodel import Field, SQLModel, Session, select, Relationship, create_engine
-from enum import StrEnum
 
+from izuna_ytdl.executor.bus import bus_from_env
+from izuna_ytdl.executor.download import DownloadJob, ExecutorSettings, execute
+from izuna_ytdl.executor.retry import DEFAULT_MAX_ATTEMPTS, retry_jobs
+from izuna_ytdl.executor.storage import storage_from_env
+from izuna_ytdl.executor.tables import DownloadStatusEnum
+from izuna_ytdl.executor.warm import WarmContainer, DEFAULT_CACHE_DIR
+
+# ffmpeg comes from the lambda layer
+SETTINGS = ExecutorSettings.from_env(
+    ffmpeg_location=os.environ.get("YTDL_FFMPEG_LOCATION", "/opt/bin/ffmpeg")
+)
+# yt-dlp cache (player js, signature functions) persisted across cold starts
+YTDL_CACHE_DIR = os.environ.get("YTDL_CACHE_DIR", DEFAULT_CACHE_DIR)
+YTDL_CACHE_S3_KEY = os.environ.get("YTDL_CACHE_S3_KEY")
+# jobs of a batch event downloaded at the same time
+BATCH_CONCURRENCY = int(os.environ.get("YTDL_BATCH_CONCURRENCY", 2))
+# runs of a job not delivered by SQS before its task is failed
+MAX_ATTEMPTS = int(os.environ.get("YTDL_EXECUTOR_MAX_ATTEMPTS", DEFAULT_MAX_ATTEMPTS))
+
+# one connection per concurrent job, checked before use since a frozen
+# container can resume long after the server dropped it
 engine = create_engine(
     os.environ["DB_CONNECTION_URL"],
+    pool_pre_ping=True,
+    pool_size=BATCH_CONCURRENCY,
+    max_overflow=0,
+    pool_recycle=int(os.environ.get("YTDL_DB_POOL_RECYCLE", 300)),
     # echo=True,
 )
 s3 = boto3.client("s3")
+lambda_client = boto3.client("lambda")
+storage = storage_from_env(s3)
+# progress ticks go here instead of the task row when YTDL_PROGRESS_BUS is set
+bus = bus_from_env(engine)
+
+warm = WarmContainer(
+    SETTINGS.ydl_opts(),
+    cache_dir=YTDL_CACHE_DIR,
+    s3=s3,
+    cache_bucket=os.environ["YTDL_BUCKET_NAME"],
+    cache_key=YTDL_CACHE_S3_KEY,
+)
 
 
 def get_session():
@@ -21,16 +58,6 @@ def get_session():
         yield session
 
 
-class DownloadStatusEnum(StrEnum):
-    QUEUED = "0"
-    PROCESSING = "1"
-    DONE = "2"
-    ERROR_UNKNOWN = "3"
-    ERROR_TOO_LONG = "4"
-    ERROR_DOWNLOAD = "5"
-    ERROR_NOT_FOUND = "6"
-
-
 class Item(SQLModel, table=True):
     id: uuid_pkg.UUID = Field(
         primary_key=True,
@@ -121,10 +148,16 @@ class DownloadTask(SQLModel, table=True):
     created_at: datetime.datetime = Field(
         nullable=False, default_factory=datetime.datetime.now
     )
+    updated_at: datetime.datetime = Field(
+        nullable=False,
+        default_factory=datetime.datetime.now,
+        sa_column_kwargs={"onupdate": datetime.datetime.now},
+    )
     url: str = Field()
     title: str = Field()
     state: DownloadStatusEnum = Field(default=DownloadStatusEnum.QUEUED)
     downloaded_bytes: Optional[int] = Field()
+    dispatch_id: Optional[str] = Field(default=None)
 
     item_id: Optional[uuid_pkg.UUID] = Field(foreign_key="item.id")
     item: Optional["Item"] = Relationship(back_populates="tasks")
@@ -155,101 +188,17 @@ class DownloadTask(SQLModel, table=True):
         logging.debug("===========================After save")
 
 
-def download(session: Session, id: str, task: DownloadTask, s3):
-    final_filename = None
-    final_filepath = ""
-
-    def yt_dlp_monitor(d):
-        nonlocal final_filename
-        nonlocal final_filepath
-        if d.get("status") == "finished":
-            final_filename = d.get("info_dict").get("filepath")
-            final_filepath = (
-                d.get("info_dict").get("__files_to_move").get(final_filename)
-            )
-
-    def progress_hook(d: dict):
-        task.set_downloaded_bytes(session, d["downloaded_bytes"])
-        task.item.set_total_bytes(session, d["total_bytes"])
-
-    try:
-        ydl_opts = {
-            "extract_flat": "discard_in_playlist",
-            "final_ext": "mp3",
-            "format": "ba",
-            "fragment_retries": 10,
-            "ffmpeg_location": "/opt/bin/ffmpeg",
-            "ignoreerrors": "only_download",
-            "outtmpl": {"default": "/tmp/ytdlp/%(title)s.%(ext)s"},
-            "postprocessors": [
-                {
-                    "key": "FFmpegExtractAudio",
-                    "nopostoverwrites": False,
-                    "preferredcodec": "mp3",
-                    "preferredquality": "5",
-                },
-                {"key": "FFmpegConcat", "only_multi_video": True, "when": "playlist"},
-            ],
-            "retries": 10,
-            "postprocessor_hooks": [yt_dlp_monitor],
-            "progress_hooks": [progress_hook],
-        }
-        logging.debug("===========================Before task set session")
-        task.set(session, state=DownloadStatusEnum.PROCESSING)
-        logging.debug("===========================After task set session")
-        with yt_dlp.YoutubeDL(ydl_opts) as ydl:
-            info = ydl.extract_info(
-                f"https://www.youtube.com/watch?v={id}", download=False
-            )
-            duration = info.get("duration")
-            if duration > 600:
-                task.set(session, state=DownloadStatusEnum.ERROR_TOO_LONG)
-                raise Exception("duration too long")
-
-            task.set(session, title=info.get("title"))
-            ydl.download(f"https://www.youtube.com/watch?v={id}")
-
-            # os.remove(final_filepath)
-            # raise Exception("stop")
-
-            logging.debug("Download complete")
-            logging.debug(f"End filename: ${final_filename}")
-            logging.debug(f"End filepath: ${final_filepath}")
-            remote_key = f"public/{id}/{final_filename}"
-            task.item.set(
-                session,
-                name=final_filename,
-                remote_key=remote_key,
-            )
-            s3.upload_file(final_filepath, os.environ["YTDL_BUCKET_NAME"], remote_key)
-            task.set(
-                session,
-                title=final_filename,
-                state=DownloadStatusEnum.DONE,
-            )
-            os.remove(final_filepath)
-            return
-
-    except yt_dlp.utils.DownloadError as err:
-        logging.error("Download error")
-        logging.error(err)
-        if err.msg.rfind("Video unavailable") != -1:
-            task.set(session, state=DownloadStatusEnum.ERROR_NOT_FOUND)
-        else:
-            task.set(session, state=DownloadStatusEnum.ERROR_DOWNLOAD)
-    except Exception as err:
-        errm = f"Other errors: {err.__class__.__name__} {err}"
-        logging.error(errm)
-        task.set(session, state=DownloadStatusEnum.ERROR_UNKNOWN)
-        task.set_downloaded_bytes(session, 0)
-
-
-def handler(event, context):
+def load_task(session: Session, event: dict) -> DownloadTask:
     id = event["id"]
     task_data = event["task"]
     item_data = event["item"]
     user_data = event["user"]
-    session = Session(engine)
+
+    if task_data.get("id") is not None:
+        task = DownloadTask.get(session, UUID(task_data["id"]))
+        if task is not None:
+            return task
+
     logging.debug("===========================Before item")
     # item = Item.parse_obj(item_data)
     user = User.get_by_username(session, user_data["username"])
@@ -275,25 +224,96 @@ def handler(event, context):
         item=item,
         item_id=item.id,
     )
+    task.save(session)
     logging.debug("===========================After task")
+    return task
 
-    import pprint
 
-    # pprint.pprint(task)
-    # pprint.pprint(item)
-    # pprint.pprint(user)
+def run_job(event: dict) -> dict:
+    """Run one download job, see ``execute`` for the returned status"""
+    id = event["id"]
+    session = Session(engine)
     try:
-        download(session, id, task, s3)
-        print("Done")
-        return {"statusCode": 200}
-
-    except Exception as e:
-        # print(e)
-        return {"statusCode": 500}
+        task = load_task(session, event)
+        job = DownloadJob(id, task.id, task.item_id, event.get("dispatched_at"))
+        return execute(session, job, SETTINGS, warm=warm, storage=storage, bus=bus)
+    except Exception:
+        logging.exception(f"Job for {id} failed")
+        return {"id": id, "status": "retry"}
     finally:
         session.close()
 
 
+def parse_jobs(event: dict):
+    """Normalize an event into ``(identifier, job)`` pairs.
+
+    Accepts a single job payload, ``{"jobs": [...]}`` from the API, or an SQS
+    event whose record bodies are job payloads.
+    """
+    if "Records" in event:
+        return [(r["messageId"], json.loads(r["body"])) for r in event["Records"]]
+    if "jobs" in event:
+        return [(job["id"], job) for job in event["jobs"]]
+    return [(event["id"], event)]
+
+
+def reinvoke(function_name: str):
+    """Send jobs back to this function the way the API does"""
+
+    def invoke(jobs: List[dict]):
+        event = jobs[0] if len(jobs) == 1 else {"jobs": jobs}
+        lambda_client.invoke(
+            FunctionName=function_name,
+            InvocationType="Event",
+            Payload=json.dumps(event),
+        )
+
+    return invoke
+
+
+def handler(event, context):
+    container = warm.begin_invocation()
+    jobs = parse_jobs(event)
+    workers = max(1, min(BATCH_CONCURRENCY, len(jobs)))
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        results = list(pool.map(run_job, [job for _, job in jobs]))
+    print("Done")
+    if "Records" not in event:
+        # only SQS redelivers failed jobs, the API's invokes are retried here
+        with Session(engine) as session:
+            retry_jobs(
+                session,
+                [job for _, job in jobs],
+                results,
+                invoke=reinvoke(context.function_name),
+                max_attempts=MAX_ATTEMPTS,
+            )
+    container.update(warm.end_invocation())
+    logging.info(f"Container metrics: {container}")
+
+    if "Records" not in event and "jobs" not in event:
+        result = results[0]
+        status_code = 500 if result["status"] == "retry" else 200
+        return {
+            "statusCode": status_code,
+            "metrics": result.get("metrics"),
+            "container": container,
+        }
+
+    # SQS partial batch response, only retryable jobs are redelivered
+    failures = [
+        {"itemIdentifier": identifier}
+        for (identifier, _), result in zip(jobs, results)
+        if result["status"] == "retry" and "Records" in event
+    ]
+    return {
+        "statusCode": 200,
+        "batchItemFailures": failures,
+        "results": results,
+        "container": container,
+    }
+
+
 event_str = """{
   "id": "OIBODIPC_8Y",
   "user": {
@@ -321,7 +341,5 @@ event_str = """{
 }"""
 
 if __name__ == "__main__":
-    import json
-
     event = json.loads(event_str)
     handler(event, {})
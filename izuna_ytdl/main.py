@@ -1,4 +1,9 @@
-from fastapi import FastAPI
+import hmac
+from typing import Annotated
+
+from fastapi import FastAPI, Header, HTTPException, status
+from . import caches, config, events
+from .storage import presigned
 from .router.user import router as user_router
 from .router.downloader import router as downloader_router
 
@@ -8,6 +13,26 @@ app.include_router(user_router, prefix="/api/user")
 app.include_router(downloader_router, prefix="/api/downloader")
 
 
+@app.on_event("startup")
+def start_listeners():
+    events.start_listener()
+    caches.start_listener()
+
+
+@app.on_event("shutdown")
+def stop_listeners():
+    events.stop_listener()
+    caches.stop_listener()
+
+
 @app.get("/")
 def main_route():
     return "running"
+
+
+@app.get("/stats")
+def cache_stats(x_master_token: Annotated[str, Header()]):
+    """Hit rates of the caches of this process, for MASTER_TOKEN holders"""
+    if not hmac.compare_digest(x_master_token, config.MASTER_TOKEN):
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN)
+    return {**caches.stats(), "presign": presigned.cache.stats()}
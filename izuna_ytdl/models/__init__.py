@@ -4,3 +4,6 @@
 from .user import User
 from .item import Item
 from .download_task import DownloadTask
+from .job import Job
+from .task_tombstone import TaskTombstone
+from .user_usage import UserUsage
@@ -1,26 +1,58 @@
 import datetime
-from typing import Optional, TYPE_CHECKING
+import functools
+from dataclasses import dataclass
+from typing import List, Optional, Tuple, TYPE_CHECKING
 import uuid as uuid_pkg
 from uuid import UUID
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
 from sqlmodel import Field, SQLModel, Session, select, Relationship
-from enum import StrEnum
+from sqlmodel.sql.sqltypes import GUID
+
+from izuna_ytdl.caches import forget_on_commit, task_summaries
+
+# defined next to the executor tables so the Lambda bundle shares it
+from izuna_ytdl.executor.tables import DownloadStatusEnum
+from izuna_ytdl.executor.usage import ACTIVE_STATES, add_usage, state_change
+
+from .item import Item
+from .task_tombstone import TaskTombstone
+from .user_usage import UserUsage
 
 if TYPE_CHECKING:
-    from .item import Item
     from .user import User
 
 
-class DownloadStatusEnum(StrEnum):
-    QUEUED = "0"
-    PROCESSING = "1"
-    DONE = "2"
-    ERROR_UNKNOWN = "3"
-    ERROR_TOO_LONG = "4"
-    ERROR_DOWNLOAD = "5"
-    ERROR_NOT_FOUND = "6"
+@dataclass
+class RequestedTask:
+    """Outcome of DownloadTask.request"""
+
+    task_count: int
+    item_id: Optional[UUID] = None
+    item_created: bool = False
+    task_id: Optional[UUID] = None
+    task_created: bool = False
+    state: Optional[DownloadStatusEnum] = None
+
+    def over_quota(self, limit: int) -> bool:
+        return not self.task_created and self.task_count > limit
 
 
 class DownloadTask(SQLModel, table=True):
+    # back the per-user task listing and its delta sync, see page()/changed()
+    __table_args__ = (
+        # one task per user and video, DownloadTask.request relies on it
+        sa.UniqueConstraint(
+            "created_by_id", "item_id", name="uq_downloadtask_created_by_id_item_id"
+        ),
+        sa.Index(
+            "ix_downloadtask_created_by_id_created_at", "created_by_id", "created_at"
+        ),
+        sa.Index(
+            "ix_downloadtask_created_by_id_updated_at", "created_by_id", "updated_at"
+        ),
+    )
+
     id: uuid_pkg.UUID = Field(
         primary_key=True,
         index=True,
@@ -34,14 +66,206 @@ class DownloadTask(SQLModel, table=True):
     created_at: datetime.datetime = Field(
         nullable=False, default_factory=datetime.datetime.now
     )
+    # bumped on every write, /tasks?since= returns rows changed after a point
+    updated_at: datetime.datetime = Field(
+        nullable=False,
+        default_factory=datetime.datetime.now,
+        sa_column_kwargs={"onupdate": datetime.datetime.now},
+    )
     url: str = Field()
     title: str = Field()
     state: DownloadStatusEnum = Field(default=DownloadStatusEnum.QUEUED)
     downloaded_bytes: Optional[int] = Field()
+    # request id of the asynchronous executor invocation running this task
+    dispatch_id: Optional[str] = Field(default=None)
 
     item_id: Optional[uuid_pkg.UUID] = Field(foreign_key="item.id")
     item: Optional["Item"] = Relationship(back_populates="tasks")
 
+    @staticmethod
+    def page(
+        session: Session,
+        user_id: UUID,
+        *,
+        limit: int,
+        after: Optional[Tuple[datetime.datetime, UUID]] = None,
+    ) -> List[sa.engine.Row]:
+        """One page of a user's tasks in (created_at, id) order.
+
+        Selects only the listed columns and seeks past ``after`` instead of
+        using an offset, so every page costs the same.
+        """
+        stmt = (
+            DownloadTask.listing(user_id)
+            .order_by(DownloadTask.created_at, DownloadTask.id)
+            .limit(limit)
+        )
+        if after is not None:
+            # row value comparison, so the index range scan starts at the cursor
+            stmt = stmt.where(
+                sa.tuple_(DownloadTask.created_at, DownloadTask.id) > tuple(after)
+            )
+        return session.execute(stmt).all()
+
+    @staticmethod
+    def changed(
+        session: Session, user_id: UUID, since: datetime.datetime, *, limit: int
+    ) -> List[sa.engine.Row]:
+        """A user's tasks written after ``since``, oldest change first"""
+        stmt = (
+            DownloadTask.listing(user_id)
+            .where(DownloadTask.updated_at > since)
+            .order_by(DownloadTask.updated_at, DownloadTask.id)
+            .limit(limit)
+        )
+        return session.execute(stmt).all()
+
+    @staticmethod
+    def changed_for(
+        session: Session,
+        user_ids: List[UUID],
+        since: datetime.datetime,
+        *,
+        limit: int,
+    ) -> List[sa.engine.Row]:
+        """Like changed() for several users, with created_by_id on each row"""
+        stmt = (
+            DownloadTask.listing()
+            .add_columns(DownloadTask.created_by_id)
+            .where(DownloadTask.created_by_id.in_(user_ids))
+            .where(DownloadTask.updated_at > since)
+            .order_by(DownloadTask.updated_at, DownloadTask.id)
+            .limit(limit)
+        )
+        return session.execute(stmt).all()
+
+    @staticmethod
+    def summary(session: Session, user_id: UUID) -> dict:
+        """Counts of the user's tasks by state, errors counted together"""
+        stmt = (
+            sa.select(DownloadTask.state, sa.func.count())
+            .where(DownloadTask.created_by_id == user_id)
+            .group_by(DownloadTask.state)
+        )
+        out = {"total": 0, "queued": 0, "processing": 0, "done": 0, "error": 0}
+        names = {
+            DownloadStatusEnum.QUEUED: "queued",
+            DownloadStatusEnum.PROCESSING: "processing",
+            DownloadStatusEnum.DONE: "done",
+        }
+        for state, count in session.execute(stmt):
+            out[names.get(state, "error")] += count
+            out["total"] += count
+        return out
+
+    @staticmethod
+    def links(session: Session, user_id: UUID, ids: List[UUID]) -> List[sa.engine.Row]:
+        """Title, state and remote key of the user's tasks among ``ids``.
+
+        Tasks of other users are left out, like missing ones.
+        """
+        stmt = (
+            sa.select(
+                DownloadTask.id, DownloadTask.title, DownloadTask.state, Item.remote_key
+            )
+            .select_from(DownloadTask)
+            .outerjoin(Item, DownloadTask.item_id == Item.id)
+            .where(DownloadTask.created_by_id == user_id)
+            .where(DownloadTask.id.in_(ids))
+        )
+        return session.execute(stmt).all()
+
+    @staticmethod
+    def exports(session: Session, user_id: UUID) -> List[sa.engine.Row]:
+        """The user's downloaded tasks with their stored object, oldest first"""
+        stmt = (
+            sa.select(
+                DownloadTask.title,
+                Item.id.label("item_id"),
+                Item.created_at,
+                Item.remote_key,
+                Item.stored_bytes,
+                Item.crc32,
+            )
+            .select_from(DownloadTask)
+            .join(Item, DownloadTask.item_id == Item.id)
+            .where(DownloadTask.created_by_id == user_id)
+            .where(DownloadTask.state == DownloadStatusEnum.DONE)
+            .where(Item.remote_key != "")
+            .order_by(DownloadTask.created_at, DownloadTask.id)
+        )
+        return session.execute(stmt).all()
+
+    @staticmethod
+    def listing(user_id: Optional[UUID] = None) -> sa.sql.Select:
+        stmt = (
+            sa.select(
+                DownloadTask.id,
+                DownloadTask.url,
+                DownloadTask.state,
+                DownloadTask.downloaded_bytes,
+                Item.total_bytes,
+                DownloadTask.title,
+                DownloadTask.created_at,
+                DownloadTask.updated_at,
+            )
+            .select_from(DownloadTask)
+            .outerjoin(Item, DownloadTask.item_id == Item.id)
+        )
+        if user_id is not None:
+            stmt = stmt.where(DownloadTask.created_by_id == user_id)
+        return stmt
+
+    @staticmethod
+    def request(
+        session: Session,
+        user_id: UUID,
+        username: str,
+        video_id: str,
+        url: str,
+        *,
+        limit: int,
+        admit: bool = True,
+    ) -> RequestedTask:
+        """Find or create the user's task for ``video_id``, and its item.
+
+        Both rows are inserted with ON CONFLICT DO NOTHING, so concurrent
+        requests for one video end up with one item and one task per user.
+        Nothing is inserted when the user has more than ``limit`` tasks. A
+        new task is created done on a downloaded item, otherwise queued.
+        Without ``admit`` only tasks that need no new download are created:
+        on a downloaded item or one another task is downloading.
+
+        On PostgreSQL the quota, both inserts and the lookup are a single
+        statement. A row inserted by a concurrent transaction is not visible
+        to that statement's snapshot, it is read by one retry. SQLite looks
+        the task up first and runs the inserts only when it is missing.
+        """
+        params = _RequestStatements.params(
+            user_id, username, video_id, url, limit, admit
+        )
+        dialect_name = session.get_bind().dialect.name
+        statements = _request_statements(dialect_name)
+        if dialect_name == "postgresql":
+            for _ in range(2):
+                row = session.execute(statements.postgresql_text, params).one()
+                res = RequestedTask(
+                    task_count=row.task_count,
+                    item_id=row.item_id,
+                    item_created=row.item_created,
+                    task_id=row.task_id,
+                    task_created=row.task_created,
+                    state=row.state,
+                )
+                if res.task_id is not None or res.task_count > limit:
+                    break
+        else:
+            res = statements.run(session, params)
+        if res.task_created:
+            forget_on_commit(session, task_summaries, str(user_id))
+        session.commit()
+        return res
+
     @staticmethod
     def get(session: Session, id: UUID):
         res = session.exec(select(DownloadTask).where(DownloadTask.id == id))
@@ -49,9 +273,50 @@ class DownloadTask(SQLModel, table=True):
 
     def save(self, session: Session):
         session.add(self)
+        change = self._usage_change(session)
+        session.flush()
+        if change is not None:
+            add_usage(session, self.created_by_id, **change)
         session.commit()
         session.refresh(self)
 
+    def delete(self, session: Session):
+        with session.no_autoflush:
+            change = state_change(self.state, None, self._total_bytes())
+        user_id = self.created_by_id
+        session.add(TaskTombstone(id=self.id, created_by_id=user_id))
+        session.delete(self)
+        session.flush()
+        add_usage(session, user_id, **change)
+        # a queued download nobody runs anymore, the next request claims it
+        session.execute(
+            sa.update(Item)
+            .where(Item.download_task_id == self.id)
+            .values(download_task_id=None, download_claimed_at=None)
+        )
+        session.commit()
+
+    def _total_bytes(self) -> Optional[int]:
+        return self.item.total_bytes if self.item is not None else None
+
+    def _usage_change(self, session: Session) -> Optional[dict]:
+        """Counter deltas of the pending insert or state change, if any"""
+        insp = sa.inspect(self)
+        history = insp.attrs.state.history
+        if insp.persistent and not history.has_changes():
+            return None
+        with session.no_autoflush:
+            if not insp.persistent:
+                old = None
+            elif history.deleted:
+                old = history.deleted[0]
+            else:
+                # set while expired, the previous value was never loaded
+                old = session.exec(
+                    select(DownloadTask.state).where(DownloadTask.id == self.id)
+                ).one()
+            return state_change(old, self.state, self._total_bytes())
+
     def set_state(self, session: Session, state: DownloadStatusEnum):
         self.state = state
         self.save(session)
@@ -64,3 +329,272 @@ class DownloadTask(SQLModel, table=True):
         for k, v in kwargs.items():
             setattr(self, k, v)
         self.save(session)
+
+
+class _RequestStatements:
+    """Statements of DownloadTask.request, built once per dialect.
+
+    Every value is a bound parameter, see params(). SQLAlchemy cannot cache
+    ON CONFLICT clauses, so the PostgreSQL statement is compiled once into a
+    text clause here instead of on every request. SQLite gets the same
+    behaviour from cacheable INSERT OR IGNORE statements.
+    """
+
+    def __init__(self, dialect_name: str):
+        self.dialect_name = dialect_name
+        self.task = DownloadTask.__table__
+        self.item = Item.__table__
+        self.user_id = sa.bindparam("user_id", type_=GUID())
+        self.video_id = sa.bindparam("video_id", type_=sa.String())
+        self.new_item_id = sa.bindparam("new_item_id", type_=GUID())
+
+        self.usage = UserUsage.__table__
+        # the maintained counter, a primary key read instead of count(*)
+        self.task_count = sa.func.coalesce(
+            sa.select(self.usage.c.task_count)
+            .where(self.usage.c.user_id == self.user_id)
+            .scalar_subquery(),
+            sa.literal_column("0"),
+        )
+        self.under_quota = self.task_count <= sa.bindparam("limit", type_=sa.Integer)
+
+    @staticmethod
+    def params(user_id, username, video_id, url, limit, admit=True) -> dict:
+        return {
+            "user_id": user_id,
+            "username": username,
+            "video_id": video_id,
+            "url": url,
+            "limit": limit,
+            "admit": admit,
+            "now": datetime.datetime.now(),
+            "new_item_id": uuid_pkg.uuid4(),
+            "new_task_id": uuid_pkg.uuid4(),
+        }
+
+    def insert(self, table, *index_elements):
+        if self.dialect_name == "postgresql":
+            return postgresql.insert(table).on_conflict_do_nothing(
+                index_elements=index_elements
+            )
+        return sa.insert(table).prefix_with("OR IGNORE")
+
+    def item_insert(self):
+        now = sa.bindparam("now", type_=sa.DateTime())
+        url = sa.bindparam("url", type_=sa.String())
+        return self.insert(self.item, "video_id").from_select(
+            [
+                "id",
+                "name",
+                "video_id",
+                "created_by_username",
+                "created_at",
+                "original_url",
+                "original_query",
+                "remote_key",
+            ],
+            sa.select(
+                self.new_item_id,
+                sa.literal_column("''"),
+                self.video_id,
+                sa.bindparam("username", type_=sa.String()),
+                now,
+                url,
+                url,
+                sa.literal_column("''"),
+            )
+            .where(self.under_quota)
+            .where(sa.bindparam("admit", type_=sa.Boolean())),
+        )
+
+    def task_insert(self, item):
+        """Insert of the task on the video's row of ``item``"""
+        now = sa.bindparam("now", type_=sa.DateTime())
+        created = item.c.id == self.new_item_id
+        # a video not downloaded yet is waited for, see Item.claim
+        downloaded = item.c.remote_key != sa.literal_column("''")
+        # without admit only tasks that start no download of their own
+        admitted = (
+            sa.bindparam("admit", type_=sa.Boolean())
+            | downloaded
+            | item.c.download_task_id.is_not(None)
+        )
+        return self.insert(self.task, "created_by_id", "item_id").from_select(
+            [
+                "id",
+                "created_by_id",
+                "item_id",
+                "created_at",
+                "updated_at",
+                "url",
+                "title",
+                "state",
+            ],
+            sa.select(
+                sa.bindparam("new_task_id", type_=GUID()),
+                self.user_id,
+                item.c.id,
+                now,
+                now,
+                sa.bindparam("url", type_=sa.String()),
+                sa.case((created, sa.literal_column("''")), else_=item.c.name),
+                sa.case(
+                    (downloaded, sa.literal_column(f"'{DownloadStatusEnum.DONE}'")),
+                    else_=sa.literal_column(f"'{DownloadStatusEnum.QUEUED}'"),
+                ),
+            )
+            .select_from(item)
+            .where(item.c.video_id == self.video_id)
+            .where(self.under_quota)
+            .where(admitted),
+        )
+
+    def own_task(self, item):
+        return (self.task.c.item_id == item.c.id) & (
+            self.task.c.created_by_id == self.user_id
+        )
+
+    def lookup(self) -> sa.sql.Select:
+        """Quota count with the video's item and the user's task, one row"""
+        quota = sa.select(self.task_count.label("task_count")).subquery("quota")
+        return sa.select(
+            quota.c.task_count,
+            self.item.c.id.label("item_id"),
+            self.task.c.id.label("task_id"),
+            self.task.c.state,
+            self.item.c.total_bytes,
+        ).select_from(
+            quota.outerjoin(self.item, self.item.c.video_id == self.video_id).outerjoin(
+                self.task, self.own_task(self.item)
+            )
+        )
+
+    def run(self, session: Session, params: dict) -> RequestedTask:
+        """Lookup, then inserts only when the task is missing, for dialects
+        other than PostgreSQL"""
+        row = session.execute(self.lookup(), params).one()
+        item_created = task_created = False
+        if row.task_id is None and row.task_count <= params["limit"]:
+            res = session.execute(self.item_insert(), params)
+            item_created = res.rowcount == 1
+            res = session.execute(self.task_insert(self.item), params)
+            task_created = res.rowcount == 1
+            row = session.execute(self.lookup(), params).one()
+            if task_created:
+                add_usage(
+                    session,
+                    params["user_id"],
+                    **state_change(None, row.state, row.total_bytes),
+                )
+        return RequestedTask(
+            task_count=row.task_count,
+            item_id=row.item_id,
+            item_created=item_created,
+            task_id=row.task_id,
+            task_created=task_created,
+            state=row.state,
+        )
+
+    def postgresql(self) -> sa.sql.Select:
+        """All of it as one statement of data-modifying CTEs"""
+        item, task = self.item, self.task
+        columns = (
+            "id",
+            "name",
+            "video_id",
+            "total_bytes",
+            "remote_key",
+            "download_task_id",
+        )
+        new_item = (
+            self.item_insert()
+            .returning(*(item.c[name] for name in columns))
+            .cte("new_item")
+        )
+        # a new item is not visible to the item scan of the same statement
+        found_item = sa.union_all(
+            sa.select(*(item.c[name] for name in columns)).where(
+                item.c.video_id == self.video_id
+            ),
+            sa.select(*(new_item.c[name] for name in columns)),
+        ).cte("found_item")
+        new_task = (
+            self.task_insert(found_item)
+            .returning(task.c.id, task.c.state)
+            .cte("new_task")
+        )
+        quota = sa.select(self.task_count.label("task_count")).cte("quota")
+        return (
+            sa.select(
+                quota.c.task_count,
+                found_item.c.id.label("item_id"),
+                (found_item.c.id == self.new_item_id).label("item_created"),
+                sa.func.coalesce(new_task.c.id, task.c.id).label("task_id"),
+                new_task.c.id.is_not(None).label("task_created"),
+                sa.func.coalesce(new_task.c.state, task.c.state).label("state"),
+            )
+            .select_from(
+                quota.outerjoin(found_item, sa.true())
+                .outerjoin(new_task, sa.true())
+                .outerjoin(task, self.own_task(found_item))
+            )
+            .add_cte(self.usage_upsert(new_task, found_item))
+        )
+
+    def usage_upsert(self, new_task, found_item) -> sa.sql.expression.CTE:
+        """Counts a new task into the owner's counters, see UserUsage"""
+        usage = self.usage
+        done = new_task.c.state == sa.literal_column(f"'{DownloadStatusEnum.DONE}'")
+        active = new_task.c.state.in_(
+            [sa.literal_column(f"'{state}'") for state in ACTIVE_STATES]
+        )
+        counts = sa.select(
+            self.user_id,
+            sa.literal_column("1"),
+            sa.case((active, sa.literal_column("1")), else_=sa.literal_column("0")),
+            sa.case(
+                (
+                    done,
+                    sa.func.coalesce(found_item.c.total_bytes, sa.literal_column("0")),
+                ),
+                else_=sa.literal_column("0"),
+            ),
+        ).select_from(new_task.join(found_item, sa.true()))
+        insert = postgresql.insert(usage).from_select(
+            ["user_id", "task_count", "active_count", "bytes_stored"], counts
+        )
+        return insert.on_conflict_do_update(
+            index_elements=["user_id"],
+            set_={
+                name: usage.c[name] + insert.excluded[name]
+                for name in ("task_count", "active_count", "bytes_stored")
+            },
+        ).cte("counted")
+
+    @functools.cached_property
+    def postgresql_text(self) -> sa.sql.expression.TextClause:
+        stmt = self.postgresql()
+        compiled = stmt.compile(dialect=postgresql.dialect(paramstyle="named"))
+        return (
+            sa.text(str(compiled))
+            .bindparams(*compiled.binds.values())
+            .columns(*(sa.column(c.key, c.type) for c in stmt.selected_columns))
+        )
+
+
+@functools.lru_cache(maxsize=None)
+def _request_statements(dialect_name: str) -> _RequestStatements:
+    return _RequestStatements(dialect_name)
+
+
+@sa.event.listens_for(DownloadTask, "after_insert")
+@sa.event.listens_for(DownloadTask, "after_delete")
+def _forget_task_summary(mapper, connection, target: DownloadTask):
+    session = sa.orm.object_session(target)
+    forget_on_commit(session, task_summaries, str(target.created_by_id))
+
+
+@sa.event.listens_for(DownloadTask, "after_update")
+def _forget_changed_task_summary(mapper, connection, target: DownloadTask):
+    if sa.inspect(target).attrs.state.history.has_changes():
+        _forget_task_summary(mapper, connection, target)
@@ -1,8 +1,12 @@
 import datetime
-from typing import List, TYPE_CHECKING
+from typing import List, Optional, TYPE_CHECKING
+from uuid import UUID
 import uuid as uuid_pkg
+import sqlalchemy as sa
 from sqlmodel import Field, SQLModel, Relationship, Session
 
+from izuna_ytdl.executor.claim import claim_item
+
 if TYPE_CHECKING:
     from .download_task import DownloadTask
 
@@ -26,6 +30,18 @@ class Item(SQLModel, table=True):
     original_query: str = Field(nullable=False)
     remote_key: str = Field(nullable=False)
     total_bytes: int | None
+    # task whose download fills remote_key, other tasks on the item wait for
+    # it instead of downloading the video again, see Item.claim
+    download_task_id: Optional[uuid_pkg.UUID] = Field(default=None)
+    download_claimed_at: Optional[datetime.datetime] = Field(default=None)
+
+    # size and CRC-32 of the stored object, filled in by library exports
+    stored_bytes: Optional[int] = Field(
+        default=None, sa_column=sa.Column(sa.BigInteger(), nullable=True)
+    )
+    crc32: Optional[int] = Field(
+        default=None, sa_column=sa.Column(sa.BigInteger(), nullable=True)
+    )
 
     tasks: List["DownloadTask"] = Relationship(back_populates="item")
 
@@ -42,3 +58,31 @@ class Item(SQLModel, table=True):
         for k, v in kwargs.items():
             setattr(self, k, v)
         self.save(session)
+
+    @staticmethod
+    def claim_holder(session: Session, item_id: UUID, *, ttl: int) -> Optional[UUID]:
+        """The task whose claim on the item is younger than ``ttl``, if any"""
+        fresh = datetime.datetime.now() - datetime.timedelta(seconds=ttl)
+        return session.execute(
+            sa.select(Item.download_task_id).where(
+                (Item.id == item_id) & (Item.download_claimed_at >= fresh)
+            )
+        ).scalar()
+
+    @staticmethod
+    def claim(
+        session: Session,
+        item_id: UUID,
+        task_id: UUID,
+        *,
+        ttl: int,
+        reentrant: bool = False,
+    ) -> bool:
+        """Make ``task_id`` the one task downloading the item.
+
+        False when the item is downloaded already or another task claimed it
+        less than ``ttl`` seconds ago, or this one did unless ``reentrant``.
+        A caller that gets True dispatches the download, everyone else waits
+        for it.
+        """
+        return claim_item(session, item_id, task_id, ttl=ttl, reentrant=reentrant)
@@ -0,0 +1,213 @@
+import datetime
+from enum import StrEnum
+from typing import List, Optional
+import uuid as uuid_pkg
+from uuid import UUID
+import sqlalchemy as sa
+from sqlalchemy.orm.attributes import set_committed_value
+from sqlmodel import Field, SQLModel, Session, select
+
+from .download_task import DownloadTask
+
+
+class JobStateEnum(StrEnum):
+    QUEUED = "queued"
+    LEASED = "leased"
+    DONE = "done"
+    FAILED = "failed"
+
+
+class Job(SQLModel, table=True):
+    """A download waiting for, or held by, a queue worker.
+
+    Workers lease jobs with ``SELECT ... FOR UPDATE SKIP LOCKED`` so several
+    of them can poll the table without handing out the same row twice. A
+    lease that is not renewed by ``heartbeat`` expires and the job becomes
+    available again.
+    """
+
+    # the lease query scans runnable jobs in available_at order
+    __table_args__ = (sa.Index("ix_job_state_available_at", "state", "available_at"),)
+
+    id: uuid_pkg.UUID = Field(
+        primary_key=True,
+        index=True,
+        nullable=False,
+        default_factory=uuid_pkg.uuid4,
+    )
+    task_id: uuid_pkg.UUID = Field(foreign_key="downloadtask.id", index=True)
+    item_id: uuid_pkg.UUID = Field(foreign_key="item.id")
+    video_id: str = Field(nullable=False)
+
+    state: JobStateEnum = Field(default=JobStateEnum.QUEUED)
+    attempts: int = Field(default=0, nullable=False)
+    max_attempts: int = Field(default=3, nullable=False)
+    available_at: datetime.datetime = Field(
+        nullable=False, default_factory=datetime.datetime.now
+    )
+    leased_by: Optional[str] = Field(default=None)
+    lease_expires_at: Optional[datetime.datetime] = Field(default=None)
+    last_error: Optional[str] = Field(default=None)
+
+    created_at: datetime.datetime = Field(
+        nullable=False, default_factory=datetime.datetime.now
+    )
+    updated_at: datetime.datetime = Field(
+        nullable=False, default_factory=datetime.datetime.now
+    )
+
+    @staticmethod
+    def enqueue(session: Session, task: DownloadTask, *, max_attempts: int = 3):
+        """Queue ``task`` unless it already has a pending or running job"""
+        job = session.exec(
+            select(Job).where(
+                (Job.task_id == task.id)
+                & Job.state.in_([JobStateEnum.QUEUED, JobStateEnum.LEASED])
+            )
+        ).first()
+        if job is not None:
+            return job
+
+        job = Job(
+            task_id=task.id,
+            item_id=task.item_id,
+            video_id=task.item.video_id,
+            max_attempts=max_attempts,
+        )
+        session.add(job)
+        session.commit()
+        session.refresh(job)
+        return job
+
+    @staticmethod
+    def lease(
+        session: Session, worker_id: str, *, limit: int = 1, lease_seconds: int = 60
+    ) -> List["Job"]:
+        """Claim up to ``limit`` runnable jobs, including ones whose lease ran out
+        with attempts left"""
+        now = datetime.datetime.now()
+        runnable = ((Job.state == JobStateEnum.QUEUED) & (Job.available_at <= now)) | (
+            (Job.state == JobStateEnum.LEASED)
+            & (Job.lease_expires_at < now)
+            & (Job.attempts < Job.max_attempts)
+        )
+        jobs = session.exec(
+            select(Job)
+            .where(runnable)
+            .order_by(Job.available_at)
+            .limit(limit)
+            .with_for_update(skip_locked=True)
+        ).all()
+        for job in jobs:
+            job.state = JobStateEnum.LEASED
+            job.leased_by = worker_id
+            job.lease_expires_at = now + datetime.timedelta(seconds=lease_seconds)
+            job.attempts += 1
+            job.updated_at = now
+            session.add(job)
+        session.commit()
+        for job in jobs:
+            session.refresh(job)
+        return jobs
+
+    @staticmethod
+    def fail_expired(session: Session, *, limit: int = 100) -> List["Job"]:
+        """Fail jobs whose last attempt's lease ran out, a worker that dies on
+        a job every time would otherwise get it back forever"""
+        now = datetime.datetime.now()
+        jobs = session.exec(
+            select(Job)
+            .where(
+                (Job.state == JobStateEnum.LEASED)
+                & (Job.lease_expires_at < now)
+                & (Job.attempts >= Job.max_attempts)
+            )
+            .limit(limit)
+            .with_for_update(skip_locked=True)
+        ).all()
+        for job in jobs:
+            job.state = JobStateEnum.FAILED
+            job.lease_expires_at = None
+            job.last_error = f"lease of {job.leased_by} expired"
+            job.updated_at = now
+            session.add(job)
+        session.commit()
+        for job in jobs:
+            session.refresh(job)
+        return jobs
+
+    @staticmethod
+    def heartbeat(
+        session: Session, ids: List[UUID], worker_id: str, *, lease_seconds: int = 60
+    ) -> int:
+        """Extend the leases ``worker_id`` still holds, returning how many"""
+        if not ids:
+            return 0
+        now = datetime.datetime.now()
+        res = session.execute(
+            sa.update(Job)
+            .where(
+                Job.id.in_(ids)
+                & (Job.state == JobStateEnum.LEASED)
+                & (Job.leased_by == worker_id)
+            )
+            .values(
+                lease_expires_at=now + datetime.timedelta(seconds=lease_seconds),
+                updated_at=now,
+            )
+        )
+        session.commit()
+        return res.rowcount
+
+    def _finish(self, session: Session, **values) -> bool:
+        # applies only while the lease this object was handed is still held,
+        # a worker whose lease ran out must not overwrite the next attempt
+        values.update(lease_expires_at=None, updated_at=datetime.datetime.now())
+        res = session.execute(
+            sa.update(Job)
+            .where(
+                (Job.id == self.id)
+                & (Job.state == JobStateEnum.LEASED)
+                & (Job.leased_by == self.leased_by)
+                & (Job.attempts == self.attempts)
+            )
+            .values(**values)
+            .execution_options(synchronize_session=False)
+        )
+        session.commit()
+        if res.rowcount != 1:
+            return False
+        for key, value in values.items():
+            # not flushed again, a later commit must not overwrite a re-lease
+            set_committed_value(self, key, value)
+        return True
+
+    def ack(self, session: Session) -> bool:
+        """Mark the job done, returning whether the lease was still held"""
+        return self._finish(session, state=JobStateEnum.DONE, last_error=None)
+
+    def fail(
+        self,
+        session: Session,
+        error: str,
+        *,
+        retry: bool = True,
+        backoff_seconds: int = 30,
+    ) -> bool:
+        """Record a failed attempt, requeued unless it was the last one.
+        Returns whether the lease was still held"""
+        if retry and self.attempts < self.max_attempts:
+            delay = backoff_seconds * 2 ** max(self.attempts - 1, 0)
+            return self._finish(
+                session,
+                state=JobStateEnum.QUEUED,
+                available_at=datetime.datetime.now()
+                + datetime.timedelta(seconds=delay),
+                last_error=error,
+            )
+        return self._finish(session, state=JobStateEnum.FAILED, last_error=error)
+
+    def save(self, session: Session):
+        session.add(self)
+        session.commit()
+        session.refresh(self)
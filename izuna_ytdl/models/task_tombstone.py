@@ -0,0 +1,33 @@
+import datetime
+from typing import List
+import uuid as uuid_pkg
+from uuid import UUID
+import sqlalchemy as sa
+from sqlmodel import Field, SQLModel, Session, select
+
+
+class TaskTombstone(SQLModel, table=True):
+    """Left behind by a deleted task so delta syncs can report the deletion"""
+
+    __table_args__ = (
+        sa.Index(
+            "ix_tasktombstone_created_by_id_deleted_at", "created_by_id", "deleted_at"
+        ),
+    )
+
+    # id of the deleted task
+    id: uuid_pkg.UUID = Field(primary_key=True, nullable=False)
+    created_by_id: uuid_pkg.UUID = Field(foreign_key="user.id")
+    deleted_at: datetime.datetime = Field(
+        nullable=False, default_factory=datetime.datetime.now
+    )
+
+    @staticmethod
+    def since(session: Session, user_id: UUID, since: datetime.datetime) -> List[UUID]:
+        res = session.exec(
+            select(TaskTombstone.id).where(
+                (TaskTombstone.created_by_id == user_id)
+                & (TaskTombstone.deleted_at > since)
+            )
+        )
+        return res.all()
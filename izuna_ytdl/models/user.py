@@ -1,8 +1,13 @@
 import datetime
 from typing import List, TYPE_CHECKING
 import uuid as uuid_pkg
+import sqlalchemy as sa
+from sqlalchemy.orm import ORMExecuteState
 from sqlmodel import Field, SQLModel, Session, select, Relationship
 from izuna_ytdl.auth import verify_password, hash_password
+from izuna_ytdl.caches import forget_on_commit, users
+
+from .user_usage import UserUsage
 
 if TYPE_CHECKING:
     from .download_task import DownloadTask
@@ -29,6 +34,7 @@ class User(SQLModel, table=True):
         u = User(username=username)
         u.set_password(password_plain)
         session.add(u)
+        session.add(UserUsage(user_id=u.id))
         session.commit()
         return u
 
@@ -45,3 +51,21 @@ class User(SQLModel, table=True):
     def set_password(self, password_plain: str):
         p = hash_password(password_plain)
         self.password_hash = p
+
+
+@sa.event.listens_for(User, "after_update")
+@sa.event.listens_for(User, "after_delete")
+def _forget_cached_user(mapper, connection, target: User):
+    session = sa.orm.object_session(target)
+    history = sa.inspect(target).attrs.username.history
+    for username in [target.username, *(history.deleted or ())]:
+        forget_on_commit(session, users, username)
+
+
+@sa.event.listens_for(sa.orm.Session, "do_orm_execute")
+def _forget_cached_users(state: ORMExecuteState):
+    # bulk statements don't say which users they touch
+    if (state.is_update or state.is_delete) and (
+        state.statement.table.name == User.__tablename__
+    ):
+        forget_on_commit(state.session, users, None)
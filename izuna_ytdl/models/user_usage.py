@@ -0,0 +1,93 @@
+import uuid as uuid_pkg
+from uuid import UUID
+import sqlalchemy as sa
+from sqlmodel import Field, SQLModel, Session, select
+
+from izuna_ytdl.executor.usage import COLUMNS, insert_ignore, recount
+
+
+class UserUsage(SQLModel, table=True):
+    """Counters of a user's tasks, kept in step with every task write.
+
+    Quota checks read this row by primary key instead of counting tasks.
+    Writers apply deltas in their own transaction through
+    ``executor.usage.add_usage``, reconcile() corrects any drift.
+    """
+
+    user_id: uuid_pkg.UUID = Field(primary_key=True, foreign_key="user.id")
+    task_count: int = Field(default=0, nullable=False)
+    # tasks queued or processing
+    active_count: int = Field(default=0, nullable=False)
+    # total_bytes of the items behind the user's done tasks
+    bytes_stored: int = Field(
+        default=0, sa_column=sa.Column(sa.BigInteger(), nullable=False, default=0)
+    )
+
+    @staticmethod
+    def get(session: Session, user_id: UUID) -> "UserUsage":
+        """The user's counters, all zero for a user without a row yet"""
+        usage = session.get(UserUsage, user_id)
+        return usage if usage is not None else UserUsage(user_id=user_id)
+
+    @staticmethod
+    def reconcile(session: Session, *, batch: int = 1000) -> int:
+        """Recount every user's counters from their tasks, returning how many
+        had drifted.
+
+        Counters and counts are read by one statement per batch of users and
+        the difference is added rather than the count written, so a task
+        written concurrently is not lost from either side.
+        """
+        from .user import User
+
+        # rows start at zero, the drift pass below counts them
+        missing = sa.select(
+            User.id, *(sa.literal_column("0") for _ in COLUMNS[1:])
+        ).where(~sa.exists().where(UserUsage.user_id == User.id))
+        dialect_name = session.get_bind().dialect.name
+        session.execute(insert_ignore(dialect_name).from_select(COLUMNS, missing))
+        session.commit()
+
+        table = UserUsage.__table__
+        columns = COLUMNS[1:]
+        drifted = 0
+        after = None
+        while True:
+            ids_stmt = select(UserUsage.user_id).order_by(UserUsage.user_id)
+            if after is not None:
+                ids_stmt = ids_stmt.where(UserUsage.user_id > after)
+            ids = session.exec(ids_stmt.limit(batch)).all()
+            if not ids:
+                break
+            after = ids[-1]
+
+            counts = recount(ids).subquery()
+            rows = session.execute(
+                sa.select(
+                    table.c.user_id,
+                    *(
+                        sa.func.coalesce(counts.c[name], 0) - table.c[name]
+                        for name in columns
+                    ),
+                )
+                .select_from(
+                    table.outerjoin(counts, counts.c.user_id == table.c.user_id)
+                )
+                .where(table.c.user_id.in_(ids))
+            ).all()
+            for user_id, *deltas in rows:
+                if not any(deltas):
+                    continue
+                drifted += 1
+                session.execute(
+                    sa.update(table)
+                    .where(table.c.user_id == user_id)
+                    .values(
+                        {
+                            name: table.c[name] + delta
+                            for name, delta in zip(columns, deltas)
+                        }
+                    )
+                )
+            session.commit()
+        return drifted
@@ -1,32 +1,60 @@
 import os
-from typing import Annotated, Optional, List
+import base64
+import datetime
+from typing import Annotated, Dict, Literal, Optional, List, Tuple
 from uuid import UUID
-from fastapi import APIRouter, Depends, status, HTTPException, BackgroundTasks
-from fastapi.responses import PlainTextResponse, JSONResponse
-from sqlmodel import Session, select
+from fastapi import (
+    APIRouter,
+    Depends,
+    status,
+    HTTPException,
+    BackgroundTasks,
+    Header,
+    Query,
+)
+from fastapi.responses import (
+    PlainTextResponse,
+    JSONResponse,
+    Response,
+    StreamingResponse,
+)
+from sqlmodel import Session
+from starlette.concurrency import run_in_threadpool
 import sqlalchemy as sa
-from pydantic import BaseModel, HttpUrl, validator, parse_obj_as
-import boto3
-from botocore.exceptions import ClientError
+from pydantic import BaseModel, Field, HttpUrl, validator, parse_obj_as
 from urllib.parse import parse_qs
 import logging
+import mimetypes
 
 import pprint
 import json
 import time
 import yt_dlp
 
-from izuna_ytdl.models import User, DownloadTask, Item
+from izuna_ytdl.models import User, DownloadTask, Item, Job, TaskTombstone, UserUsage
 from izuna_ytdl.database import get_session
-from izuna_ytdl import auth, config
+from izuna_ytdl import auth, config, events
+from izuna_ytdl.caches import task_summaries
+from izuna_ytdl.admission import Rejection, admission
+from izuna_ytdl.backends import get_backend
+from izuna_ytdl.export import library_archive
 from izuna_ytdl.models.download_task import DownloadStatusEnum
+from izuna_ytdl.storage import (
+    LocalStorage,
+    StorageError,
+    file_response,
+    parse_range,
+    presigned,
+    storage,
+)
 
 router = APIRouter()
-s3 = boto3.client("s3")
-lambda_client = boto3.client("lambda")
 
 # logging.getLogger().setLevel(logging.DEBUG)
 
+TASKS_PAGE_SIZE = 100
+TASKS_MAX_PAGE_SIZE = 500
+
 
 class DownloadTaskOut(BaseModel):
     id: UUID
@@ -37,31 +65,181 @@ class DownloadTaskOut(BaseModel):
     title: Optional[str]
 
 
-@router.get("/tasks")
+def encode_cursor(created_at: datetime.datetime, id: UUID) -> str:
+    raw = f"{created_at.isoformat()}|{id}".encode()
+    return base64.urlsafe_b64encode(raw).decode()
+
+
+def decode_cursor(cursor: str) -> Tuple[datetime.datetime, UUID]:
+    try:
+        created_at, id = base64.urlsafe_b64decode(cursor).decode().split("|")
+        return datetime.datetime.fromisoformat(created_at), UUID(id)
+    except ValueError:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST, detail="invalid cursor"
+        )
+
+
+def task_out(row) -> dict:
+    return events.progress.apply(
+        {
+            "id": str(row.id),
+            "url": row.url,
+            "state": row.state,
+            "downloaded_bytes": row.downloaded_bytes,
+            "total_bytes": row.total_bytes,
+            "title": row.title,
+        }
+    )
+
+
+def watermark() -> str:
+    # backed off so writes that committed late, or came from a host with a
+    # slightly different clock, are picked up by the next sync
+    overlap = datetime.timedelta(milliseconds=config.TASKS_SYNC_OVERLAP_MS)
+    return (datetime.datetime.now() - overlap).isoformat()
+
+
+@router.get("/tasks", response_model=List[DownloadTaskOut])
 def get_tasks(
     session: Annotated[Session, Depends(get_session)],
     user: Annotated[User, Depends(auth.get_login_user)],
+    limit: Annotated[int, Query(ge=1, le=TASKS_MAX_PAGE_SIZE)] = TASKS_PAGE_SIZE,
+    cursor: Optional[str] = None,
+    since: Optional[str] = None,
+):
+    """A page of the caller's tasks, oldest first.
+
+    When more tasks follow, the ``X-Next-Cursor`` response header holds the
+    ``cursor`` for the next page. ``X-Watermark`` of the first page can be
+    passed as ``since`` later to get only what changed, see task_changes.
+    """
+    if since is not None:
+        return task_changes(session, user, since)
+
+    mark = watermark()
+    after = decode_cursor(cursor) if cursor else None
+    rows = DownloadTask.page(session, user.id, limit=limit + 1, after=after)
+
+    headers = {"X-Watermark": mark}
+    if len(rows) > limit:
+        rows = rows[:limit]
+        headers["X-Next-Cursor"] = encode_cursor(rows[-1].created_at, rows[-1].id)
+    return JSONResponse([task_out(row) for row in rows], headers=headers)
+
+
+@router.get("/tasks/summary")
+def get_tasks_summary(
+    session: Annotated[Session, Depends(get_session)],
+    user: Annotated[User, Depends(auth.get_login_user)],
 ):
-    tasks = session.exec(
-        select(DownloadTask, Item)
-        .join(Item, isouter=True)
-        .where(DownloadTask.created_by == user)
+    """Counts of the caller's tasks by state, cached per user"""
+    return task_summaries.get(
+        str(user.id), lambda: DownloadTask.summary(session, user.id)
     )
 
-    results: List[DownloadTaskOut] = []
-    for task, item in tasks:
-        out = DownloadTaskOut(
-            id=task.id,
-            url=task.url,
-            downloaded_bytes=task.downloaded_bytes,
-            state=task.state,
-            title=task.title,
+
+def task_changes(session: Session, user: User, since: str):
+    """Tasks written and ids of tasks deleted after the ``since`` watermark.
+
+    The response carries the watermark for the next call. A client that
+    fell too far behind gets 410 and should reload the full listing.
+    """
+    try:
+        since_at = datetime.datetime.fromisoformat(since)
+    except ValueError:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST, detail="invalid since"
         )
-        if item is not None:
-            out.total_bytes = item.total_bytes
-        results.append(out)
 
-    return results
+    mark = watermark()
+    rows = DownloadTask.changed(
+        session, user.id, since_at, limit=TASKS_MAX_PAGE_SIZE + 1
+    )
+    if len(rows) > TASKS_MAX_PAGE_SIZE:
+        raise HTTPException(
+            status_code=status.HTTP_410_GONE,
+            detail="too many changes, reload the task list",
+        )
+    deleted = TaskTombstone.since(session, user.id, since_at)
+    return JSONResponse(
+        {
+            "tasks": [task_out(row) for row in rows],
+            "deleted": [str(id) for id in deleted],
+            "watermark": mark,
+        }
+    )
+
+
+@router.get("/events")
+async def get_events(
+    session: Annotated[Session, Depends(get_session)],
+    user: Annotated[User, Depends(auth.get_login_user)],
+    last_event_id: Annotated[Optional[str], Header()] = None,
+):
+    """Server-sent events with the caller's task changes as they happen.
+
+    Every ``task`` event carries the task's state and byte counts, its id is
+    the change time. A reconnecting client sends it back as ``Last-Event-ID``
+    and first gets what changed while it was away. When that is too much to
+    replay a ``reset`` event asks it to reload ``/tasks`` instead.
+    """
+    user_id = user.id
+    queue = events.hub.subscribe(user_id)
+    backlog = []
+    try:
+        if last_event_id:
+            backlog = await run_in_threadpool(
+                resume_events, session, user_id, last_event_id
+            )
+    except BaseException:
+        events.hub.unsubscribe(user_id, queue)
+        raise
+    finally:
+        # the stream may stay open for hours, it must not hold a connection
+        session.close()
+
+    return StreamingResponse(
+        events.event_stream(events.hub, user_id, queue, backlog),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+def resume_events(session: Session, user_id: UUID, last_event_id: str):
+    try:
+        since = datetime.datetime.fromisoformat(last_event_id)
+    except ValueError:
+        since = None
+    rows = []
+    if since is not None:
+        overlap = datetime.timedelta(milliseconds=config.TASKS_SYNC_OVERLAP_MS)
+        rows = DownloadTask.changed(
+            session, user_id, since - overlap, limit=TASKS_MAX_PAGE_SIZE + 1
+        )
+    if since is None or len(rows) > TASKS_MAX_PAGE_SIZE:
+        return [{"reset": True, "updated_at": watermark()}]
+    return [events.task_event(row) for row in rows]
+
+
+@router.delete("/tasks/{id}")
+def delete_task(
+    session: Annotated[Session, Depends(get_session)],
+    user: Annotated[User, Depends(auth.get_login_user)],
+    id: UUID,
+):
+    task = DownloadTask.get(session, id)
+    if task is None or task.created_by_id != user.id:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND, detail="task not found"
+        )
+    if task.state == DownloadStatusEnum.PROCESSING:
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT, detail="task is being downloaded"
+        )
+    session.execute(sa.delete(Job).where(Job.task_id == task.id))
+    task.delete(session)
+    return JSONResponse({"success": True, "message": "Task deleted"})
 
 
 @router.get("/retrieve", response_model=str)
@@ -77,19 +255,149 @@ def get_download_link(
         )
 
     try:
-        res = s3.generate_presigned_url(
-            "get_object",
-            Params={"Bucket": config.BUCKET_NAME, "Key": task.item.remote_key},
-            ExpiresIn=600,
-        )
+        res = presigned.presign(task.item.remote_key, user.id)
         return PlainTextResponse(content=res, status_code=status.HTTP_201_CREATED)
-    except ClientError:
+    except StorageError:
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail="s3 url generate error",
         )
 
 
+class RetrieveBatchIn(BaseModel):
+    ids: List[UUID] = Field(min_items=1, max_items=config.RETRIEVE_BATCH_MAX)
+
+
+def task_links(
+    session: Session, user: User, ids: List[UUID]
+) -> Tuple[List[dict], Dict[str, str]]:
+    """Download links of the user's tasks among ``ids``, in request order,
+    and the reason each other id has none"""
+    ids = list(dict.fromkeys(ids))
+    rows = {row.id: row for row in DownloadTask.links(session, user.id, ids)}
+    links, errors = [], {}
+    for id in ids:
+        row = rows.get(id)
+        if row is None:
+            errors[str(id)] = "task not found"
+        elif row.state != DownloadStatusEnum.DONE or not row.remote_key:
+            errors[str(id)] = "task not downloaded"
+        else:
+            try:
+                url = presigned.presign(row.remote_key, user.id)
+            except StorageError:
+                errors[str(id)] = "s3 url generate error"
+                continue
+            links.append({"id": str(id), "title": row.title, "url": url})
+    return links, errors
+
+
+def m3u_playlist(links: List[dict]) -> str:
+    lines = ["#EXTM3U"]
+    for link in links:
+        title = " ".join(link["title"].split())
+        lines += [f"#EXTINF:-1,{title}", link["url"]]
+    return "\n".join(lines) + "\n"
+
+
+@router.post("/retrieve/batch")
+def get_download_links(
+    session: Annotated[Session, Depends(get_session)],
+    user: Annotated[User, Depends(auth.get_login_user)],
+    body: RetrieveBatchIn,
+    format: Literal["json", "manifest", "m3u"] = "json",
+):
+    """Download links of several tasks, loaded in one query.
+
+    ``json`` maps task ids to links and lists the ids without one under
+    ``errors``, ``manifest`` and ``m3u`` are playlists of the links in request
+    order for media players.
+    """
+    links, errors = task_links(session, user, body.ids)
+    if format == "m3u":
+        return PlainTextResponse(m3u_playlist(links), media_type="audio/x-mpegurl")
+    if format == "manifest":
+        return {"items": links, "errors": errors}
+    return {"links": {link["id"]: link["url"] for link in links}, "errors": errors}
+
+
+@router.get("/export")
+def export_library(
+    session: Annotated[Session, Depends(get_session)],
+    user: Annotated[User, Depends(auth.get_login_user)],
+    range: Annotated[Optional[str], Header()] = None,
+    if_range: Annotated[Optional[str], Header()] = None,
+):
+    """ZIP of every downloaded task, streamed a chunk at a time from storage.
+
+    Entries are stored uncompressed, so the archive size is known up front
+    and an interrupted download resumes with a Range request. ``ETag``
+    changes when the library does, a stale ``If-Range`` gets the whole
+    archive again.
+    """
+    try:
+        archive = library_archive(session, storage, user.id)
+    except StorageError:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail="storage error",
+        )
+    etag = f'"{archive.etag}"'
+    headers = {
+        "Accept-Ranges": "bytes",
+        "ETag": etag,
+        "Content-Disposition": f'attachment; filename="{user.username}.zip"',
+    }
+    if if_range is not None and if_range != etag:
+        range = None
+    try:
+        byte_range = parse_range(range, archive.size)
+    except ValueError:
+        return Response(
+            status_code=status.HTTP_416_REQUESTED_RANGE_NOT_SATISFIABLE,
+            headers={**headers, "Content-Range": f"bytes */{archive.size}"},
+        )
+    status_code = status.HTTP_200_OK
+    start, end = 0, archive.size - 1
+    if byte_range is not None:
+        status_code = status.HTTP_206_PARTIAL_CONTENT
+        start, end = byte_range
+        headers["Content-Range"] = f"bytes {start}-{end}/{archive.size}"
+    headers["Content-Length"] = str(end - start + 1)
+    return StreamingResponse(
+        archive.iter_range(start, end),
+        status_code=status_code,
+        media_type="application/zip",
+        headers=headers,
+    )
+
+
+@router.get("/files/{key:path}")
+def get_file(
+    key: str,
+    expires: int,
+    sig: str,
+    range: Annotated[Optional[str], Header()] = None,
+):
+    # links handed out by /retrieve when files are kept on local disk
+    if not isinstance(storage, LocalStorage):
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND)
+    if not storage.verify(key, expires, sig):
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN, detail="invalid or expired link"
+        )
+    try:
+        path = storage.path(key)
+    except StorageError:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND)
+    if not os.path.isfile(path):
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND, detail="file not found"
+        )
+    media_type = mimetypes.guess_type(key)[0] or "application/octet-stream"
+    return file_response(path, range, media_type)
+
+
 class DownloadIn(BaseModel):
     url: HttpUrl
 
@@ -135,90 +443,91 @@ def post_download(
     background_tasks: BackgroundTasks,
     params: DownloadIn,
 ):
-    stmt = (
-        sa.select(sa.func.count())
-        .select_from(DownloadTask)
-        .where(DownloadTask.created_by == user)
+    video_id = params.get_video_id()
+    usage = UserUsage.get(session, user.id)
+    rejected = admission.check_storage(usage)
+    if rejected is not None:
+        raise_rejection(rejected)
+    # a full queue still lets users add videos that are already downloaded
+    rejected = admission.check_download(session, usage)
+
+    # quota, item and task resolved in one go, see DownloadTask.request
+    res = DownloadTask.request(
+        session,
+        user.id,
+        user.username,
+        video_id,
+        str(params.url),
+        limit=config.MAX_USER_TASK,
+        admit=rejected is None,
     )
-    task_count = session.scalar(stmt)
-    if task_count > config.MAX_USER_TASK:
+    if res.over_quota(config.MAX_USER_TASK):
         raise HTTPException(
             status_code=status.HTTP_429_TOO_MANY_REQUESTS,
             detail=f"Task exceeded limit of {config.MAX_USER_TASK}",
         )
+    if res.task_id is None and rejected is not None:
+        raise_rejection(rejected)
+
+    if res.task_created and res.state == DownloadStatusEnum.DONE:
+        logging.debug(
+            f"No task found for {user.username}"
+            f"but item with vid id {video_id} exists"
+            ". Associating..."
+        )
+        return JSONResponse(
+            {
+                "success": True,
+                "message": "Item exists for queried item."
+                "Associated user's data to the item",
+            },
+            status_code=status.HTTP_201_CREATED,
+        )
 
-    video_id = params.get_video_id()
+    if res.state == DownloadStatusEnum.DONE:
+        return JSONResponse(
+            {
+                "success": True,
+                "message": "Item have been downloaded",
+            },
+            status_code=status.HTTP_200_OK,
+        )
 
-    task = session.exec(
-        select(DownloadTask)
-        .join(Item)
-        .where((DownloadTask.created_by == user) & (Item.video_id == video_id))
-    ).first()
-    print(task)
-    print("======There is task for this user")
-    if task is None:
-        item = session.exec(select(Item).where(Item.video_id == video_id)).first()
-        print(item)
-
-        if item is not None:
-            logging.debug(
-                f"No task found for {user.username}"
-                f"but item with vid id {item.video_id} exists"
-                ". Associating..."
-            )
-            newTask = DownloadTask(
-                created_by=user,
-                title=item.name,
-                item=item,
-                url=params.url,
-                state=DownloadStatusEnum.DONE,
-            )
-            newTask.save(session)
-            return JSONResponse(
-                {
-                    "success": True,
-                    "message": "Item exists for queried item."
-                    "Associated user's data to the item",
-                },
-                status_code=status.HTTP_201_CREATED,
-            )
-        else:
-            print("========There is item for this video ID")
-        logging.debug("No task found. Creating and queueing")
-        newItem = Item(
-            created_by_username=user.username,
-            name="",
-            original_query=params.url,
-            original_url=params.url,
-            remote_key="",
-            video_id=video_id,
+    if res.state not in (DownloadStatusEnum.QUEUED, DownloadStatusEnum.PROCESSING):
+        logging.debug(f"Existing task state is {res.state}")
+        if rejected is not None:
+            # requeueing is a new download too
+            raise_rejection(rejected)
+        DownloadTask.get(session, res.task_id).set_state(
+            session, DownloadStatusEnum.QUEUED
         )
-        newItem.save(session)
-        newTask = DownloadTask(
-            item=newItem,
-            title="",
-            url=params.url,
-            created_by=user,
+
+    if rejected is not None:
+        holder = Item.claim_holder(
+            session, res.item_id, ttl=config.DOWNLOAD_CLAIM_SECONDS
         )
-        newTask.save(session)
-        background_tasks.add_task(download, session, video_id, newTask)
-    else:
-        logging.debug("Existing task found. Checking")
-        if task.state == DownloadStatusEnum.QUEUED:
-            logging.debug("Existing task found and queued. Executing")
-            background_tasks.add_task(download, session, video_id, task)
-        elif task.state == DownloadStatusEnum.DONE:
-            return JSONResponse(
-                {
-                    "success": True,
-                    "message": "Item have been downloaded",
-                },
-                status_code=status.HTTP_200_OK,
-            )
-        else:
-            logging.debug(f"Existing task state is {task.state}")
-            task.set_state(session, DownloadStatusEnum.QUEUED)
-            background_tasks.add_task(download, session, video_id, task)
+        # over the limits users may only wait for another task's download
+        if holder is None or holder == res.task_id:
+            raise_rejection(rejected)
+    # one download per video, every other task on it waits and is settled
+    # with the downloading one. A queued task holding the claim is
+    # dispatched again, its earlier dispatch may have been lost
+    if rejected is not None or not Item.claim(
+        session,
+        res.item_id,
+        res.task_id,
+        ttl=config.DOWNLOAD_CLAIM_SECONDS,
+        reentrant=res.state != DownloadStatusEnum.PROCESSING,
+    ):
+        return JSONResponse(
+            {
+                "success": True,
+                "message": f"Waiting for the download of {video_id} in progress",
+            },
+            status_code=status.HTTP_202_ACCEPTED,
+        )
+    task = DownloadTask.get(session, res.task_id)
+    queue_download(session, background_tasks, video_id, task)
 
     return JSONResponse(
         {"success": True, "message": f"Queueing download task for Youtube {video_id}"},
@@ -226,6 +535,29 @@ def post_download(
     )
 
 
+def raise_rejection(rejected: Rejection):
+    headers = None
+    if rejected.retry_after is not None:
+        headers = {"Retry-After": str(rejected.retry_after)}
+    raise HTTPException(
+        status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+        detail=rejected.detail,
+        headers=headers,
+    )
+
+
+def queue_download(
+    session: Session,
+    background_tasks: BackgroundTasks,
+    video_id: str,
+    task: DownloadTask,
+):
+    if config.JOB_QUEUE_ENABLED:
+        Job.enqueue(session, task, max_attempts=config.JOB_MAX_ATTEMPTS)
+    else:
+        background_tasks.add_task(download, session, video_id, task)
+
+
 def download(session: Session, id: str, task: DownloadTask):
     task_json = task.json()
     user_json = task.created_by.json()
@@ -240,100 +572,11 @@ def download(session: Session, id: str, task: DownloadTask):
     }
     # pprint.pprint(payload, indent=4)
     payload["task"]["id"] = str(task.id)
+    payload["dispatched_at"] = time.time()
     session.commit()
     session.close()
-    try:
-        response = lambda_client.invoke(
-            FunctionName="ytdl_executor", Payload=json.dumps(payload)
-        )
-        logging.info(f"AWS Lambda function invoked for id {id}")
-    except ClientError:
-        logging.exception(f"AWS Lambda function failed to be invoked for id {id}")
+    backend.submit(payload)
     return
 
 
-# def download(session: Session, id: str, task: DownloadTask):
-#     final_filename = None
-#     final_filepath = ""
-
-#     def yt_dlp_monitor(d):
-#         nonlocal final_filename
-#         nonlocal final_filepath
-#         if d.get("status") == "finished":
-#             final_filename = d.get("info_dict").get("filepath")
-#             final_filepath = (
-#                 d.get("info_dict").get("__files_to_move").get(final_filename)
-#             )
-
-#     def progress_hook(d: dict):
-#         task.set_downloaded_bytes(session, d["downloaded_bytes"])
-#         task.item.set_total_bytes(session, d["total_bytes"])
-
-#     try:
-#         ydl_opts = {
-#             "extract_flat": "discard_in_playlist",
-#             "final_ext": "mp3",
-#             "format": "ba",
-#             "fragment_retries": 10,
-#             "ignoreerrors": "only_download",
-#             "outtmpl": {"default": "%(title)s.%(ext)s"},
-#             "postprocessors": [
-#                 {
-#                     "key": "FFmpegExtractAudio",
-#                     "nopostoverwrites": False,
-#                     "preferredcodec": "mp3",
-#                     "preferredquality": "5",
-#                 },
-#                 {"key": "FFmpegConcat", "only_multi_video": True, "when": "playlist"},
-#             ],
-#             "retries": 10,
-#             "postprocessor_hooks": [yt_dlp_monitor],
-#             "progress_hooks": [progress_hook],
-#         }
-#         task.set(session, state=DownloadStatusEnum.PROCESSING)
-
-#         with yt_dlp.YoutubeDL(ydl_opts) as ydl:
-#             info = ydl.extract_info(
-#                 f"https://www.youtube.com/watch?v={id}", download=False
-#             )
-#             duration = info.get("duration")
-#             if duration > 600:
-#                 task.set(session, state=DownloadStatusEnum.ERROR_TOO_LONG)
-#                 raise Exception("duration too long")
-
-#             task.set(session, title=info.get("title"))
-#             ydl.download(f"https://www.youtube.com/watch?v={id}")
-
-#             # os.remove(final_filepath)
-#             # raise Exception("stop")
-
-#             logging.debug("Download complete")
-#             logging.debug(f"End filename: ${final_filename}")
-#             logging.debug(f"End filepath: ${final_filepath}")
-#             remote_key = f"public/{id}/{final_filename}"
-#             task.item.set(
-#                 session,
-#                 name=final_filename,
-#                 remote_key=remote_key,
-#             )
-#             s3.upload_file(final_filepath, config.BUCKET_NAME, remote_key)
-#             task.set(
-#                 session,
-#                 title=final_filename,
-#                 state=DownloadStatusEnum.DONE,
-#             )
-#             os.remove(final_filepath)
-#             return
-
-#     except yt_dlp.utils.DownloadError as err:
-#         logging.error("Download error")
-#         logging.error(err)
-#         if err.msg.rfind("Video unavailable") != -1:
-#             task.set(session, state=DownloadStatusEnum.ERROR_NOT_FOUND)
-#         else:
-#             task.set(session, state=DownloadStatusEnum.ERROR_DOWNLOAD)
-#     except Exception as err:
-#         errm = f"Other errors: {err.__class__.__name__} {err}"
-#         logging.error(errm)
-#         task.set(session, state=DownloadStatusEnum.ERROR_UNKNOWN)
-#         task.set_downloaded_bytes(session, 0)
+backend = get_backend(config.EXECUTOR_BACKEND)
@@ -6,6 +6,7 @@ from fastapi.responses import JSONResponse, PlainTextResponse
 from pydantic import BaseModel
 from typing import Annotated
 from sqlmodel import Session
+from starlette.concurrency import run_in_threadpool
 from .. import auth, config
 
 from izuna_ytdl.database import get_session
@@ -20,15 +21,30 @@ class Login(BaseModel):
 
 
 @router.post("/token")
-def user_post_token(
+async def user_post_token(
     session: Annotated[Session, Depends(get_session)],
     form_data: Annotated[OAuth2PasswordRequestForm, Depends()],
 ):
-    user = User.get_by_username(session, username=form_data.username)
-    if user is None or not user.is_password_match(form_data.password):
+    user = await run_in_threadpool(
+        User.get_by_username, session, username=form_data.username
+    )
+    try:
+        # on the hashing pool, so a login spike leaves the threadpool alone
+        matched = user is not None and await auth.hashing.run(
+            auth.verify_password, user.password_hash, form_data.password
+        )
+    except auth.HashingBusy:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="too many logins, retry shortly",
+            headers={"Retry-After": "1"},
+        )
+    if not matched:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED, detail="invalid login credentials"
         )
+    if auth.needs_rehash(user.password_hash):
+        await rehash_password(session, user, form_data.password)
 
     fingerprint = auth.generate_fingerprint()
     access_token = auth.create_access_token(
@@ -46,6 +62,22 @@ def user_post_token(
     return resp
 
 
+async def rehash_password(session: Session, user: User, password: str):
+    """Hash the password again with the current Argon2 parameters, which
+    can only happen while it is known at login"""
+    try:
+        user.password_hash = await auth.hashing.run(auth.hash_password, password)
+    except auth.HashingBusy:
+        # done on a later login
+        return
+
+    def save():
+        session.add(user)
+        session.commit()
+
+    await run_in_threadpool(save)
+
+
 class UserOut(BaseModel):
     username: str
 
@@ -57,6 +89,7 @@ def user_me(user: Annotated[User, Depends(auth.get_login_user)]) -> UserOut:
 
 @router.post("/logout")
 def user_logout(user: Annotated[User, Depends(auth.get_login_user)]):
+    auth.forget_user(user.username)
     resp = PlainTextResponse("user logged out")
     resp.set_cookie(
         "__Secure-Fgp",
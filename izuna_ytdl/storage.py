@@ -0,0 +1,104 @@
+import os
+import re
+from typing import Iterator, Optional, Tuple
+
+import boto3
+from fastapi import Response
+from fastapi.responses import FileResponse, StreamingResponse
+
+from izuna_ytdl import config
+from izuna_ytdl.cache import PresignCache
+from izuna_ytdl.executor.storage import (  # noqa: F401
+    LocalStorage,
+    ObjectStat,
+    S3Storage,
+    Storage,
+    StorageError,
+)
+
+RANGE_RE = re.compile(r"bytes=(\d*)-(\d*)")
+CHUNK_SIZE = 64 * 1024
+
+
+def make_storage() -> Storage:
+    if config.STORAGE_BACKEND == "local":
+        return LocalStorage(
+            config.STORAGE_ROOT,
+            base_url=config.STORAGE_BASE_URL,
+            secret=config.STORAGE_SECRET,
+        )
+    return S3Storage(boto3.client("s3"), config.BUCKET_NAME)
+
+
+storage = make_storage()
+presigned = PresignCache(
+    storage,
+    expires_in=config.PRESIGN_EXPIRES_SECONDS,
+    margin=config.PRESIGN_CACHE_MARGIN_SECONDS,
+    size=config.PRESIGN_CACHE_SIZE,
+)
+
+
+def parse_range(header: Optional[str], size: int) -> Optional[Tuple[int, int]]:
+    """Inclusive byte range asked for by a single-range Range header.
+
+    Returns None when the whole file should be sent, which includes
+    multi-range requests, and raises ValueError when it can't be satisfied.
+    """
+    if not header:
+        return None
+    m = RANGE_RE.fullmatch(header.strip())
+    if m is None or m.groups() == ("", ""):
+        return None
+    start, end = m.groups()
+    if start == "":
+        # suffix range, the last N bytes
+        length = int(end)
+        if length == 0 or size == 0:
+            raise ValueError("empty suffix range")
+        return max(size - length, 0), size - 1
+    start = int(start)
+    end = min(int(end), size - 1) if end else size - 1
+    if start >= size or start > end:
+        raise ValueError("range not satisfiable")
+    return start, end
+
+
+def iter_file(path: str, start: int, end: int) -> Iterator[bytes]:
+    with open(path, "rb") as f:
+        f.seek(start)
+        remaining = end - start + 1
+        while remaining > 0:
+            data = f.read(min(CHUNK_SIZE, remaining))
+            if not data:
+                break
+            remaining -= len(data)
+            yield data
+
+
+def file_response(path: str, range_header: Optional[str], media_type: str):
+    """Serve a local file, honouring a byte Range header.
+
+    Whole files go through FileResponse, which uses the server's zero-copy
+    send when it has one.
+    """
+    size = os.stat(path).st_size
+    headers = {"Accept-Ranges": "bytes"}
+    try:
+        byte_range = parse_range(range_header, size)
+    except ValueError:
+        return Response(
+            status_code=416, headers={**headers, "Content-Range": f"bytes */{size}"}
+        )
+    if byte_range is None:
+        return FileResponse(path, media_type=media_type, headers=headers)
+
+    start, end = byte_range
+    headers["Content-Range"] = f"bytes {start}-{end}/{size}"
+    headers["Content-Length"] = str(end - start + 1)
+    return StreamingResponse(
+        iter_file(path, start, end),
+        status_code=206,
+        media_type=media_type,
+        headers=headers,
+    )
@@ -0,0 +1,190 @@
+import os
+import socket
+import signal
+import logging
+import argparse
+import threading
+from concurrent.futures import ThreadPoolExecutor, Future, wait, FIRST_COMPLETED
+from typing import Dict, Optional
+from uuid import UUID
+
+from sqlmodel import Session
+
+from izuna_ytdl import config
+from izuna_ytdl.database import engine
+from izuna_ytdl.models import Job
+from izuna_ytdl.models.job import JobStateEnum
+from izuna_ytdl.executor.download import (
+    DownloadJob,
+    ExecutorSettings,
+    execute,
+    abandon_task,
+    set_task,
+)
+from izuna_ytdl.executor.bus import ProgressBus, bus_from_env
+from izuna_ytdl.executor.storage import Storage, storage_from_env
+from izuna_ytdl.executor.tables import DownloadStatusEnum
+from izuna_ytdl.executor.warm import WarmContainer, DEFAULT_CACHE_DIR
+
+
+class Worker:
+    """Runs queued jobs from the job table, ``concurrency`` at a time.
+
+    Leases are renewed from a heartbeat thread while downloads run, so a
+    worker that dies lets its jobs expire back to the queue.
+    """
+
+    def __init__(
+        self,
+        settings: ExecutorSettings,
+        *,
+        concurrency: int = config.WORKER_CONCURRENCY,
+        lease_seconds: int = config.JOB_LEASE_SECONDS,
+        poll_interval_ms: int = config.WORKER_POLL_INTERVAL_MS,
+        backoff_seconds: int = config.JOB_RETRY_BACKOFF_SECONDS,
+        worker_id: Optional[str] = None,
+        storage: Optional[Storage] = None,
+        warm: Optional[WarmContainer] = None,
+        bus: Optional[ProgressBus] = None,
+    ):
+        self.settings = settings
+        self.concurrency = concurrency
+        self.lease_seconds = lease_seconds
+        self.poll_interval = poll_interval_ms / 1000
+        self.backoff_seconds = backoff_seconds
+        self.worker_id = worker_id or f"{socket.gethostname()}:{os.getpid()}"
+        self.storage = storage or storage_from_env()
+        self.bus = bus or bus_from_env(engine)
+        self.warm = warm or WarmContainer(
+            settings.ydl_opts(),
+            cache_dir=os.environ.get("YTDL_CACHE_DIR", DEFAULT_CACHE_DIR),
+        )
+
+        self._stop = threading.Event()
+        self._inflight: Dict[Future, UUID] = {}
+        self._lock = threading.Lock()
+
+    def process(self, job: Job) -> str:
+        """Run one leased job and ack or fail it, returning the outcome, "lost"
+        when its lease expired meanwhile"""
+        with Session(engine) as session:
+            try:
+                result = execute(
+                    session,
+                    DownloadJob(job.video_id, job.task_id, job.item_id),
+                    self.settings,
+                    warm=self.warm,
+                    storage=self.storage,
+                    bus=self.bus,
+                )
+            except Exception as err:
+                logging.exception(f"Job {job.id} crashed")
+                session.rollback()
+                result = {"status": "retry", "error": repr(err)}
+
+            status = result["status"]
+            if status in ("ok", "skipped"):
+                if not job.ack(session):
+                    return self._lost(job)
+                return status
+            error = result.get("error") or f"download ended as {result['state'].name}"
+            held = job.fail(
+                session,
+                error,
+                retry=status == "retry",
+                backoff_seconds=self.backoff_seconds,
+            )
+            if not held:
+                return self._lost(job)
+            if job.state == JobStateEnum.QUEUED:
+                set_task(session, job.task_id, state=DownloadStatusEnum.QUEUED)
+                return "retry"
+            return "failed"
+
+    def _lost(self, job: Job) -> str:
+        logging.warning(f"Lease of job {job.id} expired before it finished")
+        return "lost"
+
+    def fail_expired(self):
+        with Session(engine) as session:
+            for job in Job.fail_expired(session):
+                logging.warning(f"Job {job.id} failed, {job.last_error}")
+                abandon_task(session, job.task_id)
+
+    def heartbeat(self):
+        with self._lock:
+            ids = list(self._inflight.values())
+        with Session(engine) as session:
+            Job.heartbeat(
+                session, ids, self.worker_id, lease_seconds=self.lease_seconds
+            )
+
+    def _heartbeat_loop(self, finished: threading.Event):
+        # renew well before the lease runs out
+        interval = self.lease_seconds / 3
+        while not finished.wait(interval):
+            try:
+                self.heartbeat()
+            except Exception:
+                logging.exception("Job heartbeat failed")
+
+    def _reap(self, timeout: Optional[float]):
+        done, _ = wait(list(self._inflight), timeout, return_when=FIRST_COMPLETED)
+        with self._lock:
+            for f in done:
+                self._inflight.pop(f)
+
+    def run(self):
+        logging.info(f"Worker {self.worker_id} started")
+        finished = threading.Event()
+        beat = threading.Thread(
+            target=self._heartbeat_loop, args=(finished,), daemon=True
+        )
+        beat.start()
+        with ThreadPoolExecutor(self.concurrency) as pool:
+            while not self._stop.is_set():
+                free = self.concurrency - len(self._inflight)
+                jobs = []
+                if free > 0:
+                    self.fail_expired()
+                    with Session(engine, expire_on_commit=False) as session:
+                        jobs = Job.lease(
+                            session,
+                            self.worker_id,
+                            limit=free,
+                            lease_seconds=self.lease_seconds,
+                        )
+                for job in jobs:
+                    with self._lock:
+                        self._inflight[pool.submit(self.process, job)] = job.id
+
+                if jobs and len(self._inflight) < self.concurrency:
+                    continue
+                if self._inflight:
+                    self._reap(self.poll_interval)
+                else:
+                    self._stop.wait(self.poll_interval)
+            # let running downloads finish, their leases keep beating
+            while self._inflight:
+                self._reap(None)
+        finished.set()
+        logging.info(f"Worker {self.worker_id} stopped")
+
+    def stop(self, *_):
+        self._stop.set()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run queued download jobs")
+    parser.add_argument("--concurrency", type=int, default=config.WORKER_CONCURRENCY)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    worker = Worker(ExecutorSettings.from_env(), concurrency=args.concurrency)
+    signal.signal(signal.SIGTERM, worker.stop)
+    signal.signal(signal.SIGINT, worker.stop)
+    worker.run()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,285 @@
+"""Stored (uncompressed) ZIP archives streamed from storage objects.
+
+The layout of an archive only depends on the names, sizes and times of its
+entries, so any byte range of it can be produced without building the rest.
+CRCs go in the data descriptors and the central directory. They are computed
+while an entry is streamed whole, an entry cut by the start of a range has
+its CRC read beforehand unless it is already known.
+"""
+import bisect
+import datetime
+import hashlib
+import struct
+import zlib
+from dataclasses import dataclass
+from typing import Any, Callable, Iterator, List, Optional
+
+from izuna_ytdl.executor.storage import StorageError
+
+ZIP64_LIMIT = 0xFFFFFFFF
+ZIP_COUNT_LIMIT = 0xFFFF
+# CRC and sizes follow the data in a descriptor, names are UTF-8
+FLAGS = 0x08 | 0x800
+VERSION = 20
+VERSION_ZIP64 = 45
+EXTERNAL_ATTR = 0o100644 << 16
+
+LOCAL_HEADER = struct.Struct("<IHHHHHIIIHH")
+DESCRIPTOR = struct.Struct("<IIII")
+DESCRIPTOR64 = struct.Struct("<IIQQ")
+CENTRAL = struct.Struct("<IHHHHHHIIIHHHHHII")
+END64 = struct.Struct("<IQHHIIQQQQ")
+LOCATOR64 = struct.Struct("<IIQI")
+END = struct.Struct("<IHHHHIIH")
+
+
+@dataclass
+class ZipEntry:
+    name: str
+    key: str
+    size: int
+    modified: datetime.datetime
+    crc32: Optional[int] = None
+    # the caller's handle on the entry, untouched
+    ref: Any = None
+    # offset of the local header, set by ZipStream
+    offset: int = 0
+
+    @property
+    def zip64(self) -> bool:
+        return self.size >= ZIP64_LIMIT
+
+    @property
+    def name_bytes(self) -> bytes:
+        return self.name.encode()
+
+
+def dos_time(when: datetime.datetime):
+    if when.year < 1980:
+        return 0, (1 << 5) | 1
+    time = (when.hour << 11) | (when.minute << 5) | (when.second // 2)
+    date = ((when.year - 1980) << 9) | (when.month << 5) | when.day
+    return time, date
+
+
+def local_header(entry: ZipEntry) -> bytes:
+    time, date = dos_time(entry.modified)
+    size, extra = 0, b""
+    if entry.zip64:
+        size, extra = ZIP64_LIMIT, struct.pack("<HHQQ", 1, 16, 0, 0)
+    header = LOCAL_HEADER.pack(
+        0x04034B50,
+        VERSION_ZIP64 if entry.zip64 else VERSION,
+        FLAGS,
+        0,
+        time,
+        date,
+        0,
+        size,
+        size,
+        len(entry.name_bytes),
+        len(extra),
+    )
+    return header + entry.name_bytes + extra
+
+
+def descriptor(entry: ZipEntry) -> bytes:
+    fmt = DESCRIPTOR64 if entry.zip64 else DESCRIPTOR
+    return fmt.pack(0x08074B50, entry.crc32, entry.size, entry.size)
+
+
+def descriptor_size(entry: ZipEntry) -> int:
+    return (DESCRIPTOR64 if entry.zip64 else DESCRIPTOR).size
+
+
+def central_extra(entry: ZipEntry) -> bytes:
+    fields = []
+    if entry.zip64:
+        fields += [entry.size, entry.size]
+    if entry.offset >= ZIP64_LIMIT:
+        fields.append(entry.offset)
+    if not fields:
+        return b""
+    return struct.pack(f"<HH{len(fields)}Q", 1, 8 * len(fields), *fields)
+
+
+def central_size(entry: ZipEntry) -> int:
+    return CENTRAL.size + len(entry.name_bytes) + len(central_extra(entry))
+
+
+def central_record(entry: ZipEntry) -> bytes:
+    time, date = dos_time(entry.modified)
+    extra = central_extra(entry)
+    return (
+        CENTRAL.pack(
+            0x02014B50,
+            VERSION_ZIP64 if extra else VERSION,
+            VERSION_ZIP64 if extra else VERSION,
+            FLAGS,
+            0,
+            time,
+            date,
+            entry.crc32,
+            min(entry.size, ZIP64_LIMIT),
+            min(entry.size, ZIP64_LIMIT),
+            len(entry.name_bytes),
+            len(extra),
+            0,
+            0,
+            0,
+            EXTERNAL_ATTR,
+            min(entry.offset, ZIP64_LIMIT),
+        )
+        + entry.name_bytes
+        + extra
+    )
+
+
+def end_record(count: int, cd_offset: int, cd_size: int) -> bytes:
+    end = END.pack(
+        0x06054B50,
+        0,
+        0,
+        min(count, ZIP_COUNT_LIMIT),
+        min(count, ZIP_COUNT_LIMIT),
+        min(cd_size, ZIP64_LIMIT),
+        min(cd_offset, ZIP64_LIMIT),
+        0,
+    )
+    if not needs_end64(count, cd_offset, cd_size):
+        return end
+    end64_offset = cd_offset + cd_size
+    return (
+        END64.pack(
+            0x06064B50,
+            END64.size - 12,
+            VERSION_ZIP64,
+            VERSION_ZIP64,
+            0,
+            0,
+            count,
+            count,
+            cd_size,
+            cd_offset,
+        )
+        + LOCATOR64.pack(0x07064B50, 0, end64_offset, 1)
+        + end
+    )
+
+
+def needs_end64(count: int, cd_offset: int, cd_size: int) -> bool:
+    return (
+        count >= ZIP_COUNT_LIMIT or cd_offset >= ZIP64_LIMIT or cd_size >= ZIP64_LIMIT
+    )
+
+
+class ZipStream:
+    """Byte ranges of the archive of ``entries``, whose data is read with
+    ``read(entry, start, end)``.
+
+    ``on_crc`` is called with every entry whose CRC was computed, so it can
+    be kept for later ranges.
+    """
+
+    def __init__(
+        self,
+        entries: List[ZipEntry],
+        read: Callable[[ZipEntry, int, int], Iterator[bytes]],
+        *,
+        on_crc: Optional[Callable[[ZipEntry], None]] = None,
+    ):
+        self.entries = entries
+        self.read = read
+        self.on_crc = on_crc
+        # (start, length, kind, entry), only lengths are computed up front
+        self._segments = []
+        offset = 0
+        for entry in entries:
+            entry.offset = offset
+            if entry.size == 0:
+                entry.crc32 = 0
+            offset = self._add(offset, len(local_header(entry)), "header", entry)
+            offset = self._add(offset, entry.size, "data", entry)
+            offset = self._add(offset, descriptor_size(entry), "descriptor", entry)
+        self.cd_offset = offset
+        for entry in entries:
+            offset = self._add(offset, central_size(entry), "central", entry)
+        self.cd_size = offset - self.cd_offset
+        end = end_record(len(entries), self.cd_offset, self.cd_size)
+        self.size = self._add(offset, len(end), "end", None)
+        self._starts = [segment[0] for segment in self._segments]
+
+    def _add(self, offset: int, length: int, kind: str, entry) -> int:
+        if length:
+            self._segments.append((offset, length, kind, entry))
+        return offset + length
+
+    @property
+    def etag(self) -> str:
+        """Changes whenever the layout of the archive does"""
+        digest = hashlib.sha1()
+        for entry in self.entries:
+            digest.update(
+                f"{entry.name}\0{entry.key}\0{entry.size}\0"
+                f"{entry.modified.isoformat()}\0".encode()
+            )
+        return digest.hexdigest()
+
+    def _render(self, kind: str, entry: Optional[ZipEntry]) -> bytes:
+        if kind == "header":
+            return local_header(entry)
+        if kind == "descriptor":
+            return descriptor(entry)
+        if kind == "central":
+            return central_record(entry)
+        return end_record(len(self.entries), self.cd_offset, self.cd_size)
+
+    def _read(self, entry: ZipEntry, start: int, end: int) -> Iterator[bytes]:
+        remaining = end - start + 1
+        for chunk in self.read(entry, start, end):
+            remaining -= len(chunk)
+            yield chunk
+        if remaining:
+            raise StorageError(f"{entry.key} is shorter than {entry.size} bytes")
+
+    def _set_crc(self, entry: ZipEntry, crc: int):
+        entry.crc32 = crc
+        if self.on_crc is not None:
+            self.on_crc(entry)
+
+    def fill_crcs(self, start: int, end: int):
+        """Read the CRCs a range needs of entries it does not stream whole"""
+        for entry in self.entries:
+            data_start = entry.offset + len(local_header(entry))
+            if entry.crc32 is not None or data_start >= start:
+                continue
+            descriptor_start = data_start + entry.size
+            if descriptor_start > end and self.cd_offset > end:
+                continue
+            crc = 0
+            for chunk in self._read(entry, 0, entry.size - 1):
+                crc = zlib.crc32(chunk, crc)
+            self._set_crc(entry, crc)
+
+    def iter_range(self, start: int, end: int) -> Iterator[bytes]:
+        """Bytes ``start`` to ``end`` inclusive of the archive"""
+        self.fill_crcs(start, end)
+        i = bisect.bisect_right(self._starts, start) - 1
+        for seg_start, length, kind, entry in self._segments[i:]:
+            if seg_start > end:
+                break
+            lo = max(start - seg_start, 0)
+            hi = min(end - seg_start, length - 1)
+            if kind != "data":
+                yield self._render(kind, entry)[lo : hi + 1]
+                continue
+            crc = 0 if lo == 0 and entry.crc32 is None else None
+            for chunk in self._read(entry, lo, hi):
+                if crc is not None:
+                    crc = zlib.crc32(chunk, crc)
+                yield chunk
+            if crc is not None and hi == length - 1:
+                self._set_crc(entry, crc)
+
+    def __iter__(self) -> Iterator[bytes]:
+        return self.iter_range(0, self.size - 1)
@@ -52,6 +52,35 @@ class DownloadTask(JsonModel):
         self.save()
 
 
+# per-user task count, so the quota check is one GET instead of loading
+# every task. It expires so drift is recounted now and then.
+TASK_COUNT_KEY = "izuna_ytdl.usage.task_count:{}"
+TASK_COUNT_TTL = 3600
+
+# bumps an existing count only, a missing one is recounted when read
+_INCR_EXISTING = """
+if redis.call('exists', KEYS[1]) == 1 then
+    return redis.call('incr', KEYS[1])
+end
+return nil
+"""
+
+
+def count_user_tasks(username: str) -> int:
+    conn = DownloadTask.db()
+    key = TASK_COUNT_KEY.format(username)
+    count = conn.get(key)
+    if count is None:
+        count = DownloadTask.find(DownloadTask.created_by == username).count()
+        conn.set(key, count, ex=TASK_COUNT_TTL, nx=True)
+    return int(count)
+
+
+def _count_new_task(username: str):
+    conn = DownloadTask.db()
+    conn.eval(_INCR_EXISTING, 1, TASK_COUNT_KEY.format(username))
+
+
 def get_task(id: str):
     try:
         task = DownloadTask.find(DownloadTask.id == id).first()
@@ -103,6 +132,7 @@ def create_task(id: str, url: str, title: str, created_by: str):
         item=item,
     )
     task.save()
+    _count_new_task(created_by)
     # task.set_item(item)
     return task
 
@@ -122,6 +152,7 @@ def create_task_with_item(id: str, url: str, title: str, created_by: str, item:
         item=item,
     )
     task.save()
+    _count_new_task(created_by)
     # task.set_item(item)
     return task
 
@@ -140,4 +171,27 @@ def create_task_without_item(id: str, url: str, title: str, created_by: str):
         created_at=now,
     )
     task.save()
+    _count_new_task(created_by)
     return task
+
+
+def download_in_progress(id: str) -> bool:
+    """Whether a download thread is running for video ``id``, its task is
+    processing until the thread settles it"""
+    tasks = DownloadTask.find(DownloadTask.id == id).all()
+    return any(task.state == DownloadStatusEnum.PROCESSING for task in tasks)
+
+
+def settle_waiting_tasks(
+    id: str, state: DownloadStatusEnum, item: Optional[Item] = None
+):
+    """Move every user's task still waiting on the download of video ``id``
+    to its outcome"""
+    for task in DownloadTask.find(DownloadTask.id == id).all():
+        if task.state not in (DownloadStatusEnum.QUEUED, DownloadStatusEnum.PROCESSING):
+            continue
+        task.state = state
+        if item is not None:
+            task.item = item
+            task.title = item.name
+        task.save()
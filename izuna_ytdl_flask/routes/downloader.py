@@ -11,13 +11,19 @@ from flask_jwt_extended import (
     jwt_required,
     get_jwt_identity,
 )
-import boto3
-from botocore.exceptions import ClientError
-import os
 import logging
 from ...izuna_ytdl import config
-
-s3 = boto3.client("s3")
+from ...izuna_ytdl.cache import PresignCache
+from ...izuna_ytdl.executor.metrics import JobTimer
+from ...izuna_ytdl.executor.storage import StorageError, storage_from_env
+
+storage = storage_from_env()
+presigned = PresignCache(
+    storage,
+    expires_in=config.PRESIGN_EXPIRES_SECONDS,
+    margin=config.PRESIGN_CACHE_MARGIN_SECONDS,
+    size=config.PRESIGN_CACHE_SIZE,
+)
 
 
 bp = Blueprint("downloader", __name__, url_prefix="/api/downloader")
@@ -86,14 +92,10 @@ def retrieve_s3_file():
         response = jsonify({"success": False, "message": "Not found"})
         return response, 404
     try:
-        res = s3.generate_presigned_url(
-            "get_object",
-            Params={"Bucket": config.BUCKET_NAME, "Key": task.item.remote_key},
-            ExpiresIn=600,
-        )
+        res = presigned.presign(task.item.remote_key, username)
         return res
-    except ClientError as e:
-        logging.error("Client error")
+    except StorageError as e:
+        logging.error("Storage error")
         logging.error(e)
         return jsonify({"success": False, "message": "Something went wrong"}), 500
 
@@ -105,9 +107,7 @@ async def handle_download():
 
     # validate not exceeding limit
     username = get_jwt_identity()
-    tasks = DownloadTask.find(DownloadTask.created_by == username).all()
-    list_obj = [json.loads(x.json()) for x in tasks]
-    if len(list_obj) > config.MAX_USER_TASK:
+    if count_user_tasks(username) > config.MAX_USER_TASK:
         response = make_response()
         response.status_code = 429
         response.data = json.dumps(
@@ -198,6 +198,20 @@ async def handle_download():
                     }
                 )
                 return response, 200
+            if item.remote_key == "" and download_in_progress(id):
+                # downloaded for another user right now, settled with theirs
+                response = jsonify(
+                    {
+                        "success": True,
+                        "message": f"Waiting for the download of {id} in progress",
+                    }
+                )
+                return response, 202
+            if item.remote_key == "":
+                # an earlier download failed, this task downloads it again
+                x = threading.Thread(target=download, args=(id, _task))
+                x.start()
+                return responses.json_res(res, data, 202)
             _task.update_state(DownloadStatusEnum.DONE)
             response = jsonify(
                 {
@@ -243,6 +257,7 @@ async def handle_download():
 
 
 def download(id: str, task: DownloadTask):
+    timer = JobTimer()
     final_filename = None
     final_filepath = ""
 
@@ -283,15 +298,22 @@ def download(id: str, task: DownloadTask):
         task.update_state(DownloadStatusEnum.PROCESSING)
 
         with yt_dlp.YoutubeDL(ydl_opts) as ydl:
-            info = ydl.extract_info(
-                f"https://www.youtube.com/watch?v={id}", download=False
-            )
+            # reuse the unprocessed info dict for the download itself
+            with timer.stage("extract"):
+                info = ydl.extract_info(
+                    f"https://www.youtube.com/watch?v={id}",
+                    download=False,
+                    process=False,
+                )
+            timer.record("extract_saved", timer.timings["extract"])
             duration = info.get("duration")
             if duration > 600:
                 task.update_state(DownloadStatusEnum.ERROR_TOO_LONG)
+                settle_waiting_tasks(id, DownloadStatusEnum.ERROR_TOO_LONG)
                 return
             task.update_title(info.get("title"))
-            ydl.download(f"https://www.youtube.com/watch?v={id}")
+            with timer.stage("download"):
+                ydl.process_ie_result(info, download=True)
 
             # os.remove(final_filepath)
             # raise Exception("stop")
@@ -302,9 +324,11 @@ def download(id: str, task: DownloadTask):
             remote_key = f"public/{id}/{final_filename}"
             task.item.set_name(final_filename)
             task.item.set_remote_key(remote_key)
-            s3.upload_file(final_filepath, config.BUCKET_NAME, remote_key)
+            with timer.stage("upload"):
+                storage.put_file(final_filepath, remote_key)
             task.update(final_filename, DownloadStatusEnum.DONE)
-            os.remove(final_filepath)
+            settle_waiting_tasks(id, DownloadStatusEnum.DONE, task.item)
+            timer.log(id)
             return
     except yt_dlp.utils.DownloadError as err:
         logging.error("Download error")
@@ -313,7 +337,9 @@ def download(id: str, task: DownloadTask):
             task.update_state(DownloadStatusEnum.ERROR_NOT_FOUND)
         else:
             task.update_state(DownloadStatusEnum.ERROR_DOWNLOAD)
+        settle_waiting_tasks(id, task.state)
     except Exception as err:
         logging.error(f"Other errors: {err.__class__.__name__}")
         task.update_state(DownloadStatusEnum.ERROR_UNKNOWN)
         task.set_downloaded_bytes(0)
+        settle_waiting_tasks(id, DownloadStatusEnum.ERROR_UNKNOWN)
@@ -0,0 +1,96 @@
+"""Cost of auth.get_login_user with and without the user cache.
+
+Calls the dependency the way a request does: a fresh session, a JWT to
+decode and the fingerprint to check, then the user lookup. Users are drawn
+from a pool so the cache sees several keys. Seeds its own users into
+DB_CONNECTION_URL and removes them afterwards.
+
+``--rtt-ms`` adds a delay to every statement, to see the cost of round trips
+to a database server when benchmarking against SQLite.
+
+    python -m script.bench_auth --calls 5000 --rtt-ms 0.5
+"""
+import time
+import uuid
+import hashlib
+import argparse
+import datetime
+import statistics
+
+import sqlalchemy as sa
+from sqlmodel import Session, SQLModel, create_engine
+
+from izuna_ytdl import auth, config
+from izuna_ytdl.models import User
+
+
+def run(engine, logins, calls: int):
+    samples = []
+    for i in range(calls):
+        username, token, fingerprint = logins[i % len(logins)]
+        start = time.perf_counter()
+        with Session(engine) as session:
+            auth.get_login_user(session, token, fingerprint)
+        samples.append(time.perf_counter() - start)
+    samples.sort()
+    return {
+        "p50": statistics.median(samples) * 1e6,
+        "p95": samples[int(len(samples) * 0.95)] * 1e6,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--calls", type=int, default=5000)
+    parser.add_argument("--users", type=int, default=50)
+    parser.add_argument("--rtt-ms", type=float, default=0)
+    args = parser.parse_args()
+
+    engine = create_engine(config.DB_CONNECTION_URL)
+    SQLModel.metadata.create_all(engine)
+    if args.rtt_ms:
+
+        def round_trip(*_):
+            time.sleep(args.rtt_ms / 1000)
+
+        sa.event.listen(engine, "before_cursor_execute", round_trip)
+
+    tag = uuid.uuid4().hex[:6]
+    users = [
+        User(username=f"bench-{tag}-{i}", password_hash="x") for i in range(args.users)
+    ]
+    logins = []
+    for user in users:
+        fingerprint = auth.generate_fingerprint()
+        token = auth.create_access_token(
+            {
+                "sub": user.username,
+                "user_fingerprint": hashlib.sha256(fingerprint.encode()).hexdigest(),
+            },
+            expires_delta=datetime.timedelta(hours=1),
+        )
+        logins.append((user.username, token, fingerprint))
+    with Session(engine) as session:
+        session.add_all(users)
+        session.commit()
+        user_ids = [user.id for user in users]
+
+    print(f"{'cache':>6} {'p50 us':>8} {'p95 us':>8} {'hit ratio':>10}")
+    size = auth.users.local.size
+    try:
+        for name, cache_size in (("off", 0), ("on", size)):
+            auth.users.local.clear()
+            auth.users.local.size = cache_size
+            auth.users.local.hits = auth.users.local.misses = 0
+            res = run(engine, logins, args.calls)
+            ratio = auth.users.local.stats()["hit_ratio"]
+            print(f"{name:>6} {res['p50']:>8.1f} {res['p95']:>8.1f} {ratio:>10.3f}")
+    finally:
+        auth.users.local.size = size
+        with Session(engine) as session:
+            session.execute(sa.delete(User).where(User.id.in_(user_ids)))
+            session.commit()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,180 @@
+"""Latency of post_download's enqueue under concurrent requests.
+
+Compares the previous sequence of lookups and separate inserts against
+DownloadTask.request. Threads post videos drawn from a shared pool, so
+requests for the same video race. Seeds its own users into
+DB_CONNECTION_URL and removes them afterwards.
+
+``--rtt-ms`` adds a delay to every statement and commit, to see the cost of
+round trips to a database server when benchmarking against SQLite.
+
+    python -m script.bench_enqueue --threads 8 --requests 200 --rtt-ms 1
+"""
+import time
+import uuid
+import random
+import argparse
+import statistics
+import threading
+
+import sqlalchemy as sa
+from sqlalchemy.exc import IntegrityError
+from sqlmodel import Session, SQLModel, create_engine, select
+
+from izuna_ytdl import config
+from izuna_ytdl.models import DownloadTask, Item, User
+from izuna_ytdl.models.download_task import DownloadStatusEnum
+
+LIMIT = 1_000_000
+
+
+def legacy(session: Session, user: User, video_id: str, url: str):
+    task_count = session.scalar(
+        sa.select(sa.func.count())
+        .select_from(DownloadTask)
+        .where(DownloadTask.created_by_id == user.id)
+    )
+    if task_count > LIMIT:
+        return
+    task = session.exec(
+        select(DownloadTask)
+        .join(Item)
+        .where((DownloadTask.created_by_id == user.id) & (Item.video_id == video_id))
+    ).first()
+    if task is not None:
+        return
+    item = session.exec(select(Item).where(Item.video_id == video_id)).first()
+    if item is not None:
+        DownloadTask(
+            created_by_id=user.id,
+            title=item.name,
+            item=item,
+            url=url,
+            state=DownloadStatusEnum.DONE,
+        ).save(session)
+        return
+    item = Item(
+        created_by_username=user.username,
+        name="",
+        original_query=url,
+        original_url=url,
+        remote_key="",
+        video_id=video_id,
+    )
+    item.save(session)
+    DownloadTask(item=item, title="", url=url, created_by_id=user.id).save(session)
+
+
+def request(session: Session, user: User, video_id: str, url: str):
+    DownloadTask.request(session, user.id, user.username, video_id, url, limit=LIMIT)
+
+
+def run(engine, fn, users, videos, threads: int, requests: int):
+    samples, errors = [], 0
+    lock = threading.Lock()
+    barrier = threading.Barrier(threads)
+
+    def worker(seed: int):
+        nonlocal errors
+        rng = random.Random(seed)
+        barrier.wait()
+        for _ in range(requests):
+            user = rng.choice(users)
+            video_id = rng.choice(videos)
+            url = f"https://youtube.com/watch?v={video_id}"
+            with Session(engine) as session:
+                start = time.perf_counter()
+                try:
+                    fn(session, user, video_id, url)
+                    failed = 0
+                except IntegrityError:
+                    # a racing request inserted the same item or task first
+                    session.rollback()
+                    failed = 1
+                elapsed = time.perf_counter() - start
+            with lock:
+                samples.append(elapsed)
+                errors += failed
+
+    started = time.perf_counter()
+    pool = [threading.Thread(target=worker, args=(i,)) for i in range(threads)]
+    for t in pool:
+        t.start()
+    for t in pool:
+        t.join()
+    wall = time.perf_counter() - started
+    samples.sort()
+    return {
+        "p50": statistics.median(samples) * 1000,
+        "p95": samples[int(len(samples) * 0.95)] * 1000,
+        "rps": len(samples) / wall,
+        "errors": errors,
+    }
+
+
+def cleanup(engine, users, videos):
+    user_ids = [u.id for u in users]
+    with Session(engine) as session:
+        session.execute(
+            sa.delete(DownloadTask).where(DownloadTask.created_by_id.in_(user_ids))
+        )
+        session.execute(sa.delete(Item).where(Item.video_id.in_(videos)))
+        session.commit()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--threads", type=int, default=8)
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--users", type=int, default=20)
+    parser.add_argument("--videos", type=int, default=100)
+    parser.add_argument("--rtt-ms", type=float, default=0)
+    args = parser.parse_args()
+
+    if config.DB_CONNECTION_URL.startswith("sqlite"):
+        engine = create_engine(
+            config.DB_CONNECTION_URL,
+            connect_args={"check_same_thread": False, "timeout": 30},
+        )
+    else:
+        engine = create_engine(config.DB_CONNECTION_URL, pool_size=args.threads)
+    SQLModel.metadata.create_all(engine)
+    if args.rtt_ms:
+
+        def round_trip(*_):
+            time.sleep(args.rtt_ms / 1000)
+
+        sa.event.listen(engine, "before_cursor_execute", round_trip)
+        sa.event.listen(engine, "commit", round_trip)
+
+    tag = uuid.uuid4().hex[:6]
+    videos = [f"{tag}{i:05d}" for i in range(args.videos)]
+    with Session(engine) as session:
+        users = [
+            User(username=f"bench-{tag}-{i}", password_hash="x")
+            for i in range(args.users)
+        ]
+        session.add_all(users)
+        session.commit()
+        for user in users:
+            session.refresh(user)
+            session.expunge(user)
+
+    print(f"{'path':>8} {'p50 ms':>8} {'p95 ms':>8} {'req/s':>8} {'errors':>7}")
+    try:
+        for name, fn in (("legacy", legacy), ("request", request)):
+            res = run(engine, fn, users, videos, args.threads, args.requests)
+            cleanup(engine, users, videos)
+            print(
+                f"{name:>8} {res['p50']:>8.2f} {res['p95']:>8.2f}"
+                f" {res['rps']:>8.0f} {res['errors']:>7}"
+            )
+    finally:
+        cleanup(engine, users, videos)
+        with Session(engine) as session:
+            session.execute(sa.delete(User).where(User.id.in_([u.id for u in users])))
+            session.commit()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,77 @@
+"""Memory held by each open /events stream.
+
+Opens N streams the way the route does (a hub subscription and a running
+event_stream consumer) and measures the Python heap growth with tracemalloc.
+Socket buffers in the ASGI server are not included. Then publishes one event
+to every stream and times the fan-out.
+
+    python -m script.bench_events --streams 1000 5000
+"""
+import time
+import uuid
+import asyncio
+import argparse
+import tracemalloc
+
+from izuna_ytdl.events import TaskEventHub, event_stream
+
+EVENT = {
+    "id": str(uuid.uuid4()),
+    "state": "1",
+    "downloaded_bytes": 1048576,
+    "total_bytes": 4194304,
+    "title": "a title of average length for a song",
+    "updated_at": "2023-09-01T00:00:00",
+}
+
+
+async def consume(stream, received: list):
+    async for chunk in stream:
+        received.append(len(chunk))
+
+
+async def measure(count: int):
+    # no poller, events are published by hand
+    hub = TaskEventHub()
+    hub._task = asyncio.get_running_loop().create_future()
+    received = []
+
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    consumers = []
+    for _ in range(count):
+        user_id = uuid.uuid4()
+        queue = hub.subscribe(user_id)
+        stream = event_stream(hub, user_id, queue, [], heartbeat=3600)
+        consumers.append((user_id, asyncio.create_task(consume(stream, received))))
+    await asyncio.sleep(0.1)
+    held = tracemalloc.get_traced_memory()[0] - before
+    tracemalloc.stop()
+
+    start = time.perf_counter()
+    for user_id, _ in consumers:
+        hub.publish(user_id, EVENT)
+    while len(received) < 2 * count:
+        await asyncio.sleep(0)
+    fanout = time.perf_counter() - start
+
+    for _, task in consumers:
+        task.cancel()
+    await asyncio.gather(*(task for _, task in consumers), return_exceptions=True)
+    assert hub.subscribers == {}
+    return held / count, fanout * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--streams", type=int, nargs="+", default=[1000, 5000])
+    args = parser.parse_args()
+
+    print(f"{'streams':>8} {'bytes/stream':>13} {'fan-out ms':>11}")
+    for count in args.streams:
+        per_stream, fanout = asyncio.run(measure(count))
+        print(f"{count:>8} {per_stream:>13.0f} {fanout:>11.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,105 @@
+"""Throughput and memory of the library ZIP export.
+
+Uploads N objects of a given size to an S3 stand-in (moto in process, or any
+S3 compatible server given with --endpoint-url such as MinIO), then streams
+the archive of them with range GETs the way /export does. Reports MB/s and
+the peak Python heap seen by tracemalloc, which should not grow with the
+library size. A second pass resumes from the middle of the archive.
+
+    python -m script.bench_export --objects 10 100 --size-mb 4
+"""
+import os
+import time
+import argparse
+import datetime
+import tracemalloc
+import contextlib
+
+import boto3
+
+from izuna_ytdl.executor.storage import S3Storage
+from izuna_ytdl.zipstream import ZipEntry, ZipStream
+
+BUCKET = "izuna-ytdl-bench"
+
+
+@contextlib.contextmanager
+def s3_client(endpoint_url):
+    if endpoint_url:
+        yield boto3.client("s3", endpoint_url=endpoint_url)
+        return
+    import moto
+
+    # newer botocore sends aws-chunked bodies that moto does not decode
+    os.environ.setdefault("AWS_REQUEST_CHECKSUM_CALCULATION", "when_required")
+    with moto.mock_s3():
+        yield boto3.client("s3", region_name="us-east-1")
+
+
+def seed(s3, count: int, size: int):
+    data = os.urandom(size)
+    existing = s3.list_objects_v2(Bucket=BUCKET).get("KeyCount", 0)
+    for i in range(existing, count):
+        s3.put_object(Bucket=BUCKET, Key=f"bench/{i}.mp3", Body=data)
+    return [
+        ZipEntry(
+            name=f"{i}.mp3",
+            key=f"bench/{i}.mp3",
+            size=size,
+            modified=datetime.datetime(2024, 1, 1),
+        )
+        for i in range(count)
+    ]
+
+
+def stream(archive: ZipStream, start: int):
+    tracemalloc.start()
+    begin = time.perf_counter()
+    sent = 0
+    for chunk in archive.iter_range(start, archive.size - 1):
+        sent += len(chunk)
+    elapsed = time.perf_counter() - begin
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return sent / elapsed / 2**20, peak / 2**20
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--objects", type=int, nargs="+", default=[10, 100])
+    parser.add_argument("--size-mb", type=float, default=4)
+    parser.add_argument("--chunk-kb", type=int, default=64)
+    parser.add_argument("--endpoint-url")
+    args = parser.parse_args()
+    size = int(args.size_mb * 2**20)
+    chunk_size = args.chunk_kb * 1024
+
+    print(
+        f"{'objects':>8} {'archive MB':>11} {'full MB/s':>10} {'peak MB':>8} "
+        f"{'resume MB/s':>12} {'peak MB':>8}"
+    )
+    with s3_client(args.endpoint_url) as s3:
+        with contextlib.suppress(s3.exceptions.BucketAlreadyOwnedByYou):
+            s3.create_bucket(Bucket=BUCKET)
+        storage = S3Storage(s3, BUCKET)
+
+        def read(entry, start, end):
+            return storage.read(entry.key, start, end, chunk_size=chunk_size)
+
+        for count in args.objects:
+            entries = seed(s3, count, size)
+            archive = ZipStream(entries, read)
+            full = stream(archive, 0)
+            # resumed by a new request that has no CRCs yet
+            for entry in entries:
+                entry.crc32 = None
+            archive = ZipStream(entries, read)
+            resumed = stream(archive, archive.size // 2)
+            print(
+                f"{count:>8} {archive.size / 2**20:>11.1f} {full[0]:>10.1f} "
+                f"{full[1]:>8.2f} {resumed[0]:>12.1f} {resumed[1]:>8.2f}"
+            )
+
+
+if __name__ == "__main__":
+    main()
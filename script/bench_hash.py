@@ -0,0 +1,77 @@
+"""Login throughput of Argon2 parameter sets.
+
+Verifies a password hashed with each set on a HashingPool of ``--workers``
+threads for ``--seconds``, the way /api/user/token does. Reports the wall
+time of one verify, logins per second, and logins per CPU second, which is
+the rate one core sustains. A verify spreads over parallelism (p) threads,
+so one worker can keep up to p cores busy. Run it on a machine with at least
+workers * p cores to see the wall time and rate production will get, with
+fewer cores the lanes share them and the verify time grows.
+
+Parameter sets are time_cost,memory_cost_kib,parallelism:
+
+    python -m script.bench_hash --params 3,65536,4 2,19456,1 1,47104,1
+"""
+import time
+import asyncio
+import argparse
+
+from argon2 import PasswordHasher
+
+from izuna_ytdl.auth import HashingPool
+
+PASSWORD = "correct horse battery staple"
+
+
+async def verify_for(
+    pool: HashingPool, ph: PasswordHasher, hashed: str, clients, seconds
+):
+    deadline = time.perf_counter() + seconds
+    done = 0
+
+    async def client():
+        nonlocal done
+        while time.perf_counter() < deadline:
+            await pool.run(ph.verify, hashed, PASSWORD)
+            done += 1
+
+    await asyncio.gather(*(client() for _ in range(clients)))
+    return done
+
+
+def measure(params, workers: int, seconds: float):
+    time_cost, memory_cost, parallelism = params
+    ph = PasswordHasher(
+        time_cost=time_cost, memory_cost=memory_cost, parallelism=parallelism
+    )
+    hashed = ph.hash(PASSWORD)
+    start = time.perf_counter()
+    ph.verify(hashed, PASSWORD)
+    single = time.perf_counter() - start
+
+    pool = HashingPool(workers, 0)
+    wall, cpu = time.perf_counter(), time.process_time()
+    done = asyncio.run(verify_for(pool, ph, hashed, workers, seconds))
+    wall, cpu = time.perf_counter() - wall, time.process_time() - cpu
+    pool.executor.shutdown()
+    return single * 1000, done / wall, done / cpu
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument(
+        "--params", nargs="+", default=["3,65536,4", "2,19456,1", "1,47104,1"]
+    )
+    parser.add_argument("--workers", type=int, default=1)
+    parser.add_argument("--seconds", type=float, default=5)
+    args = parser.parse_args()
+
+    print(f"{'t,m,p':>14} {'verify ms':>10} {'logins/s':>9} {'logins/s/core':>14}")
+    for spec in args.params:
+        params = tuple(int(v) for v in spec.split(","))
+        single, rate, per_core = measure(params, args.workers, args.seconds)
+        print(f"{spec:>14} {single:>10.1f} {rate:>9.1f} {per_core:>14.1f}")
+
+
+if __name__ == "__main__":
+    main()
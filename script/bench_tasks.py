@@ -0,0 +1,121 @@
+"""Latency of the /tasks listing query for a user with many tasks.
+
+Compares the previous full-library load against first and middle pages of
+the keyset query. Seeds its own user into DB_CONNECTION_URL and removes it
+afterwards.
+
+    python -m script.bench_tasks --tasks 10000 100000
+"""
+import time
+import uuid
+import argparse
+import datetime
+import statistics
+
+import sqlalchemy as sa
+from sqlmodel import Session, SQLModel, create_engine, select
+
+from izuna_ytdl import config
+from izuna_ytdl.models import DownloadTask, Item, User
+from izuna_ytdl.router.downloader import DownloadTaskOut
+
+engine = create_engine(config.DB_CONNECTION_URL)
+
+
+def seed(session: Session, count: int) -> User:
+    user = User(username=f"bench-{uuid.uuid4().hex[:8]}", password_hash="x")
+    session.add(user)
+    session.commit()
+    session.refresh(user)
+
+    base = datetime.datetime(2023, 1, 1)
+    rows = [
+        {
+            "id": uuid.uuid4(),
+            "created_by_id": user.id,
+            "created_at": base + datetime.timedelta(seconds=i),
+            "url": f"https://youtube.com/watch?v={i:011d}",
+            "title": f"task {i}",
+            "state": "2",
+            "downloaded_bytes": 1024,
+        }
+        for i in range(count)
+    ]
+    for i in range(0, count, 5000):
+        session.execute(sa.insert(DownloadTask), rows[i : i + 5000])
+    session.commit()
+    return user
+
+
+def legacy(session: Session, user: User):
+    tasks = session.exec(
+        select(DownloadTask, Item)
+        .join(Item, isouter=True)
+        .where(DownloadTask.created_by == user)
+    )
+    results = []
+    for task, item in tasks:
+        out = DownloadTaskOut(
+            id=task.id,
+            url=task.url,
+            downloaded_bytes=task.downloaded_bytes,
+            state=task.state,
+            title=task.title,
+        )
+        if item is not None:
+            out.total_bytes = item.total_bytes
+        results.append(out)
+    return results
+
+
+def timed(fn, repeat: int) -> float:
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        samples.append(time.perf_counter() - start)
+    return statistics.median(samples) * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--tasks", type=int, nargs="+", default=[10000, 100000])
+    parser.add_argument("--page-size", type=int, default=100)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    SQLModel.metadata.create_all(engine)
+    print(f"{'tasks':>8} {'legacy ms':>10} {'first page ms':>14} {'mid page ms':>12}")
+    for count in args.tasks:
+        with Session(engine) as session:
+            user = seed(session, count)
+            try:
+                mid = DownloadTask.page(session, user.id, limit=count // 2)[-1]
+                after = (mid.created_at, mid.id)
+                results = [
+                    timed(lambda: legacy(session, user), args.repeat),
+                    timed(
+                        lambda: DownloadTask.page(
+                            session, user.id, limit=args.page_size
+                        ),
+                        args.repeat,
+                    ),
+                    timed(
+                        lambda: DownloadTask.page(
+                            session, user.id, limit=args.page_size, after=after
+                        ),
+                        args.repeat,
+                    ),
+                ]
+                session.expunge_all()
+            finally:
+                session.execute(
+                    sa.delete(DownloadTask).where(DownloadTask.created_by_id == user.id)
+                )
+                session.execute(sa.delete(User).where(User.id == user.id))
+                session.commit()
+        print(f"{count:>8} {results[0]:>10.1f} {results[1]:>14.1f} {results[2]:>12.1f}")
+
+
+if __name__ == "__main__":
+    main()
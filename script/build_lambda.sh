@@ -2,4 +2,8 @@
 poetry install --only lambda --sync
 poetry lock
 poetry export -f requirements.txt --output lambda_requirements.txt --only lambda
-pip install -r lambda_requirements.txt -t lambda_out --upgrade
\ No newline at end of file
+pip install -r lambda_requirements.txt -t lambda_out --upgrade
+# handler.py imports the executor helpers, ship them alongside it
+mkdir -p lambda_out/izuna_ytdl
+cp izuna_ytdl/__init__.py lambda_out/izuna_ytdl/
+cp -r izuna_ytdl/executor lambda_out/izuna_ytdl/
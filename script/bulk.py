@@ -0,0 +1,26 @@
+"""Batched upserts for the legacy importers."""
+from typing import Iterable, Iterator, List
+
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql, sqlite
+
+
+def upsert(dialect_name: str, table: sa.Table, keys, columns) -> sa.sql.Insert:
+    """Insert into ``table`` that overwrites ``columns`` of the row already
+    having the same ``keys``"""
+    insert = (postgresql if dialect_name == "postgresql" else sqlite).insert(table)
+    return insert.on_conflict_do_update(
+        index_elements=keys,
+        set_={name: insert.excluded[name] for name in columns},
+    )
+
+
+def chunked(rows: Iterable[dict], size: int) -> Iterator[List[dict]]:
+    chunk = []
+    for row in rows:
+        chunk.append(row)
+        if len(chunk) == size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
@@ -1,24 +1,77 @@
-from sqlmodel import create_engine, Session
+"""Copy the items of the legacy Redis store into the database.
+
+Items are read from Redis a page at a time and upserted on video_id in
+batches of ``--batch`` rows, one executemany and one commit each, so memory
+stays flat however many items there are. A re-run overwrites the rows it
+wrote before with the current Redis values.
+
+    python -m script.import_item --batch 1000
+"""
+import time
+import uuid
+import logging
+import argparse
+import itertools
+
+from sqlmodel import Session, create_engine
 
 from izuna_ytdl import config
 from izuna_ytdl.models import Item
 from izuna_ytdl_flask.models.item import Item as RedisItem
 
+from script.bulk import chunked, upsert
+from script.redis_pages import scan_pages
+
+COLUMNS = [
+    "name",
+    "created_by_username",
+    "created_at",
+    "original_url",
+    "original_query",
+    "remote_key",
+    "total_bytes",
+]
+
+
+def rows(items):
+    for item in items:
+        yield {
+            "id": uuid.uuid4(),
+            "video_id": item.id,
+            "name": item.name,
+            "created_by_username": item.created_by,
+            "created_at": item.created_at,
+            "original_url": item.original_url,
+            "original_query": item.original_query,
+            "remote_key": item.remote_key,
+            "total_bytes": item.total_bytes,
+        }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--page-size", type=int, default=1000)
+    parser.add_argument("--batch", type=int, default=1000)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    engine = create_engine(config.DB_CONNECTION_URL)
+    stmt = upsert(engine.dialect.name, Item.__table__, ["video_id"], COLUMNS)
+    pages = scan_pages(RedisItem, args.page_size)
+    items = itertools.chain.from_iterable(records for _, records in pages)
+
+    start = time.perf_counter()
+    done = 0
+    with Session(engine) as session:
+        for batch in chunked(rows(items), args.batch):
+            # SCAN can return a key twice, one statement can't upsert it twice
+            batch = list({row["video_id"]: row for row in batch}.values())
+            session.execute(stmt, batch)
+            session.commit()
+            done += len(batch)
+            logging.info(f"{done} items, {done / (time.perf_counter() - start):.1f}/s")
+    logging.info(f"Imported {done} items in {time.perf_counter() - start:.1f}s")
+
 
-engine = create_engine(config.DB_CONNECTION_URL, echo=True)
-
-with Session(engine) as session:
-    for item in RedisItem.find():
-        item: RedisItem = item
-        newItem = Item(
-            video_id=item.id,
-            created_by_username=item.created_by,
-            created_at=item.created_at,
-            original_url=item.original_url,
-            original_query=item.original_query,
-            remote_key=item.remote_key,
-            total_bytes=item.total_bytes,
-            name=item.name,
-        )
-        session.add(newItem)
-    session.commit()
+if __name__ == "__main__":
+    main()
@@ -1,25 +1,99 @@
-from sqlmodel import create_engine, Session, select
+"""Copy the tasks of the legacy Redis store into the database.
+
+Run after script.import_user and script.import_item. The ids of users by
+username and of items by video id are loaded up front with one query each,
+tasks are then read from Redis a page at a time and upserted on their user
+and item in batches of ``--batch`` rows, one executemany and one commit
+each. A re-run overwrites the rows it wrote before with the current Redis
+values. Tasks whose user or item is missing are skipped and counted.
+
+The rows bypass the userusage counters, run script.reconcile_usage after.
+
+    python -m script.import_task --batch 1000
+"""
+import time
+import uuid
+import logging
+import argparse
+import datetime
+import itertools
+from collections import Counter
+
+import sqlalchemy as sa
+from sqlmodel import Session, create_engine
 
 from izuna_ytdl import config
-from izuna_ytdl.models import User, Item, DownloadTask
+from izuna_ytdl.models import DownloadTask, Item, User
+from izuna_ytdl.executor.tables import DownloadStatusEnum
 from izuna_ytdl_flask.models.download_task import DownloadTask as RedisTask
 
+from script.bulk import chunked, upsert
+from script.redis_pages import scan_pages
+
+COLUMNS = ["created_at", "updated_at", "url", "title", "state", "downloaded_bytes"]
+
+
+def rows(tasks, user_ids: dict, item_ids: dict, skipped: Counter):
+    now = datetime.datetime.now()
+    for task in tasks:
+        user_id = user_ids.get(task.created_by)
+        item_id = item_ids.get(task.id)
+        if user_id is None or item_id is None:
+            logging.warning(f"Skipped task {task.pk} without its user or item")
+            skipped["tasks"] += 1
+            continue
+        yield {
+            "id": uuid.uuid4(),
+            "created_by_id": user_id,
+            "item_id": item_id,
+            "created_at": task.created_at,
+            "updated_at": now,
+            "url": task.url,
+            "title": task.title,
+            "state": DownloadStatusEnum(task.state.value),
+            "downloaded_bytes": task.downloaded_bytes,
+        }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--page-size", type=int, default=1000)
+    parser.add_argument("--batch", type=int, default=1000)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    engine = create_engine(config.DB_CONNECTION_URL)
+    stmt = upsert(
+        engine.dialect.name,
+        DownloadTask.__table__,
+        ["created_by_id", "item_id"],
+        COLUMNS,
+    )
+
+    start = time.perf_counter()
+    done = 0
+    skipped = Counter()
+    with Session(engine) as session:
+        user_ids = dict(session.execute(sa.select(User.username, User.id)).all())
+        item_ids = dict(session.execute(sa.select(Item.video_id, Item.id)).all())
+        logging.info(f"Loaded {len(user_ids)} users and {len(item_ids)} items")
+
+        pages = scan_pages(RedisTask, args.page_size)
+        tasks = itertools.chain.from_iterable(records for _, records in pages)
+        for batch in chunked(rows(tasks, user_ids, item_ids, skipped), args.batch):
+            # SCAN can return a key twice, one statement can't upsert it twice
+            batch = list(
+                {(row["created_by_id"], row["item_id"]): row for row in batch}.values()
+            )
+            session.execute(stmt, batch)
+            session.commit()
+            done += len(batch)
+            logging.info(f"{done} tasks, {done / (time.perf_counter() - start):.1f}/s")
+    logging.info(
+        f"Imported {done} tasks in {time.perf_counter() - start:.1f}s, "
+        f"skipped {skipped['tasks']}"
+    )
+
 
-engine = create_engine(config.DB_CONNECTION_URL, echo=True)
-
-with Session(engine) as session:
-    for task in RedisTask.find():
-        task: RedisTask = task
-        newTask = DownloadTask(
-            created_by=session.exec(
-                select(User).where(User.username == task.created_by).limit(1)
-            ).one(),
-            created_at=task.created_at,
-            downloaded_bytes=task.downloaded_bytes,
-            state=task.state.value,
-            url=task.url,
-            item=session.exec(select(Item).where(Item.video_id == task.id)).one(),
-            title=task.title,
-        )
-        session.add(newTask)
-    session.commit()
+if __name__ == "__main__":
+    main()
@@ -1,14 +1,127 @@
-from sqlmodel import create_engine, Session
+"""Copy the users of the legacy Redis store into the database.
+
+Users are read from Redis a page at a time, their passwords hashed on a pool
+of ``--workers`` processes, and each batch written with one multi-row INSERT
+per table and one commit. Users already in the database are skipped before
+hashing, so a re-run only pays for the new ones.
+
+The SCAN cursor after every committed batch is saved to ``--checkpoint``, an
+interrupted run picks up from there and the file is removed once the scan
+completes. Progress and throughput are logged after every batch.
+
+    python -m script.import_user --workers 8 --batch 500
+"""
+import os
+import json
+import uuid
+import time
+import logging
+import argparse
+from concurrent.futures import ProcessPoolExecutor
+
+import sqlalchemy as sa
+from sqlmodel import Session, create_engine
 
-from izuna_ytdl.models.user import User
 from izuna_ytdl import config
+from izuna_ytdl.auth import hash_password
+from izuna_ytdl.models import User, UserUsage
+from izuna_ytdl.executor.usage import insert_ignore
 
 from izuna_ytdl_flask.models.user import User as fUser
 
-engine = create_engine(config.DB_CONNECTION_URL, echo=True)
+from script.redis_pages import batched, scan_pages
+
+
+def load_checkpoint(path: str) -> dict:
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {"cursor": 0, "imported": 0, "skipped": 0}
+
+
+def save_checkpoint(path: str, state: dict):
+    # replaced whole so a crash mid-write leaves the previous one
+    with open(path + ".tmp", "w") as f:
+        json.dump(state, f)
+    os.replace(path + ".tmp", path)
 
-with Session(engine) as session:
-    users = fUser.find()
+
+def import_batch(
+    session: Session, pool: ProcessPoolExecutor, workers: int, users
+) -> int:
+    """Insert the users of a batch missing from the database, returning how
+    many were inserted"""
+    # the legacy store does not keep usernames unique, the first one wins
+    by_name = {}
     for u in users:
-        u: fUser = u
-        User.create(session, username=u.username, password_plain=u.password)
+        by_name.setdefault(u.username, u)
+    existing = session.execute(
+        sa.select(User.username).where(User.username.in_(by_name))
+    ).scalars()
+    for username in existing:
+        del by_name[username]
+    if not by_name:
+        return 0
+
+    new = list(by_name.values())
+    chunksize = max(len(new) // (workers * 4), 1)
+    hashes = pool.map(hash_password, [u.password for u in new], chunksize=chunksize)
+    rows = [
+        {
+            "id": uuid.uuid4(),
+            "username": u.username,
+            "password_hash": h,
+            "created_at": u.date_created,
+        }
+        for u, h in zip(new, hashes)
+    ]
+    session.execute(sa.insert(User).values(rows))
+    session.execute(
+        insert_ignore(session.bind.dialect.name).values(
+            [UserUsage(user_id=row["id"]).dict() for row in rows]
+        )
+    )
+    session.commit()
+    return len(rows)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--workers", type=int, default=os.cpu_count())
+    parser.add_argument("--page-size", type=int, default=1000)
+    parser.add_argument("--batch", type=int, default=500)
+    parser.add_argument("--checkpoint", default="import_user.checkpoint.json")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    engine = create_engine(config.DB_CONNECTION_URL)
+    state = load_checkpoint(args.checkpoint)
+    if state["cursor"]:
+        logging.info(f"Resuming from cursor {state['cursor']}")
+
+    start = time.perf_counter()
+    done = 0
+    pages = scan_pages(fUser, args.page_size, state["cursor"])
+    with ProcessPoolExecutor(args.workers) as pool, Session(engine) as session:
+        for cursor, users in batched(pages, args.batch):
+            imported = import_batch(session, pool, args.workers, users)
+            state["cursor"] = cursor
+            state["imported"] += imported
+            state["skipped"] += len(users) - imported
+            save_checkpoint(args.checkpoint, state)
+            done += len(users)
+            elapsed = time.perf_counter() - start
+            logging.info(
+                f"{state['imported']} imported, {state['skipped']} skipped, "
+                f"{done / elapsed:.1f} users/s"
+            )
+    os.remove(args.checkpoint)
+    logging.info(
+        f"Imported {state['imported']} users in {time.perf_counter() - start:.1f}s, "
+        f"skipped {state['skipped']}"
+    )
+
+
+if __name__ == "__main__":
+    main()
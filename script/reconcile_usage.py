@@ -0,0 +1,40 @@
+"""Recount the per-user task counters from the task rows.
+
+Every task write keeps UserUsage in step, this corrects whatever drifted
+anyway (rows written by hand, the legacy Lambda task loader). Runs once, or
+every --interval seconds.
+
+    python -m script.reconcile_usage --interval 3600
+"""
+import time
+import logging
+import argparse
+
+from sqlmodel import Session, create_engine
+
+from izuna_ytdl import config
+from izuna_ytdl.models import UserUsage
+
+engine = create_engine(config.DB_CONNECTION_URL)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--interval", type=int, default=0)
+    parser.add_argument("--batch", type=int, default=1000)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    while True:
+        start = time.perf_counter()
+        with Session(engine) as session:
+            drifted = UserUsage.reconcile(session, batch=args.batch)
+        elapsed = time.perf_counter() - start
+        logging.info(f"Reconciled usage in {elapsed:.1f}s, {drifted} users drifted")
+        if not args.interval:
+            break
+        time.sleep(args.interval)
+
+
+if __name__ == "__main__":
+    main()
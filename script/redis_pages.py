@@ -0,0 +1,36 @@
+"""Paging through the records of the legacy redis_om models.
+
+``Model.find()`` runs one search and loads every record before the first is
+returned. These walk the model's keys with SCAN and fetch each page with one
+JSON.MGET, so a migration holds one page in memory at a time and can resume
+from the SCAN cursor of the last page it finished.
+"""
+from typing import Iterator, List, Tuple
+
+
+def scan_pages(model, page_size: int, cursor: int = 0) -> Iterator[Tuple[int, List]]:
+    """Yield ``(cursor, records)`` pages of ``model`` starting at ``cursor``.
+
+    The cursor is the one to resume from after the page, 0 once the scan is
+    done. SCAN may return a key more than once and a page may be short or
+    empty, records deleted since their key was seen are left out.
+    """
+    db = model.db()
+    match = model.make_primary_key("*")
+    while True:
+        cursor, keys = db.scan(cursor=cursor, match=match, count=page_size)
+        docs = db.json().mget(keys, ".") if keys else []
+        yield int(cursor), [model.parse_obj(doc) for doc in docs if doc is not None]
+        if not cursor:
+            return
+
+
+def batched(pages: Iterator[Tuple[int, List]], size: int) -> Iterator[Tuple[int, List]]:
+    """Join pages into batches of at least ``size`` records, each with the
+    cursor of its last page"""
+    batch = []
+    for cursor, records in pages:
+        batch += records
+        if len(batch) >= size or not cursor:
+            yield cursor, batch
+            batch = []
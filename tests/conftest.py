@@ -0,0 +1,71 @@
+import pytest
+from sqlmodel import Session, SQLModel
+
+from izuna_ytdl.database import engine
+from izuna_ytdl.models import User, DownloadTask, Item
+
+URL = "https://youtube.com/watch?v=86IxCGKUOzY"
+
+
+@pytest.fixture(scope="function")
+def session():
+    """A session on the test database, every table is emptied afterwards"""
+    SQLModel.metadata.create_all(engine)
+    with Session(engine) as session:
+        yield session
+        session.rollback()
+        for table in reversed(SQLModel.metadata.sorted_tables):
+            session.execute(table.delete())
+        session.commit()
+
+
+@pytest.fixture(scope="function")
+def users(session):
+    """alice and bob, with their usage rows"""
+    return [
+        User.create(session, username=name, password_plain="x")
+        for name in ("alice", "bob")
+    ]
+
+
+@pytest.fixture(scope="function")
+def request_task(session):
+    """DownloadTask.request for a user, the way POST /download calls it"""
+    default_session = session
+
+    def request(user, video_id="86IxCGKUOzY", limit=10, *, session=None):
+        return DownloadTask.request(
+            session or default_session,
+            user.id,
+            user.username,
+            video_id,
+            URL,
+            limit=limit,
+        )
+
+    return request
+
+
+@pytest.fixture(scope="function")
+def make_task(session):
+    """Save a queued task of ``user`` on a new, not downloaded item"""
+
+    def make(user: User) -> DownloadTask:
+        item = Item(
+            created_by_username=user.username,
+            name="",
+            original_query=URL,
+            original_url=URL,
+            remote_key="",
+            video_id="86IxCGKUOzY",
+        )
+        task = DownloadTask(created_by=user, item=item, title="", url=URL)
+        task.save(session)
+        return task
+
+    return make
+
+
+@pytest.fixture(scope="function")
+def task(make_task):
+    return make_task(User(username="owner", password_hash="x"))
@@ -0,0 +1,39 @@
+import pytest
+from sqlmodel import delete, Session, SQLModel
+
+from izuna_ytdl.database import engine
+from izuna_ytdl.models import User, DownloadTask, Item
+
+
+@pytest.fixture(scope="module")
+def session():
+    SQLModel.metadata.create_all(engine)
+    with Session(engine) as session:
+        yield session
+        session.exec(delete(DownloadTask))
+        session.exec(delete(Item))
+        session.exec(delete(User))
+        session.commit()
+
+
+@pytest.fixture(scope="function")
+def stock_task(session):
+    user = User(username="executor", password_hash="x")
+    url = "https://youtube.com/watch?v=86IxCGKUOzY"
+    item = Item(
+        created_by_username=user.username,
+        name="",
+        original_query=url,
+        original_url=url,
+        remote_key="",
+        video_id="86IxCGKUOzY",
+    )
+    task = DownloadTask(created_by=user, item=item, title="", url=url)
+    task.save(session)
+
+    yield task
+
+    session.exec(delete(DownloadTask))
+    session.exec(delete(Item))
+    session.exec(delete(User))
+    session.commit()
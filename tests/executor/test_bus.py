@@ -0,0 +1,69 @@
+import threading
+
+import pytest
+
+from izuna_ytdl.executor.bus import MemoryBus, RedisBus
+from izuna_ytdl.executor.progress import ProgressWriter
+
+
+def listen_in_thread(bus, events):
+    stop = threading.Event()
+    thread = threading.Thread(target=bus.listen, args=(events.append, stop))
+    thread.start()
+    return stop, thread
+
+
+def test_memory_bus():
+    bus = MemoryBus()
+    events = []
+    stop, thread = listen_in_thread(bus, events)
+    while not bus._callbacks:
+        pass
+    bus.publish({"task_id": "a"})
+    stop.set()
+    thread.join()
+    bus.publish({"task_id": "b"})
+    assert events == [{"task_id": "a"}]
+
+
+def test_redis_bus():
+    fakeredis = pytest.importorskip("fakeredis")
+    bus = RedisBus(fakeredis.FakeRedis())
+    events = []
+    stop, thread = listen_in_thread(bus, events)
+    while not bus.client.pubsub_numsub(bus.channel)[0][1]:
+        pass
+    bus.publish({"task_id": "a", "downloaded_bytes": 1})
+    while not events:
+        pass
+    stop.set()
+    thread.join()
+    assert events == [{"task_id": "a", "downloaded_bytes": 1}]
+
+
+def test_progress_writer_publishes_ticks(session, stock_task):
+    bus = MemoryBus()
+    events = []
+    bus._callbacks.append(events.append)
+    writer = ProgressWriter(
+        session,
+        stock_task.id,
+        stock_task.item_id,
+        interval_ms=0,
+        bus=bus,
+        user_id=stock_task.created_by_id,
+    )
+    for i in range(1, 4):
+        writer.update(i * 10, 100)
+
+    assert [e["downloaded_bytes"] for e in events] == [10, 20, 30]
+    assert events[0]["user_id"] == str(stock_task.created_by_id)
+    session.refresh(stock_task)
+    # ticks do not touch the row
+    assert stock_task.downloaded_bytes is None
+
+    writer.close()
+    session.refresh(stock_task)
+    session.refresh(stock_task.item)
+    assert stock_task.downloaded_bytes == 30
+    assert stock_task.item.total_bytes == 100
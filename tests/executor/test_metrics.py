@@ -0,0 +1,21 @@
+from izuna_ytdl.executor.metrics import JobTimer
+
+
+def test_job_timer_stages():
+    now = 0.0
+    timer = JobTimer(clock=lambda: now)
+
+    with timer.stage("extract"):
+        now += 1.5
+    timer.record("extract_saved", timer.timings["extract"])
+    with timer.stage("download"):
+        now += 2
+    with timer.stage("download"):
+        now += 1
+
+    assert timer.as_dict() == {
+        "extract": 1.5,
+        "extract_saved": 1.5,
+        "download": 3.0,
+        "total": 4.5,
+    }
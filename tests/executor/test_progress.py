@@ -0,0 +1,71 @@
+from sqlalchemy.dialects import postgresql
+
+from izuna_ytdl.executor.progress import ProgressWriter
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_coalesce_by_interval(session, stock_task):
+    clock = FakeClock()
+    writer = ProgressWriter(
+        session,
+        stock_task.id,
+        stock_task.item_id,
+        interval_ms=1000,
+        percent=50,
+        clock=clock,
+    )
+
+    for i in range(1, 11):
+        clock.now += 0.25
+        writer.update(i * 10, 1000)
+
+    # first tick, then one every 4 ticks (1 s)
+    assert writer.flushes == 3
+    writer.close()
+    assert writer.flushes == 4
+
+    session.refresh(stock_task)
+    session.refresh(stock_task.item)
+    assert stock_task.downloaded_bytes == 100
+    assert stock_task.item.total_bytes == 1000
+
+
+def test_coalesce_by_percent(session, stock_task):
+    clock = FakeClock()
+    writer = ProgressWriter(
+        session,
+        stock_task.id,
+        stock_task.item_id,
+        interval_ms=60_000,
+        percent=10,
+        clock=clock,
+    )
+
+    for i in range(1, 101):
+        writer.update(i, 100)
+
+    # first tick, then every 10 bytes
+    assert writer.flushes == 10
+    writer.close()
+    assert writer.flushes == 11
+    writer.close()
+    assert writer.flushes == 11
+
+
+def test_postgres_single_statement(stock_task):
+    writer = ProgressWriter(None, stock_task.id, stock_task.item_id)
+    writer.downloaded_bytes = 10
+    writer.total_bytes = 100
+    stmts = writer.statement("postgresql")
+    assert len(stmts) == 1
+    sql = str(stmts[0].compile(dialect=postgresql.dialect()))
+    assert sql.startswith("WITH task_progress AS")
+    assert "UPDATE downloadtask" in sql
+    assert "UPDATE item" in sql
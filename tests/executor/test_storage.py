@@ -0,0 +1,134 @@
+import os
+import time
+
+import boto3
+import pytest
+
+from izuna_ytdl.executor.storage import (
+    LocalStorage,
+    S3Storage,
+    StorageError,
+    storage_from_env,
+)
+from izuna_ytdl.executor.streaming import MIN_PART_SIZE
+
+BUCKET = "izuna-ytdl-test"
+KEY = "public/86IxCGKUOzY/生きるよすが.mp3"
+
+
+@pytest.fixture
+def local(tmp_path):
+    return LocalStorage(
+        str(tmp_path / "files"), base_url="http://test/files/", secret="s"
+    )
+
+
+@pytest.fixture
+def s3(monkeypatch):
+    moto = pytest.importorskip("moto")
+    # newer botocore sends aws-chunked bodies that moto does not decode
+    monkeypatch.setenv("AWS_REQUEST_CHECKSUM_CALCULATION", "when_required")
+    with moto.mock_s3():
+        client = boto3.client("s3", region_name="us-east-1")
+        client.create_bucket(Bucket=BUCKET)
+        yield client
+
+
+def test_local_storage_needs_secret_and_base_url(tmp_path, monkeypatch):
+    with pytest.raises(ValueError):
+        LocalStorage(str(tmp_path), base_url="http://test", secret="")
+    monkeypatch.setenv("YTDL_STORAGE", "local")
+    monkeypatch.setenv("YTDL_STORAGE_ROOT", str(tmp_path))
+    monkeypatch.delenv("YTDL_STORAGE_SECRET", raising=False)
+    monkeypatch.setenv("YTDL_STORAGE_BASE_URL", "http://test")
+    with pytest.raises(KeyError):
+        storage_from_env()
+    monkeypatch.setenv("YTDL_STORAGE_SECRET", "s")
+    monkeypatch.delenv("YTDL_STORAGE_BASE_URL")
+    with pytest.raises(KeyError):
+        storage_from_env()
+
+
+def test_local_put_stream(local):
+    with local.put_stream(KEY) as sink:
+        sink.write(b"abc")
+        sink.write(b"def")
+    assert open(local.path(KEY), "rb").read() == b"abcdef"
+    assert local.stat(KEY).size == 6
+    assert local.stat(KEY).content_type == "audio/mpeg"
+
+    local.delete(KEY)
+    assert not local.exists(KEY)
+    local.delete(KEY)
+
+
+def test_local_put_stream_aborts(local):
+    with pytest.raises(RuntimeError):
+        with local.put_stream(KEY) as sink:
+            sink.write(b"abc")
+            raise RuntimeError("transcode failed")
+    assert not local.exists(KEY)
+    assert not os.path.exists(local.path(KEY) + ".part")
+
+
+def test_local_put_file_moves(local, tmp_path):
+    src = tmp_path / "a.mp3"
+    src.write_bytes(b"abc")
+    local.put_file(str(src), KEY)
+    assert not src.exists()
+    assert local.exists(KEY)
+
+
+def test_local_rejects_keys_outside_root(local):
+    with pytest.raises(StorageError):
+        local.path("../escape.mp3")
+
+
+def test_local_presign(local, monkeypatch):
+    url = local.presign(KEY, expires_in=60)
+    assert url.startswith("http://test/files/public/86IxCGKUOzY/")
+    query = dict(p.split("=") for p in url.split("?")[1].split("&"))
+    expires = int(query["expires"])
+
+    assert local.verify(KEY, expires, query["sig"])
+    assert not local.verify("public/other.mp3", expires, query["sig"])
+    assert not local.verify(KEY, expires + 1, query["sig"])
+    monkeypatch.setattr(time, "time", lambda: expires + 1)
+    assert not local.verify(KEY, expires, query["sig"])
+
+
+def test_s3_storage(s3, tmp_path):
+    storage = S3Storage(s3, BUCKET, part_size=MIN_PART_SIZE)
+    assert storage.stat(KEY) is None
+
+    with storage.put_stream(KEY) as sink:
+        sink.write(b"abc")
+    assert storage.stat(KEY).size == 3
+    assert storage.stat(KEY).content_type == "audio/mpeg"
+
+    src = tmp_path / "b.mp3"
+    src.write_bytes(b"abcd")
+    storage.put_file(str(src), "public/b.mp3")
+    assert not src.exists()
+    assert storage.exists("public/b.mp3")
+
+    assert BUCKET in storage.presign(KEY)
+    storage.delete(KEY)
+    assert not storage.exists(KEY)
+
+
+@pytest.mark.parametrize("kind", ["local", "s3"])
+def test_read_range(kind, request):
+    if kind == "local":
+        storage = request.getfixturevalue("local")
+    else:
+        storage = S3Storage(request.getfixturevalue("s3"), BUCKET)
+    data = bytes(range(256)) * 4
+    with storage.put_stream(KEY) as sink:
+        sink.write(data)
+
+    chunks = list(storage.read(KEY, 10, 709, chunk_size=100))
+    assert b"".join(chunks) == data[10:710]
+    assert max(len(chunk) for chunk in chunks) <= 100
+    with pytest.raises(StorageError):
+        list(storage.read("public/missing.mp3", 0, 9))
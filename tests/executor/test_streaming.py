@@ -0,0 +1,77 @@
+import os
+import sys
+
+import boto3
+import pytest
+
+from izuna_ytdl.executor.streaming import (
+    MIN_PART_SIZE,
+    S3MultipartWriter,
+    TranscodeError,
+    stream_transcode,
+)
+
+moto = pytest.importorskip("moto")
+
+BUCKET = "izuna-ytdl-test"
+
+# stands in for ffmpeg, copies stdin to stdout
+PASSTHROUGH = [
+    sys.executable,
+    "-c",
+    "import shutil, sys; shutil.copyfileobj(sys.stdin.buffer, sys.stdout.buffer)",
+]
+
+
+@pytest.fixture
+def s3(monkeypatch):
+    # newer botocore sends aws-chunked bodies that moto does not decode
+    monkeypatch.setenv("AWS_REQUEST_CHECKSUM_CALCULATION", "when_required")
+    with moto.mock_s3():
+        client = boto3.client("s3", region_name="us-east-1")
+        client.create_bucket(Bucket=BUCKET)
+        yield client
+
+
+def chunks(data: bytes, size: int):
+    for i in range(0, len(data), size):
+        yield data[i : i + size]
+
+
+def test_multipart_upload(s3):
+    data = os.urandom(MIN_PART_SIZE * 2 + 1234)
+    with S3MultipartWriter(s3, BUCKET, "a.mp3", part_size=MIN_PART_SIZE) as sink:
+        for chunk in chunks(data, 100_000):
+            sink.write(chunk)
+
+    assert len(sink.parts) == 3
+    body = s3.get_object(Bucket=BUCKET, Key="a.mp3")["Body"].read()
+    assert body == data
+
+
+def test_small_object_single_put(s3):
+    with S3MultipartWriter(s3, BUCKET, "small.mp3") as sink:
+        sink.write(b"abc")
+
+    assert sink.upload_id is None
+    assert s3.get_object(Bucket=BUCKET, Key="small.mp3")["Body"].read() == b"abc"
+
+
+def test_stream_transcode_to_s3(s3):
+    data = os.urandom(MIN_PART_SIZE + 4321)
+    with S3MultipartWriter(s3, BUCKET, "b.mp3", part_size=MIN_PART_SIZE) as sink:
+        written = stream_transcode(chunks(data, 65536), sink, PASSTHROUGH)
+
+    assert written == len(data)
+    assert s3.get_object(Bucket=BUCKET, Key="b.mp3")["Body"].read() == data
+
+
+def test_failed_transcode_aborts_upload(s3):
+    failing = [sys.executable, "-c", "import sys; sys.stdout.write('x' * 10); exit(3)"]
+    with pytest.raises(TranscodeError):
+        with S3MultipartWriter(s3, BUCKET, "c.mp3", part_size=MIN_PART_SIZE) as sink:
+            sink.write(os.urandom(MIN_PART_SIZE))
+            stream_transcode(chunks(b"abc", 1), sink, failing)
+
+    assert s3.list_multipart_uploads(Bucket=BUCKET).get("Uploads", []) == []
+    assert "Contents" not in s3.list_objects_v2(Bucket=BUCKET)
@@ -0,0 +1,65 @@
+import os
+
+import boto3
+import pytest
+
+from izuna_ytdl.executor.warm import WarmContainer
+
+moto = pytest.importorskip("moto")
+
+BUCKET = "izuna-ytdl-test"
+KEY = "cache/yt-dlp.tar.gz"
+
+
+@pytest.fixture
+def s3(monkeypatch):
+    monkeypatch.setenv("AWS_REQUEST_CHECKSUM_CALCULATION", "when_required")
+    with moto.mock_s3():
+        client = boto3.client("s3", region_name="us-east-1")
+        client.create_bucket(Bucket=BUCKET)
+        yield client
+
+
+def test_ydl_reused_with_bound_hooks(tmp_path):
+    warm = WarmContainer({"quiet": True}, cache_dir=str(tmp_path))
+    ydl = warm.ydl()
+    assert warm.ydl() is ydl
+    assert ydl.params["cachedir"] == str(tmp_path)
+
+    seen = []
+    with warm.hooks.bind(seen.append, None):
+        for hook in ydl._progress_hooks:
+            hook({"status": "downloading"})
+    for hook in ydl._progress_hooks:
+        hook({"status": "ignored"})
+    assert seen == [{"status": "downloading"}]
+
+
+def test_cold_and_warm_start_metrics(tmp_path):
+    warm = WarmContainer({}, cache_dir=str(tmp_path))
+    assert warm.begin_invocation()["cold_start"] is True
+    second = warm.begin_invocation()
+    assert second["cold_start"] is False
+    assert second["invocation"] == 2
+    assert warm.end_invocation() == {}
+
+
+def test_cache_persist_and_seed(s3, tmp_path):
+    first = WarmContainer(
+        {}, cache_dir=str(tmp_path / "a"), s3=s3, cache_bucket=BUCKET, cache_key=KEY
+    )
+    metrics = first.begin_invocation()
+    assert metrics["cache_seeded"] is False
+
+    os.makedirs(tmp_path / "a" / "youtube-sigfuncs")
+    (tmp_path / "a" / "youtube-sigfuncs" / "js_abc.json").write_text("{}")
+    assert first.end_invocation()["cache_persisted"] is True
+    # unchanged cache is not uploaded again
+    assert first.end_invocation()["cache_persisted"] is False
+
+    second = WarmContainer(
+        {}, cache_dir=str(tmp_path / "b"), s3=s3, cache_bucket=BUCKET, cache_key=KEY
+    )
+    assert second.begin_invocation()["cache_seeded"] is True
+    assert (tmp_path / "b" / "youtube-sigfuncs" / "js_abc.json").read_text() == "{}"
+    assert second.end_invocation()["cache_persisted"] is False
@@ -1,10 +1,20 @@
-from typing import List
+import io
+import uuid
+import zipfile
+import datetime
+import pytest
 from httpx import Client
-from sqlmodel import delete
+from sqlmodel import Session, delete, select
 from unittest.mock import patch, MagicMock
-from izuna_ytdl.models import DownloadTask, Item
+from izuna_ytdl import config
+from izuna_ytdl.main import app
+from izuna_ytdl.auth import get_login_user
+from izuna_ytdl.admission import admission
+from izuna_ytdl.caches import task_summaries
+from izuna_ytdl.models import DownloadTask, Item, User, UserUsage
 from izuna_ytdl.models.download_task import DownloadStatusEnum
 from izuna_ytdl.router.downloader import download
+from izuna_ytdl.storage import LocalStorage
 
 
 def test_get_task(client, login_cookie, stock_tasks):
@@ -17,8 +27,8 @@ def test_get_task(client, login_cookie, stock_tasks):
 
 
 def test_retrieve(client: Client, login_cookie, stock_tasks):
-    with patch("izuna_ytdl.router.downloader.s3") as mock_s3:
-        mock_s3.generate_presigned_url.return_value = "https://downloadlink.com"
+    with patch("izuna_ytdl.router.downloader.presigned.storage") as mock_storage:
+        mock_storage.presign.return_value = "https://downloadlink.com"
 
         resp = client.get(
             f"/api/downloader/retrieve?id={stock_tasks[0].id}",
@@ -166,71 +176,390 @@ class TestRouteDownload:
             assert cl_task.url == "https://youtube.com/watch?v=86IxCGKUOzY"
 
 
-class TestDownloaderDownload:
-    def test1(self, session, login_user, stock_tasks: List[DownloadTask]):
-        with (
-            patch("izuna_ytdl.router.downloader.s3"),
-            patch("yt_dlp.YoutubeDL") as mock_ydl,
-            patch("logging.error") as mock_log,
-        ):
-            ydl_i = mock_ydl.return_value.__enter__.return_value
-            ydl_i.extract_info.return_value = {"duration": 700}
+def test_download_submits_payload(session, requester, monkeypatch):
+    submitted = []
+    monkeypatch.setattr(
+        "izuna_ytdl.router.downloader.backend",
+        MagicMock(submit=submitted.append),
+    )
+    url = "https://youtube.com/watch?v=86IxCGKUOzY"
+    item = Item(
+        created_by_username=requester.username,
+        name="",
+        original_query=url,
+        original_url=url,
+        remote_key="",
+        video_id="86IxCGKUOzY",
+    )
+    task = DownloadTask(created_by=requester, item=item, title="", url=url)
+    task.save(session)
+    task_id = task.id
+
+    # download() commits and closes the session it is given
+    own = Session(session.bind)
+    download(own, "86IxCGKUOzY", own.get(DownloadTask, task_id))
+
+    [payload] = submitted
+    assert payload["id"] == "86IxCGKUOzY"
+    assert payload["task"]["id"] == str(task_id)
+    assert payload["task"]["url"] == url
+    assert payload["item"]["video_id"] == "86IxCGKUOzY"
+    assert payload["user"]["username"] == "requester"
+    assert "password_hash" not in payload["user"]
+    assert payload["dispatched_at"] > 0
+
+
+@pytest.fixture(scope="function")
+def requester(client, session):
+    user = User(username="requester", password_hash="x")
+    session.add(user)
+    session.commit()
+    session.refresh(user)
+    app.dependency_overrides[get_login_user] = lambda: user
+    yield user
+    app.dependency_overrides.pop(get_login_user)
+    session.exec(delete(DownloadTask))
+    session.exec(delete(Item))
+    session.exec(delete(UserUsage).where(UserUsage.user_id == user.id))
+    session.exec(delete(User).where(User.username == "requester"))
+    session.commit()
+
+
+def test_post_download_queues_once_and_limits(client, requester, monkeypatch):
+    monkeypatch.setattr(config, "MAX_USER_TASK", 0)
+    with (
+        patch("izuna_ytdl.router.downloader.download") as mock_download,
+        patch("fastapi.BackgroundTasks.add_task") as mock_bgat,
+    ):
+        resp = client.post(
+            "/api/downloader/download",
+            json={"url": "https://youtube.com/watch?v=86IxCGKUOzY"},
+        )
+        assert resp.status_code == 201
+        (fn, _, video_id, task), _ = mock_bgat.call_args
+        assert fn == mock_download
+        assert video_id == "86IxCGKUOzY"
+        assert task.created_by_id == requester.id
+        assert task.state == DownloadStatusEnum.QUEUED
+
+        resp = client.post(
+            "/api/downloader/download",
+            json={"url": "https://youtube.com/watch?v=aaaaaaaaaaa"},
+        )
+        assert resp.status_code == 429
+        assert mock_bgat.call_count == 1
+
+
+def test_post_download_redispatches_queued_task(client, session, requester):
+    url = "https://youtube.com/watch?v=86IxCGKUOzY"
+    with (
+        patch("izuna_ytdl.router.downloader.download"),
+        patch("fastapi.BackgroundTasks.add_task") as mock_bgat,
+    ):
+        assert (
+            client.post("/api/downloader/download", json={"url": url}).status_code
+            == 201
+        )
+        # the first dispatch got lost, the task is still queued with its claim
+        resp = client.post("/api/downloader/download", json={"url": url})
+        assert resp.status_code == 201
+        assert mock_bgat.call_count == 2
+        (_, _, _, first), _ = mock_bgat.call_args_list[0]
+        (_, _, _, again), _ = mock_bgat.call_args
+        assert again.id == first.id
+
+        # a running download is not dispatched twice
+        DownloadTask.get(session, first.id).set_state(
+            session, DownloadStatusEnum.PROCESSING
+        )
+        resp = client.post("/api/downloader/download", json={"url": url})
+        assert resp.status_code == 202
+        assert mock_bgat.call_count == 2
+
+
+def test_post_download_rejects_own_queued_task_over_limit(
+    client, session, requester, monkeypatch
+):
+    url = "https://youtube.com/watch?v=86IxCGKUOzY"
+    with (
+        patch("izuna_ytdl.router.downloader.download"),
+        patch("fastapi.BackgroundTasks.add_task") as mock_bgat,
+    ):
+        assert (
+            client.post("/api/downloader/download", json={"url": url}).status_code
+            == 201
+        )
+        monkeypatch.setattr(admission, "max_user_inflight", 1)
+        monkeypatch.setattr(admission, "retry_after", 12)
+        # nothing else downloads it, re-dispatching is a new download
+        resp = client.post("/api/downloader/download", json={"url": url})
+        assert resp.status_code == 429
+        assert resp.headers["Retry-After"] == "12"
+        assert mock_bgat.call_count == 1
+
+
+def test_post_download_admission(client, session, requester, monkeypatch):
+    monkeypatch.setattr(admission, "max_user_inflight", 1)
+    monkeypatch.setattr(admission, "retry_after", 12)
+    done = Item(
+        created_by_username="other",
+        name="done.mp3",
+        original_query="",
+        original_url="",
+        remote_key="public/bbbbbbbbbbb/done.mp3",
+        video_id="bbbbbbbbbbb",
+        total_bytes=500,
+    )
+    done.save(session)
+    with (
+        patch("izuna_ytdl.router.downloader.download"),
+        patch("fastapi.BackgroundTasks.add_task") as mock_bgat,
+    ):
+        resp = client.post(
+            "/api/downloader/download",
+            json={"url": "https://youtube.com/watch?v=86IxCGKUOzY"},
+        )
+        assert resp.status_code == 201
 
-            task = stock_tasks[0]
-            download(session, "86IxCGKUOzY", task)
-            mock_log.assert_called_with("Other errors: Exception duration too long")
+        resp = client.post(
+            "/api/downloader/download",
+            json={"url": "https://youtube.com/watch?v=aaaaaaaaaaa"},
+        )
+        assert resp.status_code == 429
+        assert resp.headers["Retry-After"] == "12"
+        assert mock_bgat.call_count == 1
+
+        # attaching a downloaded item starts no download
+        resp = client.post(
+            "/api/downloader/download",
+            json={"url": "https://youtube.com/watch?v=bbbbbbbbbbb"},
+        )
+        assert resp.status_code == 201
+        assert mock_bgat.call_count == 1
+
+        session.expire_all()
+        usage = UserUsage.get(session, requester.id)
+        assert (usage.task_count, usage.active_count, usage.bytes_stored) == (
+            2,
+            1,
+            500,
+        )
 
-    def test2(self, session, login_user, stock_tasks: List[DownloadTask]):
-        with (
-            patch("izuna_ytdl.router.downloader.s3") as mock_s3,
-            patch("yt_dlp.YoutubeDL") as mock_ydl,
-            patch("logging.error") as mock_log,
-            patch("os.remove") as osrem,
-        ):
-            ydl_i = MagicMock()
-            ydl_enter = ydl_i.__enter__.return_value
-            ydl_enter.extract_info.return_value = {
-                "duration": 300,
-                "title": "生きるよすが",
-            }
+        # waiting does not free storage, no Retry-After
+        monkeypatch.setattr(admission, "max_user_bytes", 500)
+        resp = client.post(
+            "/api/downloader/download",
+            json={"url": "https://youtube.com/watch?v=bbbbbbbbbbb"},
+        )
+        assert resp.status_code == 429
+        assert "Retry-After" not in resp.headers
+
+
+def test_post_download_waits_for_download_in_progress(client, session, requester):
+    item = Item(
+        created_by_username="other",
+        name="",
+        original_query="",
+        original_url="",
+        remote_key="",
+        video_id="ccccccccccc",
+        download_task_id=uuid.uuid4(),
+        download_claimed_at=datetime.datetime.now(),
+    )
+    item.save(session)
+    with (
+        patch("izuna_ytdl.router.downloader.download"),
+        patch("fastapi.BackgroundTasks.add_task") as mock_bgat,
+    ):
+        resp = client.post(
+            "/api/downloader/download",
+            json={"url": "https://youtube.com/watch?v=ccccccccccc"},
+        )
+        assert resp.status_code == 202
+        mock_bgat.assert_not_called()
+
+    (task,) = item.tasks
+    # not done before the file exists
+    assert task.state == DownloadStatusEnum.QUEUED
+
+
+def test_retrieve_reuses_presigned_link(client, session, requester):
+    item = Item(
+        created_by_username="requester",
+        name="a",
+        original_query="86IxCGKUOzY",
+        original_url="https://youtube.com/watch?v=86IxCGKUOzY",
+        remote_key="public/86IxCGKUOzY/a",
+        video_id="86IxCGKUOzY",
+    )
+    task = DownloadTask(
+        created_by=requester, item=item, title="a", url=item.original_url
+    )
+    task.save(session)
+    with patch("izuna_ytdl.router.downloader.presigned.storage") as mock_storage:
+        mock_storage.presign.return_value = "https://downloadlink.com"
+        for _ in range(2):
+            resp = client.get(f"/api/downloader/retrieve?id={task.id}")
+            assert resp.status_code == 201
+            assert resp.text == "https://downloadlink.com"
+        mock_storage.presign.assert_called_once_with(
+            "public/86IxCGKUOzY/a", expires_in=config.PRESIGN_EXPIRES_SECONDS
+        )
 
-            initopts = None
-
-            def side_init(opts):
-                nonlocal initopts
-                initopts = opts
-                return ydl_i
-
-            mock_ydl.side_effect = side_init
-
-            def side_download(url):
-                postprocessor_hook = initopts["postprocessor_hooks"][0]
-                progress_hook = initopts["progress_hooks"][0]
-                d = {
-                    "status": "finished",
-                    "downloaded_bytes": 10,
-                    "total_bytes": 10,
-                    "info_dict": {
-                        "filepath": "a",
-                        "__files_to_move": {"a": "a.mp3"},
-                    },
-                }
-                progress_hook(d)
-                postprocessor_hook(d)
-
-            ydl_enter.download.side_effect = side_download
-
-            task = stock_tasks[0]
-            download(session, "86IxCGKUOzY", task)
-
-            mock_log.assert_not_called()
-            osrem.assert_called_with("a.mp3")
-            mock_s3.upload_file.assert_called_with(
-                "a.mp3", "izuna-ytdl-files", "public/86IxCGKUOzY/a"
-            )
-            assert task.item.name == "a"
-            assert task.title == "a"
-            assert task.item.total_bytes == 10
-            assert task.downloaded_bytes == 10
-            assert task.item.remote_key == "public/86IxCGKUOzY/a"
-            assert task.state == DownloadStatusEnum.DONE
+
+def test_retrieve_batch(client, session, requester):
+    other = User(username="other", password_hash="x")
+
+    def make_task(user, video_id, state, remote_key):
+        item = Item(
+            created_by_username=user.username,
+            name=video_id,
+            original_query=video_id,
+            original_url=f"https://youtube.com/watch?v={video_id}",
+            remote_key=remote_key,
+            video_id=video_id,
+        )
+        task = DownloadTask(
+            created_by=user,
+            item=item,
+            title=f"{video_id} title",
+            url=item.original_url,
+            state=state,
+        )
+        task.save(session)
+        return str(task.id)
+
+    done = make_task(requester, "86IxCGKUOzY", DownloadStatusEnum.DONE, "k/a")
+    queued = make_task(requester, "aaaaaaaaaaa", DownloadStatusEnum.QUEUED, "")
+    foreign = make_task(other, "bbbbbbbbbbb", DownloadStatusEnum.DONE, "k/b")
+    missing = str(uuid.uuid4())
+    ids = [missing, done, queued, foreign]
+
+    with patch("izuna_ytdl.router.downloader.presigned.storage") as mock_storage:
+        mock_storage.presign.side_effect = lambda key, expires_in: f"https://s/{key}"
+        resp = client.post("/api/downloader/retrieve/batch", json={"ids": ids})
+        assert resp.status_code == 200
+        assert resp.json() == {
+            "links": {done: "https://s/k/a"},
+            "errors": {
+                missing: "task not found",
+                queued: "task not downloaded",
+                foreign: "task not found",
+            },
+        }
+
+        resp = client.post(
+            "/api/downloader/retrieve/batch?format=m3u", json={"ids": [done]}
+        )
+        assert resp.headers["content-type"].startswith("audio/x-mpegurl")
+        assert resp.text == "#EXTM3U\n#EXTINF:-1,86IxCGKUOzY title\nhttps://s/k/a\n"
+
+        resp = client.post(
+            "/api/downloader/retrieve/batch?format=manifest", json={"ids": [done]}
+        )
+        assert resp.json()["items"] == [
+            {"id": done, "title": "86IxCGKUOzY title", "url": "https://s/k/a"}
+        ]
+
+    ids = [str(uuid.uuid4()) for _ in range(config.RETRIEVE_BATCH_MAX + 1)]
+    resp = client.post("/api/downloader/retrieve/batch", json={"ids": ids})
+    assert resp.status_code == 422
+
+    session.exec(delete(DownloadTask))
+    session.exec(delete(UserUsage).where(UserUsage.user_id == other.id))
+    session.exec(delete(User).where(User.username == "other"))
+    session.commit()
+
+
+def test_export_streams_library(client, session, requester, tmp_path, monkeypatch):
+    local = LocalStorage(str(tmp_path), base_url="http://test", secret="s")
+    monkeypatch.setattr("izuna_ytdl.router.downloader.storage", local)
+    files = {"86IxCGKUOzY": bytes(range(256)) * 100, "aaaaaaaaaaa": b"abc" * 999}
+    for video_id, data in files.items():
+        key = f"public/{video_id}/{video_id}.mp3"
+        with local.put_stream(key) as sink:
+            sink.write(data)
+        item = Item(
+            created_by_username="requester",
+            name=video_id,
+            original_query=video_id,
+            original_url=f"https://youtube.com/watch?v={video_id}",
+            remote_key=key,
+            video_id=video_id,
+        )
+        DownloadTask(
+            created_by=requester,
+            item=item,
+            title="song/title",
+            url=item.original_url,
+            state=DownloadStatusEnum.DONE,
+        ).save(session)
+
+    resp = client.get("/api/downloader/export")
+    assert resp.status_code == 200
+    assert resp.headers["content-type"] == "application/zip"
+    blob = resp.content
+    assert int(resp.headers["content-length"]) == len(blob)
+    with zipfile.ZipFile(io.BytesIO(blob)) as zf:
+        assert sorted(zf.namelist()) == ["song_title (2).mp3", "song_title.mp3"]
+        assert sorted(zf.read(name) for name in zf.namelist()) == sorted(files.values())
+    items = session.exec(select(Item.stored_bytes, Item.crc32)).all()
+    assert all(row.crc32 is not None for row in items)
+    assert sorted(row.stored_bytes for row in items) == sorted(
+        len(data) for data in files.values()
+    )
+
+    etag = resp.headers["etag"]
+    resp = client.get(
+        "/api/downloader/export", headers={"Range": "bytes=100-", "If-Range": etag}
+    )
+    assert resp.status_code == 206
+    assert resp.headers["content-range"] == f"bytes 100-{len(blob) - 1}/{len(blob)}"
+    assert resp.content == blob[100:]
+
+    resp = client.get(
+        "/api/downloader/export", headers={"Range": "bytes=100-", "If-Range": '"x"'}
+    )
+    assert resp.status_code == 200
+    assert resp.content == blob
+
+    resp = client.get(
+        "/api/downloader/export", headers={"Range": f"bytes={len(blob)}-"}
+    )
+    assert resp.status_code == 416
+
+
+def test_tasks_summary_follows_task_writes(client, session, requester):
+    def make_task(video_id, state):
+        item = Item(
+            created_by_username="requester",
+            name=video_id,
+            original_query=video_id,
+            original_url=f"https://youtube.com/watch?v={video_id}",
+            remote_key="",
+            video_id=video_id,
+        )
+        task = DownloadTask(
+            created_by=requester,
+            item=item,
+            title=video_id,
+            url=item.original_url,
+            state=state,
+        )
+        task.save(session)
+        return task
+
+    task = make_task("86IxCGKUOzY", DownloadStatusEnum.QUEUED)
+    make_task("aaaaaaaaaaa", DownloadStatusEnum.ERROR_NOT_FOUND)
+    expected = {"total": 2, "queued": 1, "processing": 0, "done": 0, "error": 1}
+    assert client.get("/api/downloader/tasks/summary").json() == expected
+    assert task_summaries.local.get(str(requester.id)) == expected
+
+    task.state = DownloadStatusEnum.PROCESSING
+    task.save(session)
+    assert task_summaries.local.get(str(requester.id)) is None
+    assert client.get("/api/downloader/tasks/summary").json() == {
+        **expected,
+        "queued": 0,
+        "processing": 1,
+    }
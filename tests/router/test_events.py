@@ -0,0 +1,68 @@
+import datetime
+
+import pytest
+from sqlmodel import delete
+
+from izuna_ytdl import config, events
+from izuna_ytdl.main import app
+from izuna_ytdl.auth import get_login_user
+from izuna_ytdl.models import DownloadTask, User
+
+
+@pytest.fixture(scope="function")
+def listener(client, session, monkeypatch):
+    user = User(username="listener", password_hash="x")
+    session.add(user)
+    session.commit()
+    session.refresh(user)
+    app.dependency_overrides[get_login_user] = lambda: user
+
+    # the live stream never ends, keep only the part sent before it
+    async def event_stream(hub, user_id, queue, backlog, **kwargs):
+        hub.unsubscribe(user_id, queue)
+        for event in backlog:
+            yield events.format_event(
+                event, name="reset" if "reset" in event else "task"
+            )
+
+    monkeypatch.setattr(events, "event_stream", event_stream)
+    monkeypatch.setattr(config, "TASKS_SYNC_OVERLAP_MS", 0)
+    yield user
+    app.dependency_overrides.pop(get_login_user)
+    session.exec(delete(DownloadTask))
+    session.exec(delete(User).where(User.username == "listener"))
+    session.commit()
+
+
+def test_events_resume_from_last_event_id(client, session, listener):
+    old = DownloadTask(
+        created_by=listener,
+        title="old",
+        url="https://youtu.be/a",
+        updated_at=datetime.datetime(2023, 9, 1),
+    )
+    new = DownloadTask(created_by=listener, title="new", url="https://youtu.be/b")
+    session.add_all([old, new])
+    session.commit()
+
+    resp = client.get(
+        "/api/downloader/events",
+        headers={"Last-Event-ID": datetime.datetime(2023, 9, 2).isoformat()},
+    )
+    assert resp.status_code == 200
+    assert resp.headers["content-type"].startswith("text/event-stream")
+    assert resp.text.count("event: task") == 1
+    assert f'"id": "{new.id}"' in resp.text
+    assert events.hub.subscribers == {}
+
+
+def test_events_without_last_event_id(client, listener):
+    resp = client.get("/api/downloader/events")
+    assert resp.status_code == 200
+    assert resp.text == ""
+
+
+def test_events_reset_on_unknown_event_id(client, listener):
+    resp = client.get("/api/downloader/events", headers={"Last-Event-ID": "nope"})
+    assert resp.text.startswith("id: ")
+    assert "event: reset" in resp.text
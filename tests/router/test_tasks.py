@@ -0,0 +1,150 @@
+import datetime
+from unittest.mock import ANY
+
+import pytest
+from sqlmodel import delete
+
+from izuna_ytdl.main import app
+from izuna_ytdl.auth import get_login_user
+from izuna_ytdl import config
+from izuna_ytdl.executor.download import set_task
+from izuna_ytdl.models import DownloadTask, Item, TaskTombstone, User
+from izuna_ytdl.models.download_task import DownloadStatusEnum
+
+
+@pytest.fixture(scope="function")
+def pager(client, session):
+    user = User(username="pager", password_hash="x")
+    session.add(user)
+    session.commit()
+    session.refresh(user)
+    app.dependency_overrides[get_login_user] = lambda: user
+    yield user
+    app.dependency_overrides.pop(get_login_user)
+    session.exec(delete(TaskTombstone))
+    session.exec(delete(DownloadTask))
+    session.exec(delete(Item))
+    session.exec(delete(User).where(User.username == "pager"))
+    session.commit()
+
+
+@pytest.fixture(scope="function")
+def tasks(session, pager):
+    base = datetime.datetime(2023, 9, 1)
+    url = "https://youtube.com/watch?v=86IxCGKUOzY"
+    item = Item(
+        created_by_username=pager.username,
+        name="a.mp3",
+        original_query=url,
+        original_url=url,
+        remote_key="public/86IxCGKUOzY/a.mp3",
+        video_id="86IxCGKUOzY",
+        total_bytes=42,
+    )
+    res = []
+    # two tasks share a created_at so paging has to break the tie on id
+    for i, minute in enumerate([0, 1, 2, 2, 3, 4, 5]):
+        task = DownloadTask(
+            created_by=pager,
+            created_at=base + datetime.timedelta(minutes=minute),
+            title=f"task {i}",
+            url=url,
+            item=item if i == 0 else None,
+        )
+        session.add(task)
+        res.append(task)
+    session.commit()
+    for task in res:
+        session.refresh(task)
+    return sorted(res, key=lambda t: (t.created_at, t.id))
+
+
+def test_tasks_pages_with_cursor(client, tasks):
+    seen = []
+    cursor = None
+    pages = 0
+    while True:
+        params = {"limit": 2}
+        if cursor is not None:
+            params["cursor"] = cursor
+        resp = client.get("/api/downloader/tasks", params=params)
+        assert resp.status_code == 200
+        seen += [t["id"] for t in resp.json()]
+        pages += 1
+        cursor = resp.headers.get("x-next-cursor")
+        if cursor is None:
+            break
+
+    assert pages == 4
+    assert seen == [str(t.id) for t in tasks]
+
+
+def test_tasks_columns(client, tasks):
+    first = client.get("/api/downloader/tasks").json()[0]
+    assert first == {
+        "id": str(tasks[0].id),
+        "url": tasks[0].url,
+        "state": "0",
+        "downloaded_bytes": None,
+        "total_bytes": 42,
+        "title": "task 0",
+    }
+
+
+def test_tasks_invalid_cursor(client, pager):
+    resp = client.get("/api/downloader/tasks", params={"cursor": "nope"})
+    assert resp.status_code == 400
+
+
+@pytest.fixture
+def no_overlap(monkeypatch):
+    monkeypatch.setattr(config, "TASKS_SYNC_OVERLAP_MS", 0)
+
+
+def sync(client, since):
+    resp = client.get("/api/downloader/tasks", params={"since": since})
+    assert resp.status_code == 200
+    return resp.json()
+
+
+def test_tasks_since_returns_changes(client, session, tasks, no_overlap):
+    mark = client.get("/api/downloader/tasks").headers["x-watermark"]
+    assert sync(client, mark) == {"tasks": [], "deleted": [], "watermark": ANY}
+
+    tasks[2].set_state(session, DownloadStatusEnum.PROCESSING)
+    # executor writes go through the table clause instead of the model
+    set_task(session, tasks[4].id, downloaded_bytes=10)
+    changes = sync(client, mark)
+    assert [t["id"] for t in changes["tasks"]] == [str(tasks[2].id), str(tasks[4].id)]
+    assert changes["tasks"][0]["state"] == DownloadStatusEnum.PROCESSING
+    assert changes["tasks"][1]["downloaded_bytes"] == 10
+
+    assert sync(client, changes["watermark"])["tasks"] == []
+
+
+def test_tasks_since_reports_deletions(client, session, tasks, no_overlap):
+    mark = client.get("/api/downloader/tasks").headers["x-watermark"]
+    resp = client.delete(f"/api/downloader/tasks/{tasks[1].id}")
+    assert resp.status_code == 200
+
+    changes = sync(client, mark)
+    assert changes["tasks"] == []
+    assert changes["deleted"] == [str(tasks[1].id)]
+    assert len(client.get("/api/downloader/tasks").json()) == len(tasks) - 1
+
+
+def test_delete_running_task(client, session, tasks):
+    tasks[0].set_state(session, DownloadStatusEnum.PROCESSING)
+    resp = client.delete(f"/api/downloader/tasks/{tasks[0].id}")
+    assert resp.status_code == 409
+
+
+def test_tasks_since_too_many_changes(client, tasks, monkeypatch):
+    monkeypatch.setattr("izuna_ytdl.router.downloader.TASKS_MAX_PAGE_SIZE", 2)
+    resp = client.get("/api/downloader/tasks", params={"since": "2000-01-01"})
+    assert resp.status_code == 410
+
+
+def test_tasks_since_invalid(client, pager):
+    resp = client.get("/api/downloader/tasks", params={"since": "yesterday"})
+    assert resp.status_code == 400
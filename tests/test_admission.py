@@ -0,0 +1,52 @@
+from izuna_ytdl.admission import Admission
+from izuna_ytdl.models import User, UserUsage
+
+
+def usage(session, name, active=0, bytes_stored=0):
+    user = User(username=name, password_hash="x")
+    session.add(user)
+    session.add(
+        UserUsage(user_id=user.id, active_count=active, bytes_stored=bytes_stored)
+    )
+    session.commit()
+    return session.get(UserUsage, user.id)
+
+
+def test_limits_of_zero_admit_everything(session):
+    admission = Admission(max_user_inflight=0, max_user_bytes=0, max_inflight=0)
+    alice = usage(session, "alice", active=100, bytes_stored=10**12)
+    assert admission.check_storage(alice) is None
+    assert admission.check_download(session, alice) is None
+
+
+def test_user_limits(session):
+    admission = Admission(
+        max_user_inflight=2, max_user_bytes=1000, max_inflight=0, retry_after=7
+    )
+    assert admission.check_download(session, usage(session, "a", active=1)) is None
+    rejected = admission.check_download(session, usage(session, "b", active=2))
+    assert rejected.retry_after == 7
+
+    assert admission.check_storage(usage(session, "c", bytes_stored=999)) is None
+    rejected = admission.check_storage(usage(session, "d", bytes_stored=1000))
+    assert rejected.retry_after is None
+
+
+def test_global_depth_is_cached(session):
+    now = [0.0]
+    admission = Admission(
+        max_user_inflight=0,
+        max_user_bytes=0,
+        max_inflight=3,
+        depth_ttl_ms=1000,
+        clock=lambda: now[0],
+    )
+    alice = usage(session, "alice", active=2)
+    assert admission.check_download(session, alice) is None
+
+    usage(session, "bob", active=1)
+    # still the depth read a moment ago
+    assert admission.check_download(session, alice) is None
+    now[0] = 1.5
+    assert admission.depth(session) == 3
+    assert admission.check_download(session, alice).retry_after is not None
@@ -0,0 +1,149 @@
+import asyncio
+import hashlib
+import datetime
+import threading
+
+import pytest
+import sqlalchemy as sa
+from argon2 import PasswordHasher
+from fastapi.testclient import TestClient
+from sqlmodel import delete, Session
+
+from izuna_ytdl import auth
+from izuna_ytdl.caches import load_user
+from izuna_ytdl.database import engine
+from izuna_ytdl.main import app
+from izuna_ytdl.models import User, UserUsage
+
+
+@pytest.fixture(autouse=True)
+def clear_users():
+    auth.users.clear()
+
+
+@pytest.fixture
+def queries():
+    statements = []
+
+    def count(conn, cursor, statement, *args):
+        statements.append(statement)
+
+    sa.event.listen(engine, "before_cursor_execute", count)
+    yield statements
+    sa.event.remove(engine, "before_cursor_execute", count)
+
+
+def login(session, username: str):
+    fingerprint = auth.generate_fingerprint()
+    token = auth.create_access_token(
+        {
+            "sub": username,
+            "user_fingerprint": hashlib.sha256(fingerprint.encode()).hexdigest(),
+        },
+        expires_delta=datetime.timedelta(minutes=1),
+    )
+    return auth.get_login_user(session, token, fingerprint)
+
+
+def test_login_user_is_cached(session, queries):
+    user = User.create(session, username="cached", password_plain="pw")
+    user_id = user.id
+    session.expunge_all()
+    queries.clear()
+
+    assert login(session, "cached").id == user_id
+    assert len(queries) == 1
+    with Session(engine) as other:
+        cached = login(other, "cached")
+        # attached to the request's session like a loaded row
+        assert cached in other
+        assert cached.id == user_id
+        assert len(queries) == 1
+        # the hash is not cached, it is loaded when needed
+        assert cached.is_password_match("pw")
+        assert len(queries) == 2
+    assert auth.users.local.hits == 1
+
+
+def test_password_change_and_delete_forget_user(session):
+    User.create(session, username="cached", password_plain="pw")
+    user = login(session, "cached")
+    user.set_password("new")
+    session.add(user)
+    session.commit()
+    assert "cached" not in auth.users.local._entries
+    with Session(engine) as other:
+        assert login(other, "cached").is_password_match("new")
+
+    session.exec(delete(UserUsage))
+    session.exec(delete(User).where(User.username == "cached"))
+    session.commit()
+    assert len(auth.users.local) == 0
+    with pytest.raises(auth.HTTPException):
+        login(session, "cached")
+
+
+def test_login_user_from_shared_tier(session, queries, monkeypatch):
+    fakeredis = pytest.importorskip("fakeredis")
+    redis = fakeredis.FakeRedis()
+    monkeypatch.setattr(auth.users, "redis", redis)
+    monkeypatch.setattr(auth.users, "shared_hits", 0)
+    user = User.create(session, username="cached", password_plain="pw")
+    user_id = user.id
+    session.expunge_all()
+
+    login(session, "cached")
+    [shared] = [redis.get(key) for key in redis.scan_iter()]
+    assert b"cached" in shared and b"argon2" not in shared
+    assert "password_hash" not in load_user(shared)
+    # as seen by another API process
+    auth.users.local.clear()
+    queries.clear()
+    with Session(engine) as other:
+        cached = login(other, "cached")
+        assert cached.id == user_id
+        assert cached.created_at == user.created_at
+    assert queries == []
+    assert auth.users.stats()["shared"]["hits"] == 1
+
+
+def test_verify_password_mismatch_is_false():
+    password_hash = auth.hash_password("pw")
+    assert auth.verify_password(password_hash, "pw")
+    assert not auth.verify_password(password_hash, "other")
+    assert not auth.verify_password("not a hash", "pw")
+
+
+def test_hashing_pool_refuses_past_its_queue():
+    pool = auth.HashingPool(workers=1, queue=1)
+    release = threading.Event()
+
+    async def main():
+        first = asyncio.ensure_future(pool.run(release.wait))
+        second = asyncio.ensure_future(pool.run(lambda: "queued"))
+        await asyncio.sleep(0)
+        with pytest.raises(auth.HashingBusy):
+            await pool.run(lambda: "refused")
+        release.set()
+        assert await first is True
+        assert await second == "queued"
+        assert await pool.run(lambda: "again") == "again"
+
+    asyncio.run(main())
+
+
+def test_login_rehashes_old_parameters(session):
+    old = PasswordHasher(time_cost=1, memory_cost=1024, parallelism=1)
+    session.add(User(username="legacy", password_hash=old.hash("pw")))
+    session.commit()
+    client = TestClient(app)
+
+    resp = client.post("/api/user/token", data={"username": "legacy", "password": "x"})
+    assert resp.status_code == 401
+
+    resp = client.post("/api/user/token", data={"username": "legacy", "password": "pw"})
+    assert resp.status_code == 200
+    user = User.get_by_username(session, "legacy")
+    session.refresh(user)
+    assert not auth.needs_rehash(user.password_hash)
+    assert auth.verify_password(user.password_hash, "pw")
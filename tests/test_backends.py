@@ -0,0 +1,107 @@
+import json
+from unittest.mock import patch
+
+import pytest
+from botocore.exceptions import ClientError
+
+from izuna_ytdl.backends import (
+    InProcessBackend,
+    ProcessPoolBackend,
+    get_backend,
+    invoke_executor,
+)
+from izuna_ytdl.executor import download as download_mod
+from izuna_ytdl.executor.download import set_task
+from izuna_ytdl.models import User, DownloadTask, Item
+from izuna_ytdl.models.download_task import DownloadStatusEnum
+
+
+@pytest.fixture(scope="function")
+def payload(task):
+    user, item = task.created_by, task.item
+    # built the way router.downloader.download does
+    payload = {
+        "id": "86IxCGKUOzY",
+        "user": json.loads(user.json()),
+        "item": json.loads(item.json()),
+        "task": json.loads(task.json()),
+        "dispatched_at": 0,
+    }
+    payload["task"]["id"] = str(task.id)
+    return payload
+
+
+def test_get_backend():
+    assert isinstance(get_backend("inprocess"), InProcessBackend)
+    with pytest.raises(ValueError):
+        get_backend("nope")
+
+
+def test_inprocess_backend(session, payload, monkeypatch):
+    def run_download(s, job, settings, *, timer, **kwargs):
+        with timer.stage("download"):
+            set_task(s, job.task_id, state=DownloadStatusEnum.DONE)
+        return DownloadStatusEnum.DONE
+
+    monkeypatch.setattr(download_mod, "run_download", run_download)
+    result = InProcessBackend().submit(payload).result()
+
+    assert result["status"] == "ok"
+    assert {"queue_wait", "download", "total"} <= set(result["metrics"])
+    # a redelivered payload does not download again
+    assert InProcessBackend().submit(payload).result()["status"] == "skipped"
+
+
+def test_process_pool_backend(session, payload):
+    task = session.get(DownloadTask, payload["task"]["id"])
+    task.set_state(session, DownloadStatusEnum.DONE)
+
+    backend = ProcessPoolBackend(max_workers=1)
+    try:
+        result = backend.submit(payload).result(timeout=60)
+    finally:
+        backend.shutdown()
+    assert result == {"id": "86IxCGKUOzY", "status": "skipped"}
+
+
+def test_invoke_executor_async_with_throttle(session):
+    user = User(username="invoker", password_hash="x")
+    task = DownloadTask(created_by=user, title="", url="https://youtu.be/a")
+    task.save(session)
+    payload = {"id": "a", "task": {"id": str(task.id)}}
+
+    throttled = ClientError({"Error": {"Code": "TooManyRequestsException"}}, "Invoke")
+    with (
+        patch("izuna_ytdl.backends.lambda_client") as mock_lambda,
+        patch("izuna_ytdl.backends.time.sleep") as mock_sleep,
+    ):
+        mock_lambda.invoke.side_effect = [
+            throttled,
+            {"StatusCode": 202, "ResponseMetadata": {"RequestId": "req-1"}},
+        ]
+        invoke_executor([payload])
+
+        assert mock_lambda.invoke.call_count == 2
+        assert mock_lambda.invoke.call_args.kwargs["InvocationType"] == "Event"
+        mock_sleep.assert_called_once()
+
+    session.refresh(task)
+    assert task.dispatch_id == "req-1"
+
+
+def test_invoke_executor_failure_releases_claim(session, users, request_task):
+    alice, bob = users
+    dispatched, waiting = request_task(alice), request_task(bob)
+    assert Item.claim(session, dispatched.item_id, dispatched.task_id, ttl=60)
+    payload = {"id": "86IxCGKUOzY", "task": {"id": str(dispatched.task_id)}}
+
+    denied = ClientError({"Error": {"Code": "AccessDeniedException"}}, "Invoke")
+    with patch("izuna_ytdl.backends.lambda_client") as mock_lambda:
+        mock_lambda.invoke.side_effect = denied
+        invoke_executor([payload])
+
+    session.expire_all()
+    for res in (dispatched, waiting):
+        task = session.get(DownloadTask, res.task_id)
+        assert task.state == DownloadStatusEnum.ERROR_UNKNOWN
+    assert session.get(Item, dispatched.item_id).download_task_id is None
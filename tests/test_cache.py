@@ -0,0 +1,139 @@
+import time
+from unittest.mock import MagicMock
+
+import pytest
+
+from izuna_ytdl.cache import (
+    InvalidationListener,
+    PresignCache,
+    TieredCache,
+    TTLCache,
+    tiered,
+)
+
+
+class Clock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+def test_entries_expire():
+    clock = Clock()
+    cache = TTLCache(10, 5, clock=clock)
+    cache.set("a", 1)
+    cache.set("b", 2, ttl=20)
+    assert cache.get("a") == 1
+    clock.now = 5
+    assert cache.get("a") is None
+    assert cache.get("b") == 2
+    assert cache.stats() == {
+        "size": 1,
+        "hits": 2,
+        "misses": 1,
+        "expired": 1,
+        "evicted": 0,
+        "hit_ratio": 2 / 3,
+    }
+
+
+def test_least_recently_used_is_evicted():
+    cache = TTLCache(2, 60)
+    cache.set("a", 1)
+    cache.set("b", 2)
+    cache.get("a")
+    cache.set("c", 3)
+    assert cache.get("b") is None
+    assert cache.get("a") == 1
+    assert cache.get("c") == 3
+    assert cache.evicted == 1
+
+
+def test_zero_size_keeps_nothing():
+    cache = TTLCache(0, 60)
+    cache.set("a", 1)
+    assert len(cache) == 0
+    assert cache.get("a", "x") == "x"
+
+
+def test_presign_reused_until_margin():
+    clock = Clock()
+    storage = MagicMock()
+    storage.presign.side_effect = lambda key, expires_in: f"{key}?{clock.now}"
+    presigned = PresignCache(storage, expires_in=600, margin=60, clock=clock)
+
+    assert presigned.presign("k", "alice") == "k?0.0"
+    clock.now = 539
+    assert presigned.presign("k", "alice") == "k?0.0"
+    # the link is never shared between users
+    assert presigned.presign("k", "bob") == "k?539"
+    clock.now = 540
+    assert presigned.presign("k", "alice") == "k?540"
+    storage.presign.assert_called_with("k", expires_in=600)
+    assert storage.presign.call_count == 3
+
+
+@pytest.fixture
+def redis():
+    fakeredis = pytest.importorskip("fakeredis")
+    yield fakeredis.FakeRedis(server=fakeredis.FakeServer())
+    tiered.pop("test", None)
+
+
+def wait_for(condition):
+    deadline = time.monotonic() + 5
+    while not condition():
+        assert time.monotonic() < deadline
+        time.sleep(0.01)
+
+
+def test_tiers_are_shared_and_invalidated(redis):
+    # two API processes sharing one Redis, the registered one listens
+    a = TieredCache("test", TTLCache(10, 60), redis=redis, ttl=60)
+    b = TieredCache("test", TTLCache(10, 60), redis=redis, ttl=60)
+    fetch = MagicMock(return_value={"n": 1})
+
+    assert a.get("k", fetch) == {"n": 1}
+    assert b.get("k", fetch) == {"n": 1}
+    assert b.get("k", fetch) == {"n": 1}
+    assert fetch.call_count == 1
+    assert b.stats()["shared"]["hits"] == 1
+    assert b.stats()["local"]["hits"] == 1
+    assert redis.ttl("izuna_ytdl.cache.test:k") == 60
+
+    listener = InvalidationListener(redis)
+    listener.start()
+    try:
+        wait_for(lambda: redis.pubsub_numsub("izuna_ytdl.cache.invalidate")[0][1])
+        fetch.return_value = {"n": 2}
+        a.forget("k")
+        wait_for(lambda: len(b.local) == 0)
+        assert b.get("k", fetch) == {"n": 2}
+
+        a.clear()
+        wait_for(lambda: len(b.local) == 0)
+        assert redis.keys("izuna_ytdl.cache.test:*") == []
+    finally:
+        listener.stop()
+
+
+def test_missing_values_are_not_cached(redis):
+    cache = TieredCache("test", TTLCache(10, 60), redis=redis, ttl=60)
+    assert cache.get("k", lambda: None) is None
+    assert len(cache.local) == 0
+    assert redis.keys("*") == []
+
+
+def test_redis_errors_fall_back_to_fetch():
+    broken = MagicMock()
+    broken.get.side_effect = ConnectionError("down")
+    broken.set.side_effect = ConnectionError("down")
+    cache = TieredCache("test", TTLCache(10, 60), redis=broken, ttl=60)
+    try:
+        assert cache.get("k", lambda: 1) == 1
+        assert cache.get("k", lambda: 2) == 1
+        assert cache.stats()["shared"]["errors"] == 2
+    finally:
+        tiered.pop("test")
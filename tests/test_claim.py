@@ -0,0 +1,108 @@
+import datetime
+import threading
+
+import pytest
+from sqlmodel import Session
+
+from izuna_ytdl.database import engine
+from izuna_ytdl.executor import download as download_mod
+from izuna_ytdl.executor.claim import claim_item, settle_item
+from izuna_ytdl.executor.download import DownloadJob, ExecutorSettings, execute
+from izuna_ytdl.models import User, DownloadTask, Item, UserUsage
+from izuna_ytdl.models.download_task import DownloadStatusEnum
+
+
+@pytest.fixture(scope="function")
+def tasks(session, users, request_task):
+    """Tasks of three users on one video, the first one downloading it"""
+    carol = User.create(session, username="carol", password_plain="x")
+    return [request_task(user) for user in [*users, carol]]
+
+
+def test_claim_has_one_winner(session, tasks):
+    item_id = tasks[0].item_id
+    won = []
+    start = threading.Barrier(len(tasks))
+
+    def claim(task_id):
+        with Session(engine) as s:
+            start.wait()
+            if Item.claim(s, item_id, task_id, ttl=60):
+                won.append(task_id)
+
+    threads = [threading.Thread(target=claim, args=(t.task_id,)) for t in tasks]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert len(won) == 1
+
+    # not again from a request, but from the executor running the job
+    assert not Item.claim(session, item_id, won[0], ttl=60)
+    assert claim_item(session, item_id, won[0], ttl=60)
+    others = [t.task_id for t in tasks if t.task_id != won[0]]
+    assert not claim_item(session, item_id, others[0], ttl=60)
+
+
+def test_stale_and_downloaded_claims(session, tasks):
+    alice, bob, _ = tasks
+    assert Item.claim(session, alice.item_id, alice.task_id, ttl=60)
+    item = session.get(Item, alice.item_id)
+    item.set(
+        session,
+        download_claimed_at=datetime.datetime.now() - datetime.timedelta(minutes=2),
+    )
+    assert Item.claim(session, bob.item_id, bob.task_id, ttl=60)
+
+    item.set(session, remote_key="public/a.mp3", download_task_id=None)
+    assert not claim_item(session, alice.item_id, alice.task_id)
+
+
+def test_waiters_settle_with_the_download(session, tasks):
+    alice, bob, _ = tasks
+    Item.claim(session, alice.item_id, alice.task_id, ttl=60)
+    settle_item(session, alice.item_id, DownloadStatusEnum.ERROR_DOWNLOAD)
+    session.expire_all()
+    assert {t.state for t in session.get(Item, alice.item_id).tasks} == {
+        DownloadStatusEnum.ERROR_DOWNLOAD
+    }
+    assert session.get(Item, alice.item_id).download_task_id is None
+    bob_id = session.get(DownloadTask, bob.task_id).created_by_id
+    assert session.get(UserUsage, bob_id).active_count == 0
+
+    # a later attempt that succeeds is done for every user
+    session.get(Item, alice.item_id).set(
+        session, total_bytes=1000, remote_key="public/a.mp3"
+    )
+    settle_item(session, alice.item_id, DownloadStatusEnum.DONE, title="a.mp3")
+    session.expire_all()
+    for res in tasks:
+        task = session.get(DownloadTask, res.task_id)
+        assert task.state == DownloadStatusEnum.DONE
+        assert task.title == "a.mp3"
+        usage = session.get(UserUsage, task.created_by_id)
+        assert (usage.active_count, usage.bytes_stored) == (0, 1000)
+
+
+def test_execute_waits_for_the_claiming_task(session, tasks, monkeypatch):
+    alice, bob, _ = tasks
+    ran = []
+
+    def run_download(s, job, settings, **kwargs):
+        ran.append(job.task_id)
+        settle_item(s, job.item_id, DownloadStatusEnum.DONE)
+        return DownloadStatusEnum.DONE
+
+    monkeypatch.setattr(download_mod, "run_download", run_download)
+    Item.claim(session, alice.item_id, alice.task_id, ttl=60)
+
+    def job(res):
+        return DownloadJob("86IxCGKUOzY", res.task_id, res.item_id)
+
+    kwargs = {"warm": object(), "storage": object()}
+    result = execute(session, job(bob), ExecutorSettings(), **kwargs)
+    assert result["status"] == "skipped"
+    assert execute(session, job(alice), ExecutorSettings(), **kwargs)["status"] == "ok"
+    assert ran == [alice.task_id]
+    session.expire_all()
+    assert session.get(DownloadTask, bob.task_id).state == DownloadStatusEnum.DONE
@@ -0,0 +1,44 @@
+import threading
+
+from izuna_ytdl.dispatch import BatchDispatcher
+
+
+def test_flush_on_max_batch():
+    sent = []
+    dispatcher = BatchDispatcher(sent.append, max_batch=3, max_wait_ms=60_000)
+    for i in range(7):
+        dispatcher.submit({"id": i})
+
+    assert [[p["id"] for p in batch] for batch in sent] == [[0, 1, 2], [3, 4, 5]]
+    dispatcher.flush()
+    assert [p["id"] for p in sent[-1]] == [6]
+
+
+def test_flush_after_wait():
+    sent = []
+    done = threading.Event()
+
+    def send(batch):
+        sent.append(batch)
+        done.set()
+
+    dispatcher = BatchDispatcher(send, max_batch=10, max_wait_ms=20)
+    dispatcher.submit({"id": "a"})
+    dispatcher.submit({"id": "b"})
+    assert done.wait(2)
+    assert sent == [[{"id": "a"}, {"id": "b"}]]
+
+
+def test_no_wait_sends_immediately():
+    sent = []
+    dispatcher = BatchDispatcher(sent.append, max_wait_ms=0)
+    dispatcher.submit({"id": "a"})
+    assert sent == [[{"id": "a"}]]
+
+
+def test_send_errors_are_contained():
+    def send(batch):
+        raise RuntimeError("boom")
+
+    dispatcher = BatchDispatcher(send, max_wait_ms=0)
+    dispatcher.submit({"id": "a"})
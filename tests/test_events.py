@@ -0,0 +1,161 @@
+import uuid
+import asyncio
+import datetime
+
+import pytest
+from sqlmodel import Session
+from starlette.concurrency import run_in_threadpool
+
+from izuna_ytdl import config
+from izuna_ytdl.database import engine
+from izuna_ytdl.events import (
+    ProgressCache,
+    ProgressListener,
+    TaskEventHub,
+    event_stream,
+)
+from izuna_ytdl import events
+from izuna_ytdl.executor.bus import MemoryBus
+from izuna_ytdl.executor.download import set_task
+from izuna_ytdl.models import User, DownloadTask
+from izuna_ytdl.models.download_task import DownloadStatusEnum
+
+
+@pytest.fixture(scope="function")
+def tasks(session):
+    res = []
+    for name in ("alice", "bob"):
+        user = User(username=name, password_hash="x")
+        task = DownloadTask(created_by=user, title="", url="https://youtu.be/a")
+        task.save(session)
+        res.append(task)
+    return res
+
+
+def test_hub_sends_changes_to_owner(tasks, monkeypatch):
+    monkeypatch.setattr(config, "TASKS_SYNC_OVERLAP_MS", 0)
+    alice, bob = tasks
+
+    def finish():
+        with Session(engine) as s:
+            set_task(s, alice.id, state=DownloadStatusEnum.DONE)
+
+    async def main():
+        hub = TaskEventHub(interval_ms=10)
+        queue = hub.subscribe(alice.created_by_id)
+        other = hub.subscribe(bob.created_by_id)
+        # changes are sent from the first poll on
+        while hub._since is None:
+            await asyncio.sleep(0.01)
+        assert queue.empty()
+
+        await run_in_threadpool(finish)
+        event = await asyncio.wait_for(queue.get(), 2)
+        assert event["id"] == str(alice.id)
+        assert event["state"] == DownloadStatusEnum.DONE
+        assert other.empty()
+
+        hub.unsubscribe(alice.created_by_id, queue)
+        hub.unsubscribe(bob.created_by_id, other)
+        # the poller stops with the last stream
+        await asyncio.wait_for(hub._task, 2)
+
+    asyncio.run(main())
+
+
+def test_hub_poll_sends_a_change_once(tasks):
+    alice, _ = tasks
+    hub = TaskEventHub()
+    hub.subscribers[alice.created_by_id] = set()
+    # the default overlap makes both polls read the fixture's rows
+    assert [row.id for row in hub.poll()] == [alice.id]
+    assert hub.poll() == []
+
+
+def test_hub_drops_oldest_for_slow_reader():
+    async def main():
+        hub = TaskEventHub(queue_size=2)
+        queue = asyncio.Queue(2)
+        hub.subscribers["u"] = {queue}
+        for i in range(3):
+            hub.publish("u", {"n": i})
+        assert [queue.get_nowait()["n"] for _ in range(2)] == [1, 2]
+
+    asyncio.run(main())
+
+
+def test_event_stream():
+    event = {"id": "t", "updated_at": datetime.datetime(2023, 9, 1).isoformat()}
+
+    async def main():
+        hub = TaskEventHub()
+        queue = asyncio.Queue()
+        hub.subscribers["u"] = {queue}
+        stream = event_stream(hub, "u", queue, [event], heartbeat=0.01)
+
+        assert (await anext(stream)).startswith("retry: ")
+        assert await anext(stream) == (
+            "id: 2023-09-01T00:00:00\nevent: task\n"
+            'data: {"id": "t", "updated_at": "2023-09-01T00:00:00"}\n\n'
+        )
+        assert await anext(stream) == ": ping\n\n"
+        queue.put_nowait(event)
+        assert (await anext(stream)).startswith("id: 2023-09-01T00:00:00\n")
+
+        await stream.aclose()
+        assert hub.subscribers == {}
+
+    asyncio.run(main())
+
+
+def progress(task_id, user_id="00000000-0000-0000-0000-000000000001", n=1):
+    return {
+        "task_id": task_id,
+        "user_id": user_id,
+        "state": DownloadStatusEnum.PROCESSING,
+        "downloaded_bytes": n,
+        "total_bytes": 100,
+        "at": "2023-09-01T00:00:00",
+    }
+
+
+def test_progress_cache():
+    cache = ProgressCache(size=2)
+    for task_id in ("a", "b", "c"):
+        cache.update(progress(task_id))
+    assert cache.get("a") is None
+
+    out = {"id": "c", "state": DownloadStatusEnum.PROCESSING, "downloaded_bytes": 0}
+    assert cache.apply(out)["downloaded_bytes"] == 1
+    done = {"id": "c", "state": DownloadStatusEnum.DONE, "downloaded_bytes": 100}
+    assert cache.apply(done)["downloaded_bytes"] == 100
+
+
+def test_listener_feeds_cache_and_streams(monkeypatch):
+    monkeypatch.setattr(events, "progress", ProgressCache())
+    user_id = uuid.UUID(int=1)
+    bus = MemoryBus()
+
+    async def main():
+        hub = TaskEventHub()
+        monkeypatch.setattr(events, "hub", hub)
+        hub._task = asyncio.get_running_loop().create_future()
+        queue = hub.subscribe(user_id)
+
+        listener = ProgressListener(bus)
+        listener.start()
+        while not bus._callbacks:
+            await asyncio.sleep(0.01)
+        bus.publish(progress("t", str(user_id), n=42))
+        # another user's progress is not sent
+        bus.publish(progress("u", str(uuid.UUID(int=2))))
+        listener.stop()
+
+        event = await asyncio.wait_for(queue.get(), 2)
+        assert event["id"] == "t"
+        assert event["downloaded_bytes"] == 42
+        assert queue.empty()
+
+    asyncio.run(main())
+    assert events.progress.get("t")["downloaded_bytes"] == 42
+    assert events.progress.get("u") is not None
@@ -1,5 +1,6 @@
 from fastapi.testclient import TestClient
 
+from izuna_ytdl import config
 from izuna_ytdl.main import app
 
 client = TestClient(app)
@@ -9,3 +10,12 @@ def test_read_main():
     resp = client.get("/")
     assert resp.status_code == 200
     assert resp.json() == "running"
+
+
+def test_stats_needs_master_token():
+    assert client.get("/stats", headers={"X-Master-Token": "nope"}).status_code == 403
+    resp = client.get("/stats", headers={"X-Master-Token": config.MASTER_TOKEN})
+    assert resp.status_code == 200
+    assert set(resp.json()) == {"user", "task_summary", "presign"}
+    assert "hit_ratio" in resp.json()["user"]["local"]
+    assert "hit_ratio" in resp.json()["user"]["shared"]
@@ -0,0 +1,83 @@
+import threading
+
+from sqlalchemy.dialects import postgresql
+from sqlmodel import func, select, Session
+
+from izuna_ytdl.database import engine
+from izuna_ytdl.models import User, DownloadTask, Item, UserUsage
+from izuna_ytdl.models.download_task import DownloadStatusEnum, _request_statements
+
+
+def test_request_creates_item_and_task(session, users, request_task):
+    alice, bob = users
+    res = request_task(alice)
+    assert res.item_created and res.task_created
+    assert res.state == DownloadStatusEnum.QUEUED
+    task = session.get(DownloadTask, res.task_id)
+    assert task.item.video_id == "86IxCGKUOzY"
+    assert task.item.created_by_username == "alice"
+
+    again = request_task(alice)
+    assert not again.item_created and not again.task_created
+    assert again.task_id == res.task_id
+
+    # another user gets a task on the same item, waiting for its download
+    other = request_task(bob)
+    assert not other.item_created and other.task_created
+    assert other.item_id == res.item_id
+    assert other.state == DownloadStatusEnum.QUEUED
+
+    # and a done one once it is downloaded
+    session.get(Item, res.item_id).set(session, remote_key="public/a.mp3")
+    carol = User(username="carol", password_hash="x")
+    session.add(carol)
+    session.commit()
+    assert request_task(carol).state == DownloadStatusEnum.DONE
+
+
+def test_request_quota(session, users, request_task):
+    alice, _ = users
+    request_task(alice, "a")
+    request_task(alice, "b")
+    res = request_task(alice, "c", limit=1)
+    assert res.over_quota(1)
+    assert res.task_id is None
+    assert session.exec(select(Item).where(Item.video_id == "c")).first() is None
+    # an existing task is over quota as well, like the count(*) check was
+    assert request_task(alice, "a", limit=1).over_quota(1)
+    assert not request_task(alice, "a", limit=2).over_quota(2)
+
+
+def test_concurrent_requests_create_one_task(session, users, request_task):
+    alice, _ = users
+    results = []
+    start = threading.Barrier(8)
+
+    def post():
+        with Session(engine) as s:
+            start.wait()
+            results.append(request_task(alice, session=s))
+
+    threads = [threading.Thread(target=post) for _ in range(8)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    assert sum(r.task_created for r in results) == 1
+    assert len({r.task_id for r in results}) == 1
+    assert session.scalar(select(func.count()).select_from(DownloadTask)) == 1
+    assert session.scalar(select(func.count()).select_from(Item)) == 1
+    assert UserUsage.get(session, alice.id).task_count == 1
+
+
+def test_postgresql_single_statement():
+    stmt = _request_statements("postgresql").postgresql_text
+    sql = str(stmt.compile(dialect=postgresql.dialect()))
+    assert sql.startswith("WITH ")
+    assert "new_item AS" in sql and "new_task AS" in sql
+    # item, task and the owner's counters
+    assert sql.count("INSERT INTO") == 3
+    assert sql.count("ON CONFLICT") == 3
+    # compiled once, cached by SQLAlchemy like any other statement
+    assert stmt._generate_cache_key() is not None
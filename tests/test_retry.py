@@ -0,0 +1,50 @@
+from unittest.mock import MagicMock
+
+from izuna_ytdl.executor.retry import retry_jobs
+from izuna_ytdl.models import DownloadTask, Item
+from izuna_ytdl.models.download_task import DownloadStatusEnum
+
+
+def job(video_id, res, **values) -> dict:
+    return {"id": video_id, "task": {"id": str(res.task_id)}, **values}
+
+
+def test_retry_jobs_of_batch(session, users, request_task):
+    alice, bob = users
+    fresh = request_task(alice, video_id="a")
+    spent = request_task(bob, video_id="b")
+    done = request_task(bob, video_id="c")
+    assert Item.claim(session, spent.item_id, spent.task_id, ttl=60)
+    # jobs of a {"jobs": [...]} event and what run_job returned for them
+    jobs = [job("a", fresh), job("b", spent, attempt=3), job("c", done)]
+    results = [
+        {"id": "a", "status": "retry"},
+        {"id": "b", "status": "retry"},
+        {"id": "c", "status": "ok"},
+    ]
+
+    invoke = MagicMock()
+    sent = retry_jobs(session, jobs, results, invoke=invoke, max_attempts=3)
+
+    assert sent == [{**jobs[0], "attempt": 2}]
+    invoke.assert_called_once_with(sent)
+    session.expire_all()
+    task = session.get(DownloadTask, spent.task_id)
+    assert task.state == DownloadStatusEnum.ERROR_UNKNOWN
+    assert session.get(Item, spent.item_id).download_task_id is None
+    task = session.get(DownloadTask, fresh.task_id)
+    assert task.state == DownloadStatusEnum.QUEUED
+
+
+def test_retry_jobs_not_sent_are_abandoned(session, users, request_task):
+    res = request_task(users[0])
+    invoke = MagicMock(side_effect=RuntimeError("throttled"))
+
+    sent = retry_jobs(
+        session, [job("86IxCGKUOzY", res)], [{"status": "retry"}], invoke=invoke
+    )
+
+    assert sent == []
+    session.expire_all()
+    task = session.get(DownloadTask, res.task_id)
+    assert task.state == DownloadStatusEnum.ERROR_UNKNOWN
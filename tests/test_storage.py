@@ -0,0 +1,75 @@
+import pytest
+from fastapi.testclient import TestClient
+
+from izuna_ytdl.main import app
+from izuna_ytdl.storage import LocalStorage, parse_range
+
+KEY = "public/86IxCGKUOzY/a b.mp3"
+DATA = bytes(range(256)) * 4
+
+
+@pytest.mark.parametrize(
+    "header,expected",
+    [
+        (None, None),
+        ("bytes=0-9", (0, 9)),
+        ("bytes=10-", (10, 1023)),
+        ("bytes=-24", (1000, 1023)),
+        ("bytes=-5000", (0, 1023)),
+        ("bytes=1000-5000", (1000, 1023)),
+        ("bytes=0-1,5-9", None),
+        ("items=0-1", None),
+    ],
+)
+def test_parse_range(header, expected):
+    assert parse_range(header, 1024) == expected
+
+
+@pytest.mark.parametrize("header", ["bytes=1024-", "bytes=-0", "bytes=9-5"])
+def test_parse_range_unsatisfiable(header):
+    with pytest.raises(ValueError):
+        parse_range(header, 1024)
+
+
+@pytest.fixture
+def storage(tmp_path, monkeypatch):
+    storage = LocalStorage(
+        str(tmp_path), base_url="http://testserver/api/downloader/files", secret="s"
+    )
+    with storage.put_stream(KEY) as sink:
+        sink.write(DATA)
+    monkeypatch.setattr("izuna_ytdl.router.downloader.storage", storage)
+    return storage
+
+
+@pytest.fixture
+def client():
+    return TestClient(app)
+
+
+def test_serve_whole_file(client, storage):
+    resp = client.get(storage.presign(KEY))
+    assert resp.status_code == 200
+    assert resp.content == DATA
+    assert resp.headers["accept-ranges"] == "bytes"
+    assert resp.headers["content-type"] == "audio/mpeg"
+
+
+def test_serve_range(client, storage):
+    resp = client.get(storage.presign(KEY), headers={"Range": "bytes=100-199"})
+    assert resp.status_code == 206
+    assert resp.content == DATA[100:200]
+    assert resp.headers["content-range"] == "bytes 100-199/1024"
+    assert resp.headers["content-length"] == "100"
+
+
+def test_serve_range_not_satisfiable(client, storage):
+    resp = client.get(storage.presign(KEY), headers={"Range": "bytes=2000-"})
+    assert resp.status_code == 416
+    assert resp.headers["content-range"] == "bytes */1024"
+
+
+def test_serve_rejects_bad_signature(client, storage):
+    url = storage.presign(KEY).replace("sig=", "sig=0")
+    assert client.get(url).status_code == 403
+    assert client.get(storage.presign("public/missing.mp3")).status_code == 404
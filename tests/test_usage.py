@@ -0,0 +1,74 @@
+from sqlmodel import delete
+
+from izuna_ytdl.executor.download import set_task
+from izuna_ytdl.models import DownloadTask, Item, UserUsage
+from izuna_ytdl.models.download_task import DownloadStatusEnum
+
+
+def counters(session, user):
+    session.expire_all()
+    usage = UserUsage.get(session, user.id)
+    return usage.task_count, usage.active_count, usage.bytes_stored
+
+
+def test_create_starts_at_zero(session, users):
+    alice, _ = users
+    assert session.get(UserUsage, alice.id) is not None
+    assert counters(session, alice) == (0, 0, 0)
+
+
+def test_counters_follow_task_writes(session, users, request_task):
+    alice, bob = users
+    res = request_task(alice)
+    assert counters(session, alice) == (1, 1, 0)
+
+    set_task(session, res.task_id, state=DownloadStatusEnum.PROCESSING)
+    assert counters(session, alice) == (1, 1, 0)
+    session.get(Item, res.item_id).set(
+        session, total_bytes=1000, remote_key="public/a.mp3"
+    )
+    set_task(session, res.task_id, state=DownloadStatusEnum.DONE)
+    assert counters(session, alice) == (1, 0, 1000)
+
+    # attached done to the downloaded item
+    other = request_task(bob)
+    assert counters(session, bob) == (1, 0, 1000)
+
+    task = session.get(DownloadTask, other.task_id)
+    task.set_state(session, DownloadStatusEnum.QUEUED)
+    assert counters(session, bob) == (1, 1, 0)
+    task.delete(session)
+    assert counters(session, bob) == (0, 0, 0)
+    assert counters(session, alice) == (1, 0, 1000)
+
+
+def test_saved_task_is_counted(session, users, make_task):
+    alice, _ = users
+    make_task(alice)
+    assert counters(session, alice) == (1, 1, 0)
+
+
+def test_missing_row_is_counted_from_tasks(session, users, request_task):
+    alice, _ = users
+    request_task(alice, "a")
+    session.exec(delete(UserUsage))
+    session.commit()
+    request_task(alice, "b")
+    assert counters(session, alice) == (2, 2, 0)
+
+
+def test_reconcile_fixes_drift(session, users, request_task):
+    alice, bob = users
+    request_task(alice, "a")
+    request_task(alice, "b")
+    usage = session.get(UserUsage, alice.id)
+    usage.task_count, usage.active_count = 7, 0
+    session.commit()
+    session.exec(delete(UserUsage).where(UserUsage.user_id == bob.id))
+    session.commit()
+
+    assert UserUsage.reconcile(session, batch=1) == 1
+    assert counters(session, alice) == (2, 2, 0)
+    assert counters(session, bob) == (0, 0, 0)
+    assert session.get(UserUsage, bob.id) is not None
+    assert UserUsage.reconcile(session) == 0
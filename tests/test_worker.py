@@ -0,0 +1,151 @@
+import datetime
+
+import pytest
+
+from izuna_ytdl import worker as worker_mod
+from izuna_ytdl.executor import download as download_mod
+from izuna_ytdl.executor.download import ExecutorSettings, set_task
+from izuna_ytdl.models import DownloadTask, Item, Job
+from izuna_ytdl.models.download_task import DownloadStatusEnum
+from izuna_ytdl.models.job import JobStateEnum
+
+
+def test_enqueue_is_idempotent(session, task):
+    job = Job.enqueue(session, task)
+    assert job.video_id == "86IxCGKUOzY"
+    assert Job.enqueue(session, task).id == job.id
+
+
+def test_lease_hands_out_job_once(session, task):
+    Job.enqueue(session, task)
+    (job,) = Job.lease(session, "a")
+    assert job.state == JobStateEnum.LEASED
+    assert job.leased_by == "a"
+    assert job.attempts == 1
+    assert Job.lease(session, "b") == []
+
+
+def test_expired_lease_is_reclaimed(session, task):
+    Job.enqueue(session, task)
+    (job,) = Job.lease(session, "a", lease_seconds=-1)
+    (again,) = Job.lease(session, "b")
+    assert again.id == job.id
+    assert again.leased_by == "b"
+    assert again.attempts == 2
+
+
+def test_expired_last_attempt_fails(session, task):
+    Job.enqueue(session, task, max_attempts=2)
+    Job.lease(session, "a", lease_seconds=-1)
+    Job.lease(session, "b", lease_seconds=-1)
+    assert Job.lease(session, "c") == []
+    (job,) = Job.fail_expired(session)
+    assert job.state == JobStateEnum.FAILED
+    assert job.attempts == 2
+    assert Job.fail_expired(session) == []
+
+
+def test_worker_settles_item_of_expired_last_attempt(session, users, request_task):
+    alice, bob = users
+    downloading, waiting = request_task(alice), request_task(bob)
+    assert Item.claim(session, downloading.item_id, downloading.task_id, ttl=60)
+    task = session.get(DownloadTask, downloading.task_id)
+    Job.enqueue(session, task, max_attempts=1)
+    Job.lease(session, "dead", lease_seconds=-1)
+
+    w = worker_mod.Worker(ExecutorSettings(), worker_id="w", storage=object())
+    w.fail_expired()
+
+    session.expire_all()
+    for res in (downloading, waiting):
+        task = session.get(DownloadTask, res.task_id)
+        assert task.state == DownloadStatusEnum.ERROR_UNKNOWN
+    item = session.get(Item, downloading.item_id)
+    assert item.download_task_id is None
+
+
+def test_lost_lease_cannot_ack_or_fail(session, task):
+    Job.enqueue(session, task)
+    (stale,) = Job.lease(session, "a", lease_seconds=-1)
+    session.expunge(stale)
+    (job,) = Job.lease(session, "b")
+    assert not stale.fail(session, "late", backoff_seconds=0)
+    assert not stale.ack(session)
+    session.refresh(job)
+    assert job.state == JobStateEnum.LEASED
+    assert job.leased_by == "b"
+    assert job.ack(session)
+    assert job.state == JobStateEnum.DONE
+
+
+def test_heartbeat_only_extends_own_lease(session, task):
+    Job.enqueue(session, task)
+    (job,) = Job.lease(session, "a", lease_seconds=1)
+    assert Job.heartbeat(session, [job.id], "b", lease_seconds=600) == 0
+    assert Job.heartbeat(session, [job.id], "a", lease_seconds=600) == 1
+    session.refresh(job)
+    assert job.lease_expires_at > datetime.datetime.now() + datetime.timedelta(
+        seconds=500
+    )
+
+
+def test_fail_retries_until_max_attempts(session, task):
+    Job.enqueue(session, task, max_attempts=2)
+    (job,) = Job.lease(session, "a")
+    assert job.fail(session, "boom", backoff_seconds=0)
+    assert job.state == JobStateEnum.QUEUED
+    (job,) = Job.lease(session, "a")
+    assert job.fail(session, "boom", backoff_seconds=0)
+    assert job.state == JobStateEnum.FAILED
+    assert job.last_error == "boom"
+    assert Job.lease(session, "a") == []
+
+
+def test_fail_backs_off(session, task):
+    Job.enqueue(session, task)
+    (job,) = Job.lease(session, "a")
+    job.fail(session, "boom", backoff_seconds=60)
+    assert Job.lease(session, "a") == []
+
+
+@pytest.mark.parametrize(
+    "state,outcome,job_state,task_state",
+    [
+        (DownloadStatusEnum.DONE, "ok", JobStateEnum.DONE, DownloadStatusEnum.DONE),
+        (
+            DownloadStatusEnum.ERROR_DOWNLOAD,
+            "retry",
+            JobStateEnum.QUEUED,
+            DownloadStatusEnum.QUEUED,
+        ),
+        (
+            DownloadStatusEnum.ERROR_NOT_FOUND,
+            "failed",
+            JobStateEnum.FAILED,
+            DownloadStatusEnum.ERROR_NOT_FOUND,
+        ),
+    ],
+)
+def test_worker_process(
+    session, task, monkeypatch, state, outcome, job_state, task_state
+):
+    def run_download(s, job, settings, **kwargs):
+        assert job.task_id == task.id
+        assert job.video_id == "86IxCGKUOzY"
+        set_task(s, job.task_id, state=state)
+        return state
+
+    monkeypatch.setattr(download_mod, "run_download", run_download)
+    Job.enqueue(session, task)
+    (job,) = Job.lease(session, "w")
+    # the worker hands jobs leased in one session to another thread
+    session.expunge(job)
+    job_id = job.id
+
+    w = worker_mod.Worker(ExecutorSettings(), worker_id="w", storage=object())
+    assert w.process(job) == outcome
+
+    job = session.get(Job, job_id)
+    session.refresh(task)
+    assert job.state == job_state
+    assert task.state == task_state
@@ -0,0 +1,95 @@
+import io
+import zlib
+import random
+import zipfile
+import datetime
+
+import pytest
+
+from izuna_ytdl.executor.storage import StorageError
+from izuna_ytdl.zipstream import ZipEntry, ZipStream
+
+FILES = {
+    "a": bytes(range(256)) * 300,
+    "b": b"",
+    "c": random.Random(0).randbytes(100000),
+}
+
+
+def read(entry, start, end):
+    data = FILES[entry.key][start : end + 1]
+    for i in range(0, len(data), 4096):
+        yield data[i : i + 4096]
+
+
+def make_entries():
+    return [
+        ZipEntry(
+            name=f"{key} 生きる.mp3",
+            key=key,
+            size=len(data),
+            modified=datetime.datetime(2024, 5, 6, 7, 8, 10),
+        )
+        for key, data in FILES.items()
+    ]
+
+
+def test_archive_is_readable():
+    computed = []
+    archive = ZipStream(make_entries(), read, on_crc=computed.append)
+    blob = b"".join(archive)
+    assert len(blob) == archive.size
+
+    with zipfile.ZipFile(io.BytesIO(blob)) as zf:
+        assert zf.testzip() is None
+        for key, data in FILES.items():
+            info = zf.getinfo(f"{key} 生きる.mp3")
+            assert info.compress_type == zipfile.ZIP_STORED
+            assert info.date_time == (2024, 5, 6, 7, 8, 10)
+            assert zf.read(info) == data
+    assert {entry.key: entry.crc32 for entry in computed} == {
+        "a": zlib.crc32(FILES["a"]),
+        "c": zlib.crc32(FILES["c"]),
+    }
+
+
+def test_any_range_matches_the_whole_archive():
+    blob = b"".join(ZipStream(make_entries(), read))
+    rng = random.Random(1)
+    for _ in range(100):
+        start = rng.randrange(len(blob))
+        end = rng.randrange(start, len(blob))
+        # a fresh stream knows no CRCs and reads the ones the range needs
+        archive = ZipStream(make_entries(), read)
+        assert b"".join(archive.iter_range(start, end)) == blob[start : end + 1]
+
+
+def test_known_crcs_are_not_read_again():
+    entries = make_entries()
+    blob = b"".join(ZipStream(entries, read))
+    reads = []
+
+    def counting_read(entry, start, end):
+        reads.append((entry.key, start, end))
+        return read(entry, start, end)
+
+    archive = ZipStream(entries, counting_read)
+    assert b"".join(archive.iter_range(archive.cd_offset, archive.size - 1)) == (
+        blob[archive.cd_offset :]
+    )
+    assert reads == []
+
+
+def test_layout_only_depends_on_entries():
+    archive = ZipStream(make_entries(), read)
+    assert archive.etag == ZipStream(make_entries(), read).etag
+    entries = make_entries()
+    entries[0].name = "renamed.mp3"
+    assert ZipStream(entries, read).etag != archive.etag
+
+
+def test_short_object_fails():
+    entries = make_entries()
+    entries[0].size += 1
+    with pytest.raises(StorageError):
+        b"".join(ZipStream(entries, read))